@@ -1,7 +1,10 @@
 from django.contrib import admin
+from django.utils.translation import ugettext_lazy as _
 from quiz.models import (
-    Question, Answer, Quiz, QuizResult
+    Question, Answer, Quiz, QuizResult, ArchivedResult, QuizSubmission,
+    QuizAttempt, QuestionStats, AnswerStats
 )
+from quiz.stats import stats_select
 
 
 class AnswerInline(admin.TabularInline):
@@ -18,29 +21,62 @@ class QuestionAdmin(admin.ModelAdmin):
     readonly_fields = ('creator', 'editor', 'datetime_created', 'datetime_modified')
     inlines = [AnswerInline]
     list_display = ['question', 'difficulty', 'creator', 'datetime_created',
-                    'is_active']
+                    'is_active', 'times_answered', 'percent_correct']
     list_editable = ['is_active', 'difficulty']
     date_hierarchy = "datetime_created"
     search_fields = ('question',)
     list_filter = ('is_active', 'creator',)
 
+    def queryset(self, request):
+        # Read the denormalised counters in the changelist query itself.
+        return super(QuestionAdmin, self).queryset(request).extra(
+            select=stats_select(Question, QuestionStats,
+                                ['times_answered', 'times_correct'])
+        )
+
+    def times_answered(self, obj):
+        return obj.times_answered or 0
+    times_answered.short_description = _('times answered')
+
+    def percent_correct(self, obj):
+        stats = QuestionStats(times_answered=obj.times_answered or 0,
+                              times_correct=obj.times_correct or 0)
+        if stats.percent_correct is None:
+            return ''
+        return '%.0f%%' % stats.percent_correct
+    percent_correct.short_description = _('correct')
+
 
 class AnswerAdmin(admin.ModelAdmin):
     raw_id_fields = ['creator']
     readonly_fields = ('creator', 'editor', 'datetime_created', 'datetime_modified')
-    list_display = ['answer', 'creator', 'datetime_created', 'is_active']
+    list_display = ['answer', 'creator', 'datetime_created', 'is_active',
+                    'times_chosen']
     list_editable = ['is_active']
     date_hierarchy = "datetime_created"
     search_fields = ('answer',)
     list_filter = ('is_active', 'creator',)
 
+    def queryset(self, request):
+        # Read the denormalised counter in the changelist query itself.
+        return super(AnswerAdmin, self).queryset(request).extra(
+            select=stats_select(Answer, AnswerStats, ['times_chosen'])
+        )
+
+    def times_chosen(self, obj):
+        return obj.times_chosen or 0
+    times_chosen.short_description = _('times chosen')
+
 
 class QuizAdmin(admin.ModelAdmin):
     raw_id_fields = ['creator']
-    readonly_fields = ('creator', 'editor', 'datetime_created', 'datetime_modified')
+    readonly_fields = ('maximum_score', 'maximum_scores', 'answer_key_digest',
+                       'creator', 'editor', 'datetime_created',
+                       'datetime_modified')
     prepopulated_fields = {"slug": ("name",)}
     filter_horizontal = ['questions']
-    list_display = ['name', 'creator', 'datetime_created', 'status']
+    list_display = ['name', 'creator', 'datetime_created', 'status',
+                    'maximum_score']
     list_editable = ['status']
     date_hierarchy = "datetime_created"
     search_fields = ('name',)
@@ -54,14 +90,15 @@ class QuizResultAdmin(admin.ModelAdmin):
             'fields': ('quiz', 'user', 'email', ('score', 'maximum_score')),
         }),
         ('Answers Provided', {
-            'fields': ('answers',),
+            'fields': ('answers', 'packed_answer_ids'),
             'classes': ('collapse',)
         }),
         ('Metadata', {
             'fields': ('creator', 'editor', 'datetime_created', 'datetime_modified')
         }),
     )
-    readonly_fields = ('creator', 'editor', 'datetime_created', 'datetime_modified')
+    readonly_fields = ('packed_answer_ids', 'creator', 'editor',
+                       'datetime_created', 'datetime_modified')
     date_hierarchy = "datetime_created"
     filter_vertical = ['answers']
     list_display = ['user', 'email', 'datetime_created', 'score', 'maximum_score']
@@ -70,9 +107,54 @@ class QuizResultAdmin(admin.ModelAdmin):
     search_fields = ('user__first_name', 'user__last_name', 'user__email', 'email')
     list_filter = ('datetime_created',)
 
+    def get_readonly_fields(self, request, obj=None):
+        # Editing the answers table would leave packed answers out of date.
+        if obj is not None and obj.packed_answers is not None:
+            return self.readonly_fields + ('answers',)
+        return self.readonly_fields
+
+    def packed_answer_ids(self, obj):
+        if obj.packed_answers is None:
+            return ''
+        return ', '.join([str(pk) for pk in obj.get_answer_ids()])
+    packed_answer_ids.short_description = _('packed answers')
+
+
+class ArchivedResultAdmin(admin.ModelAdmin):
+    raw_id_fields = ['user']
+    readonly_fields = ('id', 'quiz', 'score', 'maximum_score', 'answers',
+                       'datetime_created', 'datetime_modified',
+                       'datetime_archived')
+    list_display = ['id', 'quiz', 'user', 'email', 'datetime_created',
+                    'score', 'maximum_score']
+    search_fields = ('user__first_name', 'user__last_name', 'user__email', 'email')
+    list_filter = ('quiz',)
+
+
+class QuizSubmissionAdmin(admin.ModelAdmin):
+    raw_id_fields = ['user', 'result']
+    readonly_fields = ('datetime_created', 'datetime_modified')
+    date_hierarchy = "datetime_created"
+    list_display = ['quiz', 'user', 'email', 'datetime_created', 'status',
+                    'result']
+    search_fields = ('user__first_name', 'user__last_name', 'user__email', 'email')
+    list_filter = ('status',)
+
+
+class QuizAttemptAdmin(admin.ModelAdmin):
+    raw_id_fields = ['user', 'result']
+    readonly_fields = ('token', 'datetime_created', 'datetime_modified')
+    date_hierarchy = "datetime_created"
+    list_display = ['quiz', 'user', 'email', 'datetime_modified',
+                    'current_step', 'status', 'result']
+    search_fields = ('user__first_name', 'user__last_name', 'user__email', 'email')
+    list_filter = ('status',)
+
 
 admin.site.register(Question, QuestionAdmin)
 admin.site.register(Answer, AnswerAdmin)
 admin.site.register(Quiz, QuizAdmin)
 admin.site.register(QuizResult, QuizResultAdmin)
-
+admin.site.register(ArchivedResult, ArchivedResultAdmin)
+admin.site.register(QuizSubmission, QuizSubmissionAdmin)
+admin.site.register(QuizAttempt, QuizAttemptAdmin)
@@ -0,0 +1,247 @@
+"""A JSON API for taking quizzes without the server-rendered wizard.
+
+``GET _/api/<slug>/`` returns the quiz paper: its questions and their answer
+choices grouped by difficulty level, without scores. It is served from the
+quiz's ``CompiledQuiz`` with an ``ETag`` of its revision and a
+``Last-Modified`` of its latest change, so clients can cache it and
+revalidate it for a 304. Only the ``ETag`` notices a question being removed
+from the quiz, so clients should prefer it.
+
+``POST _/api/<slug>/submit/`` takes the whole submission as a JSON object::
+
+    {"answers": [3, 4, 9, ...], "email": "someone@example.com"}
+
+with one answer id per question (``email`` is only needed from anonymous
+takers who haven't given one to ``capture_email``), and returns the score.
+Submissions must be sent as ``application/json``, which cross-site forms
+can't do, so the view is exempt from CSRF checks for the benefit of clients
+without a session.
+
+If the quiz asks each taker a random sample of its questions, or shuffles
+their answers, every paper fetched without a ``paper`` parameter is drawn
+afresh and carries a signed ``paper`` token identifying it. The same paper
+can be fetched (and revalidated) again with ``?paper=<token>``. For sampled
+quizzes the token must be sent back with the submission, which is checked
+and scored against that sample.
+"""
+import hmac
+
+from django.conf import settings
+from django.core.urlresolvers import reverse
+from django.http import (
+    HttpResponse, HttpResponseBadRequest, HttpResponseNotAllowed, Http404
+)
+from django.utils import simplejson
+from django.utils.hashcompat import sha_constructor
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition
+
+from quiz.compiled import get_compiled_quiz, new_seed, shuffle_choices
+from quiz.forms import EmailForm
+from quiz.models import Quiz, QuizResult
+from quiz.submissions import Submission, get_submission_queue
+from quiz.utils import get_display_name
+from quiz.wizard import _constant_time_compare
+
+JSON_TYPE = 'application/json'
+
+
+def json_response(data, status=200):
+    return HttpResponse(simplejson.dumps(data), mimetype=JSON_TYPE,
+                        status=status)
+
+def json_error(errors, status=400):
+    return json_response({'errors': errors}, status)
+
+
+def get_live_quiz(slug):
+    """Returns the ``CompiledQuiz`` for a quiz which can be taken, or raises
+    ``Http404``."""
+    try:
+        quiz = get_compiled_quiz(slug)
+    except Quiz.DoesNotExist:
+        raise Http404
+    if quiz.status == Quiz.CLOSED:
+        raise Http404
+    return quiz
+
+def sign_paper(quiz, seed):
+    """Returns the token for the sample of a quiz picked by ``seed``."""
+    signature = hmac.new(settings.SECRET_KEY + 'quiz:paper',
+                         '%s|%s' % (quiz.pk, seed), sha_constructor)
+    return '%s-%s' % (seed, signature.hexdigest())
+
+def unsign_paper(quiz, token):
+    """Returns the seed of a paper token, or ``None`` if it isn't valid for
+    the quiz."""
+    try:
+        seed = int(str(token).split('-', 1)[0])
+    except (ValueError, UnicodeEncodeError):
+        return None
+    if not _constant_time_compare(str(token), sign_paper(quiz, seed)):
+        return None
+    return seed
+
+def quiz_etag(request, slug, *args, **kwargs):
+    try:
+        quiz = get_live_quiz(slug)
+    except Http404:
+        return None
+    if not quiz.is_seeded:
+        return quiz.version
+    # A new paper each time, unless a particular one has been asked for:
+    seed = unsign_paper(quiz, request.GET.get('paper'))
+    if seed is not None:
+        return '%s-%s' % (quiz.version, seed)
+
+def quiz_last_modified(request, slug, *args, **kwargs):
+    try:
+        quiz = get_live_quiz(slug)
+    except Http404:
+        return None
+    if quiz.is_seeded and not request.GET.get('paper'):
+        return None
+    return getattr(quiz, 'datetime_modified', None)
+
+
+def serialize_paper(quiz, seed=None):
+    """Returns the quiz paper as a dictionary, leaving out the scores. If the
+    quiz samples its questions or shuffles their answers, ``seed`` picks
+    them."""
+    levels = []
+    for difficulty in quiz.difficulty_levels:
+        questions = []
+        for question in quiz.get_questions(difficulty, seed):
+            choices = question.choices
+            if seed is not None and getattr(quiz, 'shuffle_answers', False):
+                choices = shuffle_choices(choices, seed, question.pk)
+            questions.append({
+                'id': question.pk,
+                'question': question.question,
+                'answers': [{'id': pk, 'answer': answer}
+                            for pk, answer in choices],
+            })
+        levels.append({
+            'difficulty': difficulty,
+            'name': unicode(get_display_name(difficulty)),
+            'questions': questions,
+        })
+    paper = {
+        'slug': quiz.slug,
+        'name': quiz.name,
+        'description': quiz.description,
+        'version': quiz.version,
+        'levels': levels,
+        'submit_url': reverse('quiz_api_submit', kwargs={'slug': quiz.slug}),
+    }
+    if quiz.is_seeded and seed is not None:
+        paper['paper'] = sign_paper(quiz, seed)
+    return paper
+
+def quiz_paper(request, slug, *args, **kwargs):
+    """Returns the quiz paper as JSON."""
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'HEAD'])
+    quiz, seed = get_live_quiz(slug), None
+    if quiz.is_seeded:
+        if 'paper' in request.GET:
+            seed = unsign_paper(quiz, request.GET['paper'])
+            if seed is None:
+                raise Http404
+        else:
+            seed = new_seed()
+    return json_response(serialize_paper(quiz, seed))
+quiz_paper = condition(etag_func=quiz_etag,
+                       last_modified_func=quiz_last_modified)(quiz_paper)
+
+
+def clean_submission(answer_key, answer_ids):
+    """Checks that ``answer_ids`` holds exactly one live answer to each of
+    the questions in ``answer_key``. Returns a dictionary of errors, which is
+    empty if there are none."""
+    if not isinstance(answer_ids, list):
+        return {'answers': 'Expected a list of answer ids.'}
+    questions, errors = {}, {}
+    for answer_id in answer_ids:
+        # Lists and objects aren't hashable, and True would pass for 1.
+        if (not isinstance(answer_id, (int, long)) or
+            isinstance(answer_id, bool) or
+            answer_id not in answer_key.answers):
+            errors.setdefault('unknown', []).append(answer_id)
+            continue
+        question_id = answer_key.answers[answer_id][0]
+        if question_id in questions:
+            errors.setdefault('duplicate', []).append(question_id)
+        questions[question_id] = answer_id
+    missing = [pk for pk in answer_key.question_ids
+               if pk not in questions]
+    if missing:
+        errors['unanswered'] = missing
+    return errors
+
+def quiz_submit(request, slug, *args, **kwargs):
+    """Scores and records a whole quiz submission, returning the score. With
+    a submission queue configured (see ``quiz.submissions``) it is recorded
+    later instead, and a 202 response says where to wait for it."""
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    if request.META.get('CONTENT_TYPE', '').split(';')[0] != JSON_TYPE:
+        return HttpResponse('Submissions must be sent as %s.' % JSON_TYPE,
+                            status=415)
+    quiz = get_live_quiz(slug)
+    try:
+        submission = simplejson.loads(request.raw_post_data)
+    except ValueError:
+        return HttpResponseBadRequest('Invalid JSON.')
+    if not isinstance(submission, dict):
+        return json_error({'answers': 'Expected a JSON object.'})
+
+    if request.user.is_authenticated():
+        data = {'user': request.user, 'email': request.user.email}
+    elif request.session.get('email'):
+        data = {'email': request.session['email']}
+    else:
+        form = EmailForm({'email': submission.get('email', '')})
+        if not form.is_valid():
+            return json_error(dict([(field, [unicode(m) for m in messages])
+                for field, messages in form.errors.items()]))
+        data = {'email': form.cleaned_data['email']}
+
+    seed = None
+    if quiz.is_sampled:
+        seed = unsign_paper(quiz, submission.get('paper'))
+        if seed is None:
+            return json_error({'paper': 'Missing or invalid paper token.'})
+    answer_key = quiz.get_answer_key(seed=seed)
+    answer_ids = submission.get('answers')
+    errors = clean_submission(answer_key, answer_ids)
+    if errors:
+        return json_error(errors)
+
+    queue = get_submission_queue()
+    if queue is not None:
+        user = data.get('user')
+        token = queue.put(Submission(quiz.pk, answer_ids,
+            user_id=user and user.pk, email=data['email'], seed=seed
+        ))
+        url = reverse('quiz_pending', kwargs={'slug': quiz.slug, 'token': token})
+        response = json_response({'status': 'pending', 'url': url}, 202)
+        response['Location'] = url
+        return response
+
+    score_card = answer_key.score(answer_ids)
+    result = QuizResult.objects.record(
+        quiz_id=quiz.pk,
+        score=score_card.score,
+        maximum_score=score_card.maximum_score,
+        answers=score_card.answer_ids,
+        **data
+    )
+    return json_response({
+        'status': 'recorded',
+        'result': result.pk,
+        'score': result.score,
+        'maximum_score': result.maximum_score,
+        'url': result.get_absolute_url(),
+    }, 201)
+quiz_submit = csrf_exempt(quiz_submit)
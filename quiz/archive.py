@@ -0,0 +1,100 @@
+"""Archiving old quiz results.
+
+``QuizResult`` and its answers table grow with every quiz taken, and the
+admin's date and filter queries over them get slower every term.
+``archive_results`` moves results created before a cutoff into
+``ArchivedResult``, a batch at a time: one ``executemany`` INSERT per batch,
+with each result's answer ids packed into a single column, and a DELETE of
+the live rows and their answers.
+
+The rows are moved with SQL rather than through the ORM, so no ``post_delete``
+signals are sent and the leaderboards' score buckets and the answer
+statistics - which already count the archived results - are left as they
+are. ``quiz.leaderboard``, ``quiz.stats``, ``quiz.taken`` and
+``quiz.relinking`` read the archive alongside the live results, and
+``quiz_completed`` falls back to it, so old result URLs keep working.
+"""
+from datetime import datetime
+
+from django.db import connection, transaction
+
+from quiz.models import (
+    ArchivedResult, QuizAttempt, QuizResult, QuizSubmission
+)
+from quiz.packing import get_answer_ids
+from quiz.routers import use_primary
+from quiz.stats import chunked
+
+BATCH_SIZE = 500
+
+
+def _delete(model, column, pks):
+    qn = connection.ops.quote_name
+    connection.cursor().execute('DELETE FROM %s WHERE %s IN (%s)' % (
+        qn(model._meta.db_table), qn(column), ', '.join(['%s'] * len(pks))
+    ), list(pks))
+
+def archive_batch(pks):
+    """Moves the results with the given ids into the archive. Returns the
+    number of results moved."""
+    rows = list(QuizResult.objects.filter(pk__in=pks).order_by('id')
+        .values_list('pk', 'quiz', 'user', 'email', 'score', 'maximum_score',
+                     'datetime_created', 'datetime_modified', 'packed_answers'))
+    if not rows:
+        return 0
+    pks = [row[0] for row in rows]
+    answers = get_answer_ids([(row[0], row[-1]) for row in rows])
+    field = QuizResult._meta.get_field('answers')
+    through = field.rel.through
+    result_field = field.m2m_field_name()
+
+    opts, qn = ArchivedResult._meta, connection.ops.quote_name
+    columns = ['id', 'quiz', 'user', 'email', 'score', 'maximum_score',
+               'datetime_created', 'datetime_modified', 'answers',
+               'datetime_archived']
+    to_db = connection.ops.value_to_db_datetime
+    now = to_db(datetime.now())
+    connection.cursor().executemany('INSERT INTO %s (%s) VALUES (%s)' % (
+        qn(opts.db_table),
+        ', '.join([qn(opts.get_field(name).column) for name in columns]),
+        ', '.join(['%s'] * len(columns))
+    ), [
+        (pk, quiz_id, user_id, email, score, maximum_score, to_db(created),
+         to_db(modified), ','.join([str(answer_id) for answer_id in
+                                    answers.get(pk, [])]), now)
+        for (pk, quiz_id, user_id, email, score, maximum_score, created,
+             modified, packed) in rows
+    ])
+    # Queue bookkeeping for results long since shown, and the attempts which
+    # led to them, can't point at rows which are going.
+    QuizSubmission.objects.filter(result__in=pks).delete()
+    QuizAttempt.objects.filter(result__in=pks).update(result=None)
+    _delete(through, through._meta.get_field(result_field).column, pks)
+    _delete(QuizResult, QuizResult._meta.pk.column, pks)
+    transaction.set_dirty()
+    return len(rows)
+archive_batch = transaction.commit_on_success(use_primary(archive_batch))
+
+def archive_results(before, quiz=None, batch_size=BATCH_SIZE):
+    """Moves the results created before ``before`` (optionally only those
+    for ``quiz``) into the archive, ``batch_size`` at a time, each batch in
+    its own transaction. Returns the number of results moved."""
+    results = QuizResult.objects.filter(datetime_created__lt=before)
+    if quiz is not None:
+        results = results.filter(quiz=quiz)
+    # Some databases reuse the highest id once its row has gone, which would
+    # give a new result the URL of an archived one, so the latest result is
+    # always kept.
+    latest = list(QuizResult.objects.order_by('-id').values_list(
+        'pk', flat=True)[:1])
+    if latest:
+        results = results.exclude(pk=latest[0])
+    archived = 0
+    while True:
+        pks = list(results.order_by('id').values_list('pk', flat=True)[
+            :batch_size])
+        if not pks:
+            return archived
+        for chunk in chunked(pks):
+            archived += archive_batch(chunk)
+archive_results = use_primary(archive_results)
@@ -0,0 +1,209 @@
+"""Resumable quiz attempts.
+
+With::
+
+    QUIZ_WIZARD_STORAGE = 'attempt'
+
+the quiz wizard keeps its state (see ``quiz.wizard``) in a ``QuizAttempt``
+row, created when a candidate starts the quiz. Each completed step is saved
+with a single UPDATE, a candidate who comes back to the quiz resumes from
+the first step they haven't completed, and the attempt is marked completed
+and linked to its ``QuizResult`` when the quiz is done.
+
+Between steps the wizard page autosaves the answers given so far to the
+``quiz_autosave`` view. Autosaves are frequent and individually unimportant,
+so rather than writing each one they are held in a per-process
+``AttemptBuffer``, which keeps only the latest draft per attempt and writes
+them all with one ``executemany`` once ``QUIZ_ATTEMPT_BUFFER_SIZE`` attempts
+are pending or ``QUIZ_ATTEMPT_FLUSH_INTERVAL`` seconds have passed, checked
+as drafts are added and at the end of every request, and at exit. Drafts
+which fail to be written go back into the buffer for the next flush; a
+failure at the end of a request is logged to the ``quiz.attempts`` logger
+rather than raised, as the response has already been sent. A
+draft still in another process's buffer when a candidate resumes is lost,
+which costs them at most the last few seconds of one step.
+"""
+import atexit
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import connection, transaction
+from django.utils import simplejson
+
+from quiz.models import QuizAttempt
+from quiz.wizard import WizardStorage, new_state
+
+BUFFER_SIZE = getattr(settings, 'QUIZ_ATTEMPT_BUFFER_SIZE', 100)
+FLUSH_INTERVAL = getattr(settings, 'QUIZ_ATTEMPT_FLUSH_INTERVAL', 5.0)
+
+logger = logging.getLogger('quiz.attempts')
+
+
+def write_drafts(drafts):
+    """Writes ``{token: (email, draft)}`` to the in-progress attempts they
+    belong to, in a single ``executemany``."""
+    if not drafts:
+        return
+    opts, qn = QuizAttempt._meta, connection.ops.quote_name
+    sql = 'UPDATE %s SET %s = %%s, %s = %%s WHERE %s = %%s AND %s = %%s AND %s = %%s' % (
+        qn(opts.db_table), qn(opts.get_field('draft').column),
+        qn(opts.get_field('datetime_modified').column),
+        qn(opts.get_field('token').column), qn(opts.get_field('email').column),
+        qn(opts.get_field('status').column),
+    )
+    now = connection.ops.value_to_db_datetime(datetime.now())
+    connection.cursor().executemany(sql, [
+        (simplejson.dumps(draft, sort_keys=True), now, token, email,
+         QuizAttempt.IN_PROGRESS)
+        for token, (email, draft) in drafts.items()
+    ])
+    transaction.set_dirty()
+write_drafts = transaction.commit_on_success(write_drafts)
+
+
+class AttemptBuffer(object):
+    """Coalesces autosaved drafts in memory and writes them in batches."""
+
+    def __init__(self, size=BUFFER_SIZE, interval=FLUSH_INTERVAL):
+        self.size = size
+        self.interval = interval
+        self._pending = {}
+        self._started = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, token, email, draft):
+        """Buffers the latest draft for an attempt, replacing any earlier
+        one, and flushes the buffer if it is full or old enough."""
+        self._lock.acquire()
+        try:
+            self._pending[token] = (email, draft)
+            if self._started is None:
+                self._started = time.time()
+            due = self.is_due()
+        finally:
+            self._lock.release()
+        if due:
+            self.flush()
+
+    def is_due(self):
+        started = self._started
+        return started is not None and (len(self._pending) >= self.size or
+            time.time() - started >= self.interval)
+
+    def flush_if_due(self, **kwargs):
+        """Flushes the buffer if it is full or old enough, so that drafts
+        aren't left waiting for the next autosave. Connected to
+        ``request_finished``, so a failed flush is logged rather than
+        raised; the drafts are kept for the next one."""
+        if self.is_due():
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Failed to write autosaved drafts.')
+
+    def get(self, token):
+        """Returns the buffered draft for an attempt, or ``None``."""
+        pending = self._pending.get(token)
+        return pending and pending[1]
+
+    def discard(self, token):
+        self._lock.acquire()
+        try:
+            self._pending.pop(token, None)
+        finally:
+            self._lock.release()
+
+    def flush(self):
+        self._lock.acquire()
+        try:
+            pending, self._pending, self._started = self._pending, {}, None
+        finally:
+            self._lock.release()
+        try:
+            write_drafts(pending)
+        except Exception:
+            # Put them back, behind any newer drafts added meanwhile.
+            self._lock.acquire()
+            try:
+                for token, draft in pending.items():
+                    self._pending.setdefault(token, draft)
+                if self._pending and self._started is None:
+                    self._started = time.time()
+            finally:
+                self._lock.release()
+            raise
+
+attempt_buffer = AttemptBuffer()
+atexit.register(attempt_buffer.flush)
+request_finished.connect(attempt_buffer.flush_if_due,
+                         dispatch_uid='quiz.attempts.attempt_buffer')
+
+
+class AttemptWizardStorage(WizardStorage):
+    """Keeps the quiz wizard's state in ``QuizAttempt`` rows."""
+
+    def get_email(self):
+        if self.request.user.is_authenticated():
+            return self.request.user.email
+        return self.request.session.get('email', '')
+
+    def get_attempts(self):
+        """The current taker's attempts which are in progress."""
+        attempts = QuizAttempt.objects.filter(status=QuizAttempt.IN_PROGRESS)
+        if self.request.user.is_authenticated():
+            return attempts.filter(user=self.request.user.pk)
+        return attempts.filter(user=None, email=self.get_email())
+
+    def start(self, quiz_id=None):
+        state = new_state()
+        attempt = QuizAttempt.objects.create(quiz_id=quiz_id,
+            user_id=self.request.user.is_authenticated() and
+                    self.request.user.pk or None,
+            email=self.get_email(), token=uuid.uuid4().hex,
+            state=simplejson.dumps(state)
+        )
+        return attempt.token, state
+
+    def resume(self, quiz_id):
+        if not self.get_email() and not self.request.user.is_authenticated():
+            return None
+        rows = self.get_attempts().filter(quiz=quiz_id).order_by(
+            '-datetime_modified').values_list('token', 'state', 'draft')[:1]
+        if not rows:
+            return None
+        token, state, draft = rows[0]
+        draft = attempt_buffer.get(token) or (draft and simplejson.loads(draft))
+        return token, simplejson.loads(state), draft or None
+
+    def load(self, attempt):
+        rows = self.get_attempts().filter(token=attempt).values_list(
+            'state', flat=True)[:1]
+        return rows and simplejson.loads(rows[0]) or None
+
+    def save(self, attempt, state):
+        attempt_buffer.discard(attempt)
+        self.get_attempts().filter(token=attempt).update(
+            state=simplejson.dumps(state, sort_keys=True), draft='',
+            current_step=len(state['steps']), datetime_modified=datetime.now()
+        )
+
+    def finish(self, attempt, result=None):
+        attempt_buffer.discard(attempt)
+        self.get_attempts().filter(token=attempt).update(
+            status=QuizAttempt.COMPLETED, result=result, draft='',
+            datetime_modified=datetime.now()
+        )
+
+    def remove(self, attempt):
+        self.finish(attempt)
+
+    def autosave(self, attempt, draft):
+        attempt_buffer.add(attempt, self.get_email(), draft)
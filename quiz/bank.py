@@ -0,0 +1,455 @@
+"""Bulk import and export of question banks.
+
+A bank is a stream of questions, each with its answers and the slugs of the
+quizzes it belongs to. In JSON Lines there is one question per line::
+
+    {"question": "Beautiful is better than...?", "difficulty": 1,
+     "is_active": true, "quizzes": ["python-zen"],
+     "answers": [{"answer": "ugly.", "score": 1, "is_active": true},
+                 {"answer": "complex.", "score": 0}]}
+
+YAML (which needs PyYAML) uses the same structure with one document per
+question. CSV has one row per answer, with the question columns repeated on
+consecutive rows and ``quizzes`` separated by spaces::
+
+    question,difficulty,is_active,quizzes,answer,score,answer_is_active
+
+``difficulty`` may be given as a number or as ``easy``/``medium``/``hard``,
+and ``is_active`` defaults to true. Questions are matched on their text and
+answers on their question and text (the ``unique_together`` key), so
+importing the same bank twice changes nothing. Importing only ever adds and
+updates: questions, answers and quiz memberships missing from the bank are
+left alone.
+
+Records are validated and written a chunk at a time: a handful of queries
+find what already exists, new rows are inserted with one ``executemany`` per
+table and changed rows are updated in sets, each chunk in its own
+transaction. Invalid records are skipped and reported along with their line
+numbers.
+"""
+import csv
+import time
+from datetime import datetime
+
+from django.db import connection, transaction
+from django.db.models import AutoField
+from django.utils import simplejson
+from django.utils.encoding import force_unicode, smart_str
+
+from quiz.caching import mark_changed
+from quiz.compiled import invalidate_compiled_quiz
+from quiz.models import Question, Answer, Quiz
+from quiz.summaries import update_quiz_summaries
+
+CHUNK_SIZE = 500
+FORMATS = ('jsonl', 'csv', 'yaml')
+CSV_FIELDS = ('question', 'difficulty', 'is_active', 'quizzes', 'answer',
+              'score', 'answer_is_active')
+
+_DIFFICULTIES = dict(Question.DIFFICULTY_CHOICES)
+_DIFFICULTY_NAMES = dict((force_unicode(name).lower(), value)
+                         for value, name in Question.DIFFICULTY_CHOICES)
+_SCORES = dict(Answer.SCORE_CHOICES)
+_BOOLEANS = {'': True, 'true': True, 'yes': True, '1': True,
+             'false': False, 'no': False, '0': False}
+
+
+class ImportReport(object):
+    """Counts what an import created and updated, and how quickly."""
+
+    def __init__(self):
+        self.records = 0
+        self.questions_created = self.questions_updated = 0
+        self.answers_created = self.answers_updated = 0
+        self.memberships_created = 0
+        self.errors = []
+        self.started = time.time()
+        self.elapsed = 0.0
+
+    def finish(self):
+        self.elapsed = time.time() - self.started
+        self.errors.sort()
+
+    @property
+    def rate(self):
+        """Questions imported per second."""
+        return self.records / max(self.elapsed, 1e-6)
+
+    def __unicode__(self):
+        return (u"Imported %d questions (%d created, %d updated), %d new and "
+                u"%d updated answers and %d quiz memberships in %.2fs "
+                u"(%.0f questions/s); %d records skipped." % (
+                    self.records, self.questions_created,
+                    self.questions_updated, self.answers_created,
+                    self.answers_updated, self.memberships_created,
+                    self.elapsed, self.rate, len(self.errors)))
+
+
+def _clean_boolean(value, name):
+    if isinstance(value, bool):
+        return value
+    if value is None:
+        return True
+    try:
+        return _BOOLEANS[force_unicode(value).strip().lower()]
+    except KeyError:
+        raise ValueError(u"%s must be true or false." % name)
+
+def _clean_choice(value, choices, name, names={}):
+    try:
+        value = names.get(force_unicode(value).strip().lower(), value)
+        value = int(value)
+    except (TypeError, ValueError):
+        pass
+    if value not in choices:
+        raise ValueError(u"%s must be one of %s." % (
+            name, ', '.join([str(c) for c in sorted(choices)])))
+    return value
+
+def clean_record(record):
+    """Validates a question record, which may be a JSON document, and returns
+    it in normal form. Raises ``ValueError`` if it is invalid."""
+    if not isinstance(record, dict):
+        try:
+            record = simplejson.loads(record)
+        except ValueError:
+            raise ValueError(u"Invalid JSON.")
+        if not isinstance(record, dict):
+            raise ValueError(u"A question must be an object.")
+    question = force_unicode(record.get('question') or '').strip()
+    if not question:
+        raise ValueError(u"A question is required.")
+    quizzes = record.get('quizzes') or []
+    if not isinstance(quizzes, (list, tuple)):
+        quizzes = force_unicode(quizzes).split()
+    answers, seen = [], {}
+    for answer in record.get('answers') or []:
+        if not isinstance(answer, dict):
+            raise ValueError(u"Each answer must be an object.")
+        text = force_unicode(answer.get('answer') or '').strip()
+        if not text:
+            raise ValueError(u"An answer is required.")
+        cleaned = {
+            'answer': text,
+            'score': _clean_choice(answer.get('score', Answer.INCORRECT),
+                                   _SCORES, 'score'),
+            'is_active': _clean_boolean(answer.get('is_active'), 'is_active'),
+        }
+        # Repeated answers would break the unique_together key; the last wins.
+        if text in seen:
+            answers[seen[text]] = cleaned
+        else:
+            seen[text] = len(answers)
+            answers.append(cleaned)
+    return {
+        'question': question,
+        'difficulty': _clean_choice(record.get('difficulty', Question.EASY),
+            _DIFFICULTIES, 'difficulty', _DIFFICULTY_NAMES),
+        'is_active': _clean_boolean(record.get('is_active'), 'is_active'),
+        'quizzes': [force_unicode(slug).strip() for slug in quizzes],
+        'answers': answers,
+    }
+
+
+def read_jsonl(stream):
+    """Yields ``(line number, record)`` for a JSON Lines stream."""
+    for number, line in enumerate(stream):
+        if line.strip():
+            yield number + 1, line
+
+def read_csv(stream):
+    """Yields ``(line number, record)`` for a CSV stream, gathering the
+    answers on consecutive rows for the same question into one record."""
+    record, start = None, None
+    reader = csv.reader(stream)
+    try:
+        header = [force_unicode(name).strip() for name in next(reader)]
+    except StopIteration:
+        return
+    for row in reader:
+        row = dict(zip(header, [force_unicode(value) for value in row]))
+        if record is None or row.get('question') != record['question']:
+            if record is not None:
+                yield start, record
+            start = reader.line_num
+            record = {
+                'question': row.get('question'),
+                'difficulty': row.get('difficulty') or Question.EASY,
+                'is_active': row.get('is_active'),
+                'quizzes': row.get('quizzes') or '',
+                'answers': [],
+            }
+        if (row.get('answer') or '').strip():
+            record['answers'].append({
+                'answer': row['answer'],
+                'score': row.get('score') or Answer.INCORRECT,
+                'is_active': row.get('answer_is_active'),
+            })
+    if record is not None:
+        yield start, record
+
+def read_yaml(stream):
+    """Yields ``(document number, record)`` for a stream of YAML
+    documents."""
+    import yaml
+    for number, record in enumerate(yaml.safe_load_all(stream)):
+        if record is not None:
+            yield number + 1, record
+
+READERS = {'jsonl': read_jsonl, 'csv': read_csv, 'yaml': read_yaml}
+
+
+def _insert(model, instances):
+    """Inserts unsaved instances with a single ``executemany``, bypassing
+    ``save()`` and its signals."""
+    if not instances:
+        return
+    fields = [f for f in model._meta.local_fields
+              if not isinstance(f, AutoField)]
+    sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+        connection.ops.quote_name(model._meta.db_table),
+        ', '.join([connection.ops.quote_name(f.column) for f in fields]),
+        ', '.join(['%s'] * len(fields)),
+    )
+    cursor = connection.cursor()
+    cursor.executemany(sql, [
+        [f.get_db_prep_save(f.pre_save(instance, True), connection=connection)
+         for f in fields]
+        for instance in instances
+    ])
+    transaction.set_dirty()
+
+def _update(model, changes, now):
+    """Applies ``{(field values...): [pks]}`` with an UPDATE per distinct set
+    of values."""
+    for values, pks in changes.items():
+        model.objects.filter(pk__in=pks).update(datetime_modified=now,
+                                                **dict(values))
+
+def _import_chunk(records, quizzes, report):
+    now = datetime.now()
+    texts = [r['question'] for r in records]
+    existing, changes, touched = {}, {}, set()
+    # The oldest question wins if several share the same text.
+    for pk, text, difficulty, is_active in Question.objects.filter(
+        question__in=texts).order_by('-pk').values_list(
+            'pk', 'question', 'difficulty', 'is_active'):
+        existing[text] = (pk, difficulty, is_active)
+
+    new = []
+    for record in records:
+        if record['question'] not in existing:
+            new.append(Question(question=record['question'],
+                difficulty=record['difficulty'], is_active=record['is_active'],
+                datetime_created=now, datetime_modified=now))
+            continue
+        pk, difficulty, is_active = existing[record['question']]
+        if (difficulty, is_active) != (record['difficulty'],
+                                       record['is_active']):
+            changes.setdefault((('difficulty', record['difficulty']),
+                ('is_active', record['is_active'])), []).append(pk)
+            touched.add(pk)
+            report.questions_updated += 1
+    _insert(Question, new)
+    _update(Question, changes, now)
+    report.questions_created += len(new)
+    question_pks = dict((text, value[0]) for text, value in existing.items())
+    if new:
+        question_pks.update(Question.objects.filter(
+            question__in=[q.question for q in new]
+        ).values_list('question', 'pk'))
+
+    existing = {}
+    for pk, question_id, text, score, is_active in Answer.objects.filter(
+        question__in=question_pks.values()).values_list(
+            'pk', 'question', 'answer', 'score', 'is_active'):
+        existing[(question_id, text)] = (pk, score, is_active)
+    new, changes = [], {}
+    for record in records:
+        question_id = question_pks[record['question']]
+        for answer in record['answers']:
+            key = (question_id, answer['answer'])
+            if key not in existing:
+                new.append(Answer(question_id=question_id,
+                    answer=answer['answer'], score=answer['score'],
+                    is_active=answer['is_active'],
+                    datetime_created=now, datetime_modified=now))
+                touched.add(question_id)
+                continue
+            pk, score, is_active = existing[key]
+            if (score, is_active) != (answer['score'], answer['is_active']):
+                changes.setdefault((('score', answer['score']),
+                    ('is_active', answer['is_active'])), []).append(pk)
+                touched.add(question_id)
+                report.answers_updated += 1
+    _insert(Answer, new)
+    _update(Answer, changes, now)
+    report.answers_created += len(new)
+
+    field = Quiz._meta.get_field('questions')
+    through = field.rel.through
+    quiz_field, question_field = (field.m2m_field_name(),
+                                  field.m2m_reverse_field_name())
+    memberships = {}
+    for quiz_id, question_id in through.objects.filter(**{
+        '%s__in' % question_field: question_pks.values()
+    }).values_list(quiz_field, question_field):
+        memberships.setdefault(question_id, set()).add(quiz_id)
+    # Quizzes whose compiled papers show a changed question:
+    changed_quizzes = set()
+    for question_id in touched:
+        changed_quizzes.update(memberships.get(question_id, ()))
+    new = []
+    for record in records:
+        question_id = question_pks[record['question']]
+        current = memberships.setdefault(question_id, set())
+        for slug in record['quizzes']:
+            if quizzes[slug] not in current:
+                current.add(quizzes[slug])
+                changed_quizzes.add(quizzes[slug])
+                new.append(through(**{
+                    '%s_id' % quiz_field: quizzes[slug],
+                    '%s_id' % question_field: question_id,
+                }))
+    _insert(through, new)
+    report.memberships_created += len(new)
+    report.records += len(records)
+    return changed_quizzes
+_import_chunk = transaction.commit_on_success(_import_chunk)
+
+def import_bank(stream, format='jsonl', chunk_size=CHUNK_SIZE):
+    """Imports a question bank from ``stream``, returning an
+    ``ImportReport``."""
+    if format not in READERS:
+        raise ValueError("Unknown question bank format '%s'." % format)
+    report, quizzes, changed = ImportReport(), {}, set()
+
+    def flush(chunk, numbers):
+        slugs = set()
+        for record in chunk:
+            slugs.update(record['quizzes'])
+        slugs.difference_update(quizzes)
+        if slugs:
+            quizzes.update(Quiz.objects.filter(
+                slug__in=list(slugs)).values_list('slug', 'pk'))
+        valid, seen = [], {}
+        for number, record in zip(numbers, chunk):
+            missing = [s for s in record['quizzes'] if s not in quizzes]
+            if missing:
+                report.errors.append((number,
+                    u"Unknown quizzes: %s." % ', '.join(missing)))
+            elif record['question'] in seen:
+                # A repeated question within a chunk: the last one wins.
+                valid[seen[record['question']]] = record
+            else:
+                seen[record['question']] = len(valid)
+                valid.append(record)
+        if valid:
+            changed.update(_import_chunk(valid, quizzes, report))
+
+    chunk, numbers = [], []
+    for number, record in READERS[format](stream):
+        try:
+            chunk.append(clean_record(record))
+            numbers.append(number)
+        except ValueError as e:
+            report.errors.append((number, force_unicode(e)))
+        if len(chunk) >= chunk_size:
+            flush(chunk, numbers)
+            chunk, numbers = [], []
+    if chunk:
+        flush(chunk, numbers)
+    # The bulk writes bypass the listeners, so refresh the compiled papers,
+    # quiz summaries and quiz list.
+    invalidate_compiled_quiz(*changed)
+    update_quiz_summaries(changed)
+    if changed:
+        mark_changed('quiz_list')
+    report.finish()
+    return report
+
+
+def iter_bank(questions=None, chunk_size=CHUNK_SIZE):
+    """Yields a record per question in ``questions`` (every question by
+    default) in id order, reading ``chunk_size`` questions, their answers
+    and their quiz memberships at a time."""
+    if questions is None:
+        questions = Question.objects.all()
+    questions = questions.order_by('pk').values_list(
+        'pk', 'question', 'difficulty', 'is_active')
+    through = Quiz.questions.through
+    last_pk = 0
+    while True:
+        rows = list(questions.filter(pk__gt=last_pk)[:chunk_size])
+        if not rows:
+            return
+        last_pk = rows[-1][0]
+        pks = [row[0] for row in rows]
+        answers, quizzes = {}, {}
+        for question_id, answer, score, is_active in Answer.objects.filter(
+            question__in=pks).order_by('id').values_list(
+                'question', 'answer', 'score', 'is_active'):
+            answers.setdefault(question_id, []).append({
+                'answer': answer, 'score': score, 'is_active': is_active,
+            })
+        for question_id, slug in through.objects.filter(
+            question__in=pks).order_by('quiz__slug').values_list(
+                'question', 'quiz__slug'):
+            quizzes.setdefault(question_id, []).append(slug)
+        for pk, question, difficulty, is_active in rows:
+            yield {
+                'question': question,
+                'difficulty': difficulty,
+                'is_active': is_active,
+                'quizzes': quizzes.get(pk, []),
+                'answers': answers.get(pk, []),
+            }
+        if len(rows) < chunk_size:
+            return
+
+
+class _Echo(object):
+    """A file-like object which hands back whatever is written to it."""
+
+    def write(self, value):
+        return value
+
+
+def as_jsonl(records):
+    for record in records:
+        yield simplejson.dumps(record, sort_keys=True) + '\n'
+
+def as_csv(records):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_FIELDS)
+    for record in records:
+        question = [smart_str(record['question']), record['difficulty'],
+                    record['is_active'] and 'true' or 'false',
+                    smart_str(' '.join(record['quizzes']))]
+        for answer in record['answers'] or [None]:
+            if answer is None:
+                yield writer.writerow(question + ['', '', ''])
+            else:
+                yield writer.writerow(question + [
+                    smart_str(answer['answer']), answer['score'],
+                    answer['is_active'] and 'true' or 'false'])
+
+def as_yaml(records):
+    import yaml
+    for record in records:
+        yield yaml.safe_dump(record, explicit_start=True,
+                             default_flow_style=False, allow_unicode=True)
+
+WRITERS = {'jsonl': as_jsonl, 'csv': as_csv, 'yaml': as_yaml}
+
+def export_bank(questions=None, format='jsonl', chunk_size=CHUNK_SIZE):
+    """Yields a question bank serialised as ``format``, a line (or YAML
+    document) at a time."""
+    if format not in WRITERS:
+        raise ValueError("Unknown question bank format '%s'." % format)
+    return WRITERS[format](iter_bank(questions, chunk_size))
+
+def guess_format(path):
+    """Guesses a question bank format from a file name."""
+    extension = path.rsplit('.', 1)[-1].lower()
+    return {'json': 'jsonl', 'yml': 'yaml'}.get(extension, extension)
@@ -0,0 +1,2 @@
+"""Benchmarks and the seeded datasets they run against. These create and
+destroy their own test database, so never touch real data."""
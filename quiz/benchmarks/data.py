@@ -0,0 +1,69 @@
+"""Generates a realistically sized quiz dataset."""
+import random
+
+from django.contrib.auth.models import User
+from django.utils import simplejson
+
+from quiz.bank import import_bank
+from quiz.models import Quiz, Question, Answer, QuizResult
+
+
+def generate_bank(quizzes, questions, answers):
+    """Yields a JSON Lines question bank: ``questions`` questions per
+    difficulty for each quiz, each with ``answers`` answers of which the
+    first is correct."""
+    for quiz in range(quizzes):
+        for difficulty, name in Question.DIFFICULTY_CHOICES:
+            for question in range(questions):
+                yield simplejson.dumps({
+                    'question': 'Quiz %d, %s question %d?' % (
+                        quiz, name, question),
+                    'difficulty': difficulty,
+                    'quizzes': ['quiz-%d' % quiz],
+                    'answers': [
+                        {'answer': 'Answer %d' % answer,
+                         'score': answer == 0 and 1 or 0}
+                        for answer in range(answers)
+                    ],
+                }) + '\n'
+
+def seed(quizzes=5, questions=20, answers=4, results=10000, users=1000,
+         seed=0):
+    """Creates ``quizzes`` live quizzes with ``questions`` questions per
+    difficulty, ``answers`` answers each, ``users`` users and ``results``
+    historical results, half of them from registered users. Returns the
+    quizzes."""
+    rng = random.Random(seed)
+    for quiz in range(quizzes):
+        Quiz.objects.create(name='Quiz %d' % quiz, slug='quiz-%d' % quiz,
+                            status=Quiz.LIVE)
+    import_bank(generate_bank(quizzes, questions, answers), 'jsonl')
+
+    user_ids = []
+    for user in range(users):
+        user_ids.append(User.objects.create_user('taker%d' % user,
+            'taker%d@example.com' % user, 'password').pk)
+
+    papers = []
+    for quiz in Quiz.objects.order_by('id'):
+        choices = {}
+        for question_id, answer_id, score in Answer.objects.filter(
+            question__quizzes=quiz).values_list('question', 'pk', 'score'):
+            choices.setdefault(question_id, []).append((answer_id, score))
+        papers.append((quiz.pk, choices.values()))
+
+    def results_for():
+        for result in range(results):
+            quiz_id, paper = rng.choice(papers)
+            chosen = [rng.choice(question) for question in paper]
+            taker = rng.randrange(users * 2)
+            yield {
+                'quiz_id': quiz_id,
+                'user_id': taker < users and user_ids[taker] or None,
+                'email': 'taker%d@example.com' % taker,
+                'score': sum([score for answer_id, score in chosen]),
+                'maximum_score': len(paper),
+                'answers': [answer_id for answer_id, score in chosen],
+            }
+    QuizResult.objects.record_many(results_for())
+    return list(Quiz.objects.order_by('id'))
@@ -0,0 +1,171 @@
+"""Measures what taking a quiz costs, a request at a time.
+
+``run_flow`` drives the whole flow through the test client - the quiz list,
+capturing an email address, every step of the quiz wizard and the results
+page - and records the queries, database time, wall time and peak memory of
+each request. ``run`` repeats that over a seeded dataset, and the results can
+be saved as JSON and compared against a previous run with ``compare``.
+"""
+import re
+import sys
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.core.urlresolvers import reverse
+from django.db import connection, reset_queries
+from django.test.client import Client
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+try:
+    import resource
+except ImportError: # Windows.
+    resource = None
+
+INPUT_RE = re.compile(r'<input\s[^>]*>', re.I)
+ATTRIBUTE_RE = re.compile(r'(\w+)="([^"]*)"')
+
+
+def _peak_memory():
+    """Returns the peak memory used, in kilobytes: traced allocations where
+    ``tracemalloc`` is available, and otherwise the process's maximum
+    resident set size."""
+    if tracemalloc is not None and tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[1] // 1024
+    if resource is not None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return None
+
+def measure(name, func, *args, **kwargs):
+    """Calls ``func`` and returns ``(its return value, measurements)``."""
+    if tracemalloc is not None:
+        tracemalloc.start()
+    reset_queries()
+    started = time.time()
+    try:
+        value = func(*args, **kwargs)
+        elapsed = (time.time() - started) * 1000
+        memory = _peak_memory()
+    finally:
+        if tracemalloc is not None:
+            tracemalloc.stop()
+    queries = connection.queries
+    return value, {
+        'step': name,
+        'queries': len(queries),
+        'db_time_ms': sum([float(q['time']) for q in queries]) * 1000,
+        'time_ms': elapsed,
+        'peak_memory_kb': memory,
+    }
+
+def get_wizard_data(content):
+    """Returns the POST data for a wizard page: its hidden fields, and the
+    first choice of every question."""
+    data = {}
+    for tag in INPUT_RE.findall(content):
+        attributes = dict(ATTRIBUTE_RE.findall(tag))
+        name = attributes.get('name')
+        if not name:
+            continue
+        kind = attributes.get('type', 'text').lower()
+        if kind == 'hidden' or (kind == 'radio' and name not in data):
+            data[name] = attributes.get('value', '')
+    return data
+
+def run_flow(client, slug, email):
+    """Takes the quiz ``slug`` as an anonymous user with ``email``, returning
+    the measurements of every request."""
+    steps = []
+
+    def request(name, method, url, data=None):
+        response, measurements = measure(name, getattr(client, method), url,
+                                         data or {})
+        if response.status_code not in (200, 302):
+            raise AssertionError('%s returned %s' % (url, response.status_code))
+        steps.append(measurements)
+        return response
+
+    quiz_url = reverse('quiz_detail', kwargs={'slug': slug})
+    request('quiz_list', 'get', reverse('quiz_list'))
+    request('capture_email', 'post', '%s?next=%s' % (
+        reverse('quiz_capture_email'), quiz_url), {'email': email})
+    response = request('quiz_detail', 'get', quiz_url)
+    step = 1
+    while response.status_code == 200:
+        data = get_wizard_data(response.content)
+        response = request('wizard_step_%d' % step, 'post', quiz_url, data)
+        step += 1
+    # The last step is the wizard's done():
+    steps[-1]['step'] = 'done'
+    request('quiz_completed', 'get', response['Location'])
+    return steps
+
+def _median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+def run(quizzes, iterations=5):
+    """Takes each quiz ``iterations`` times with the test client. Returns the
+    median time, and the worst query count and memory, per step."""
+    old_debug = settings.DEBUG
+    settings.DEBUG = True # Needed to record queries.
+    try:
+        runs = []
+        for i in range(iterations):
+            for quiz in quizzes:
+                runs.append(run_flow(Client(), quiz.slug,
+                                     'benchmark%d@example.com' % i))
+    finally:
+        settings.DEBUG = old_debug
+
+    steps = []
+    for measurements in zip(*runs):
+        steps.append({
+            'step': measurements[0]['step'],
+            'queries': max([m['queries'] for m in measurements]),
+            'db_time_ms': _median([m['db_time_ms'] for m in measurements]),
+            'time_ms': _median([m['time_ms'] for m in measurements]),
+            'peak_memory_kb': max([m['peak_memory_kb'] for m in measurements]),
+        })
+    return steps
+
+def make_report(steps, **parameters):
+    return {
+        'created': datetime.now().strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': sys.version.split()[0],
+        'memory': tracemalloc is not None and 'traced' or 'max_rss',
+        'parameters': parameters,
+        'steps': steps,
+    }
+
+def compare(baseline, report, tolerance=0.25, minimum_ms=2.0):
+    """Returns a message for each step which has regressed since
+    ``baseline``: any extra query, or a slowdown of more than ``tolerance``
+    (a fraction) that is also more than ``minimum_ms``."""
+    previous = dict([(s['step'], s) for s in baseline['steps']])
+    regressions = []
+    for step in report['steps']:
+        before = previous.get(step['step'])
+        if before is None:
+            continue
+        if step['queries'] > before['queries']:
+            regressions.append('%s: %d queries, up from %d.' % (
+                step['step'], step['queries'], before['queries']))
+        slower = step['time_ms'] - before['time_ms']
+        if (slower > minimum_ms and
+            step['time_ms'] > before['time_ms'] * (1 + tolerance)):
+            regressions.append('%s: %.1fms, up from %.1fms.' % (
+                step['step'], step['time_ms'], before['time_ms']))
+    return regressions
+
+def format_report(report):
+    lines = ['%-16s %8s %10s %10s %12s' % (
+        'step', 'queries', 'db ms', 'wall ms', 'peak KB')]
+    for step in report['steps']:
+        lines.append('%-16s %8d %10.2f %10.2f %12s' % (step['step'],
+            step['queries'], step['db_time_ms'], step['time_ms'],
+            step['peak_memory_kb']))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,124 @@
+"""Compares the hot query paths with and without the indexes in ``quiz/sql``.
+
+Each query is timed and its plan captured, the indexes are dropped, and the
+same again, so the report shows what every index is buying.
+"""
+import re
+import time
+
+from django.core.management.color import no_style
+from django.core.management.sql import custom_sql_for_model
+from django.db import connection
+from django.db.models import get_app, get_models
+from django.utils.encoding import force_unicode
+
+from quiz.leaderboard import Leaderboard
+from quiz.models import Quiz, Question, Answer, QuizResult
+from quiz.pagination import KeysetPage, encode_cursor
+
+INDEX_RE = re.compile(r'CREATE\s+INDEX\s+(\w+)\s+ON\s+(\w+)', re.I)
+
+
+def get_index_statements():
+    """Returns ``(name, table, statement)`` for every index in ``quiz/sql``."""
+    indexes = []
+    for model in get_models(get_app('quiz')):
+        for statement in custom_sql_for_model(model, no_style(), connection):
+            match = INDEX_RE.search(statement)
+            if match:
+                indexes.append(match.groups() + (statement,))
+    return indexes
+
+def _backend():
+    return connection.settings_dict['ENGINE'].split('.')[-1]
+
+def drop_indexes(indexes):
+    cursor = connection.cursor()
+    for name, table, statement in indexes:
+        if _backend() == 'mysql':
+            cursor.execute('DROP INDEX %s ON %s' % (name, table))
+        else:
+            cursor.execute('DROP INDEX %s' % name)
+    analyze()
+
+def create_indexes(indexes):
+    cursor = connection.cursor()
+    for name, table, statement in indexes:
+        cursor.execute(statement)
+    analyze()
+
+def analyze():
+    """Refreshes the planner's statistics, so plans reflect the data."""
+    if _backend() in ('sqlite3', 'postgresql', 'postgresql_psycopg2'):
+        connection.cursor().execute('ANALYZE')
+
+def explain(queryset):
+    """Returns the query plan for a queryset, one line per row."""
+    sql, params = queryset.query.get_compiler(queryset.db).as_sql()
+    prefix = _backend() == 'sqlite3' and 'EXPLAIN QUERY PLAN' or 'EXPLAIN'
+    cursor = connection.cursor()
+    cursor.execute('%s %s' % (prefix, sql), params)
+    return [' '.join([force_unicode(column) for column in row])
+            for row in cursor.fetchall()]
+
+def get_queries(quiz):
+    """The hot queries, as ``(name, queryset, evaluate)`` - the queryset is
+    explained and ``evaluate`` timed."""
+    result = QuizResult.objects.filter(quiz=quiz).exclude(user=None)[0]
+    anonymous = QuizResult.objects.filter(quiz=quiz, user=None)[0]
+    questions = quiz.questions.live.filter(difficulty=Question.MEDIUM)
+    live = Quiz.objects.filter(status=Quiz.LIVE)
+    middle = live.order_by('-datetime_created', '-id')[live.count() // 2]
+    queries = [
+        ('quiz list', KeysetPage(live, 20).get_queryset(), list),
+        ('quiz list, deep page', KeysetPage(live, 20, after=encode_cursor(
+            middle.datetime_created, middle.pk)).get_queryset(), list),
+        ('live questions', questions.order_by('id'), list),
+        ('live answers', Answer.objects.live.filter(
+            question__in=list(questions.values_list('pk', flat=True))), list),
+        ('quiz_taken', QuizResult.objects.filter(quiz=quiz,
+            user=result.user_id), lambda qs: qs.count()),
+        ('results by email', QuizResult.objects.filter(quiz=quiz,
+            email=anonymous.email), list),
+        ('registration re-link', QuizResult.objects.filter(
+            email=anonymous.email, user=None), list),
+        ('leaderboard top 10', Leaderboard(quiz).get_top_queryset(10), list),
+    ]
+    return queries
+
+def time_query(queryset, evaluate, repeat):
+    """Returns the best of ``repeat`` runs, in milliseconds."""
+    best = None
+    for i in range(repeat):
+        started = time.time()
+        evaluate(queryset._clone())
+        elapsed = (time.time() - started) * 1000
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def run(quiz, repeat=20):
+    """Measures every hot query without and then with the indexes. Returns
+    ``[(name, without, with), ...]`` where each measurement is a ``(time in
+    ms, plan)`` pair."""
+    indexes = get_index_statements()
+    queries = get_queries(quiz)
+    drop_indexes(indexes)
+    try:
+        without = [(time_query(qs, evaluate, repeat), explain(qs))
+                   for name, qs, evaluate in queries]
+    finally:
+        create_indexes(indexes)
+    indexed = [(time_query(qs, evaluate, repeat), explain(qs))
+               for name, qs, evaluate in queries]
+    return [(name, before, after) for (name, qs, evaluate), before, after
+            in zip(queries, without, indexed)]
+
+def format_report(measurements):
+    lines = []
+    for name, (before, before_plan), (after, after_plan) in measurements:
+        lines.append('%s: %.3fms -> %.3fms (%.1fx)' % (
+            name, before, after, before / max(after, 1e-6)))
+        lines.extend(['    before: %s' % line for line in before_plan])
+        lines.extend(['    after:  %s' % line for line in after_plan])
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,110 @@
+"""HTTP and template fragment caching for the quiz list and results pages.
+
+Both pages answer conditional GETs. The quiz list's ``ETag`` and
+``Last-Modified`` come from the latest modification of a live quiz, or of
+the questions which the list can be filtered on, and are themselves cached
+until then, so a revalidation costs no queries. A result's ``ETag`` and
+``Last-Modified`` come from the result itself and from the last change to
+its quiz's leaderboard, since the page shows the taker's rank.
+
+With ``QUIZ_FRAGMENT_CACHE_TIMEOUT`` set to a number of seconds, the parts
+of the templates wrapped in ``{% quiz_cache %}`` are cached as well, until
+the listeners in ``quiz.listeners`` mark them as changed.
+"""
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.utils.hashcompat import md5_constructor
+
+from quiz.models import ArchivedResult, Quiz, QuizResult
+from quiz.routers import use_primary
+
+CACHE_PREFIX = getattr(settings, 'QUIZ_PAGE_CACHE_PREFIX', 'quiz:pages')
+CACHE_TIMEOUT = getattr(settings, 'QUIZ_PAGE_CACHE_TIMEOUT', 60 * 60 * 24)
+FRAGMENT_TIMEOUT = getattr(settings, 'QUIZ_FRAGMENT_CACHE_TIMEOUT', 0)
+
+
+def _changed_key(name):
+    return '%s:changed:%s' % (CACHE_PREFIX, name)
+
+def get_changed(name):
+    """Returns the time (as a timestamp) at which ``name`` last changed. If
+    the cache backend has forgotten, that's taken to be now."""
+    changed = cache.get(_changed_key(name))
+    if changed is None:
+        cache.add(_changed_key(name), time.time(), CACHE_TIMEOUT)
+        changed = cache.get(_changed_key(name))
+    return changed
+
+def mark_changed(*names):
+    now = time.time()
+    for name in names:
+        cache.set(_changed_key(name), now, CACHE_TIMEOUT)
+
+
+def get_fragment_key(name, vary_on=()):
+    """Returns the cache key of a template fragment, which moves on whenever
+    ``name`` is marked as changed."""
+    vary = md5_constructor(u':'.join([unicode(v) for v in vary_on]).encode(
+        'utf-8')).hexdigest()
+    return '%s:fragment:%s:%r:%s' % (CACHE_PREFIX, name, get_changed(name),
+                                     vary)
+
+
+@use_primary
+def get_quiz_list_state():
+    """Returns ``(ETag, Last-Modified)`` for the list of live quizzes."""
+    changed = get_changed('quiz_list')
+    key = '%s:quiz_list:%r' % (CACHE_PREFIX, changed)
+    state = cache.get(key)
+    if state is None:
+        live = Quiz.objects.filter(status=Quiz.LIVE).aggregate(
+            modified=Max('datetime_modified'), count=Count('pk'))
+        # Question and membership changes alter the ?difficulty= filter
+        # without touching a quiz, so the list's own change counts too.
+        modified = max(live['modified'] or datetime(1970, 1, 1),
+                       datetime.fromtimestamp(changed))
+        state = ('%s-%d' % (modified.isoformat(), live['count']), modified)
+        cache.set(key, state, CACHE_TIMEOUT)
+    return state
+
+def quiz_list_etag(request, *args, **kwargs):
+    etag = get_quiz_list_state()[0]
+    if request.user.is_authenticated():
+        # The surrounding page may well show who is logged in.
+        etag = '%s-%s' % (etag, request.user.pk)
+    return etag
+
+def quiz_list_last_modified(request, *args, **kwargs):
+    return get_quiz_list_state()[1]
+
+
+def get_result_state(request, slug, pk):
+    """Returns ``(ETag, Last-Modified)`` for a result's page, or ``(None,
+    None)`` if there is no such result. Memoised on the request, as both
+    ``condition`` callbacks need it."""
+    if not hasattr(request, '_quiz_result_state'):
+        for model in (QuizResult, ArchivedResult):
+            rows = list(model.objects.filter(pk=pk, quiz__slug=slug)
+                        .values_list('quiz', 'datetime_modified')[:1])
+            if rows:
+                break
+        if not rows:
+            request._quiz_result_state = (None, None)
+        else:
+            quiz_id, modified = rows[0]
+            changed = get_changed('leaderboard:%s' % quiz_id)
+            request._quiz_result_state = (
+                '%s-%s-%r' % (pk, modified.isoformat(), changed),
+                max(modified, datetime.fromtimestamp(int(changed))),
+            )
+    return request._quiz_result_state
+
+def result_etag(request, slug, pk, *args, **kwargs):
+    return get_result_state(request, slug, pk)[0]
+
+def result_last_modified(request, slug, pk, *args, **kwargs):
+    return get_result_state(request, slug, pk)[1]
@@ -0,0 +1,351 @@
+"""Compiled quiz "papers".
+
+Rendering the quiz wizard straight from the ORM costs a query for the quiz,
+one for its difficulty levels, one per level to count the questions, one per
+question and another per question for its answers - and the wizard rebuilds
+every previous step on each POST. A ``CompiledQuiz`` is an immutable snapshot
+of everything needed to render and score a quiz. It is built with two
+queries - the live answers and the live questions - after the ``Quiz``
+lookup, cached in the Django cache backend and in a small in-process LRU, and
+keyed by a revision token which the listeners in ``quiz.listeners`` bump
+whenever the quiz, its questions or their answers change. A change made in a
+managed transaction bumps the token again when the request finishes, as
+another process may have compiled and cached the old rows under the new
+token before the transaction committed.
+
+Quizzes with a ``sample_size`` ask each attempt a random selection of
+questions from every difficulty level. The selection is drawn from the
+compiled, id-ordered pool by ``sample_questions`` using the attempt's seed,
+so it is cheap however large the pool, never touches ``ORDER BY RANDOM()``,
+and the same seed always gives the same paper. Likewise quizzes which
+``shuffle_answers`` show each question's choices in an order drawn from the
+seed and the question's id by ``shuffle_choices``, with nothing stored.
+"""
+import random
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import request_finished
+from django.core.urlresolvers import reverse
+from django.db import transaction
+
+from quiz.models import Quiz, Answer
+from quiz.routers import use_primary
+from quiz.scoring import AnswerKey
+
+# Bumped whenever ``CompiledQuiz`` changes, so that papers pickled by older
+# code are never read.
+CACHE_PREFIX = getattr(settings, 'QUIZ_COMPILED_CACHE_PREFIX',
+                       'quiz:compiled:2')
+CACHE_TIMEOUT = getattr(settings, 'QUIZ_COMPILED_CACHE_TIMEOUT', 60 * 60 * 24)
+LRU_SIZE = getattr(settings, 'QUIZ_COMPILED_LRU_SIZE', 100)
+
+
+class CompiledAnswer(object):
+    """A live answer, as offered to quiz takers."""
+
+    def __init__(self, pk, answer, score):
+        self.pk = pk
+        self.answer = answer
+        self.score = score
+
+    def __unicode__(self):
+        return u"%s" % (self.answer,)
+
+
+class CompiledQuestion(object):
+    """A live question along with its live answers, in display order."""
+
+    def __init__(self, pk, question, difficulty, answers):
+        self.pk = pk
+        self.question = question
+        self.difficulty = difficulty
+        self.answers = tuple(answers)
+        self.choices = tuple((a.pk, a.answer) for a in self.answers)
+        self.maximum_score = max([a.score for a in self.answers] or [0])
+
+    def __unicode__(self):
+        return u"%s" % (self.question,)
+
+
+def new_seed():
+    """Returns a seed for a new attempt at a quiz."""
+    return random.SystemRandom().randint(0, 2 ** 31 - 1)
+
+def sample_questions(questions, size, seed, difficulty=None):
+    """Returns ``size`` of ``questions`` chosen at random, in their original
+    order. The same seed always picks the same questions from the same
+    list, and the cost depends on ``size`` rather than on the size of the
+    pool."""
+    if not size or size >= len(questions):
+        return tuple(questions)
+    rng = random.Random(seed * 1000 + (difficulty or 0))
+    indexes = rng.sample(xrange(len(questions)), size)
+    indexes.sort()
+    return tuple([questions[i] for i in indexes])
+
+def shuffle_choices(choices, seed, question_id):
+    """Returns a question's ``(pk, answer)`` choices in an order which only
+    depends on the seed and the question."""
+    choices = list(choices)
+    random.Random(seed * 1000003 + question_id).shuffle(choices)
+    return choices
+
+
+class CompiledQuiz(object):
+    """An immutable snapshot of a quiz at a given revision.
+
+    Stands in for a ``Quiz`` instance wherever the quiz is only read: it has
+    the same ``pk``, ``slug``, ``name``, ``description``, ``status``,
+    ``sample_size`` and ``shuffle_answers`` attributes, ``is_seeded`` and
+    ``get_absolute_url``. Questions are
+    grouped by difficulty and ordered by id, which is the order the wizard
+    presents them in. If the quiz samples its questions, passing an
+    attempt's ``seed`` to the methods below narrows them to the questions
+    that attempt was given.
+    """
+
+    def __init__(self, pk, slug, name, description, status, version,
+                 questions, datetime_modified=None, sample_size=None,
+                 shuffle_answers=False):
+        self.pk = pk
+        self.slug = slug
+        self.name = name
+        self.description = description
+        self.status = status
+        self.version = version
+        self.sample_size = sample_size
+        self.shuffle_answers = shuffle_answers
+        self.questions = tuple(questions)
+        # The latest modification of the quiz or any of its live questions
+        # and answers.
+        self.datetime_modified = datetime_modified
+
+        levels = {}
+        for question in self.questions:
+            levels.setdefault(question.difficulty, []).append(question)
+        self.difficulty_levels = tuple(sorted(levels))
+        self.levels = dict((d, tuple(qs)) for d, qs in levels.items())
+        self.maximum_score = sum(q.maximum_score for q in self.questions)
+        self.answer_key = self.get_answer_key()
+
+    def __unicode__(self):
+        return u"%s" % (self.name,)
+
+    def get_absolute_url(self):
+        return reverse('quiz_detail', kwargs={'slug': self.slug})
+
+    @property
+    def is_sampled(self):
+        return bool(self.sample_size)
+
+    @property
+    def is_seeded(self):
+        return self.is_sampled or self.shuffle_answers
+
+    def get_questions(self, difficulty=None, seed=None):
+        """Returns the questions for a difficulty level, or every question if
+        no difficulty is given."""
+        if seed is None or not self.is_sampled:
+            if difficulty is None:
+                return self.questions
+            return self.levels.get(difficulty, ())
+        if difficulty is None:
+            return tuple([q for d in self.difficulty_levels
+                          for q in self.get_questions(d, seed)])
+        return sample_questions(self.levels.get(difficulty, ()),
+                                self.sample_size, seed, difficulty)
+
+    def get_maximum_score(self, difficulty=None, seed=None):
+        """Returns the maximum score possible for a difficulty level, or for
+        the whole quiz if no difficulty is given."""
+        return sum(q.maximum_score
+                   for q in self.get_questions(difficulty, seed))
+
+    def get_answer_key(self, difficulty=None, seed=None):
+        """Returns an ``AnswerKey`` for a difficulty level, or for the whole
+        quiz if no difficulty is given."""
+        if (difficulty is None and hasattr(self, 'answer_key') and
+            (seed is None or not self.is_sampled)):
+            return self.answer_key
+        key = AnswerKey()
+        for question in self.get_questions(difficulty, seed):
+            key.add_question(question.pk)
+            for answer in question.answers:
+                key.add_answer(question.pk, answer.pk, answer.score)
+        return key
+
+
+class LRUCache(object):
+    """A tiny thread-safe least-recently-used mapping."""
+
+    def __init__(self, size):
+        self.size = size
+        self._data = {}
+        self._order = []
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        self._lock.acquire()
+        try:
+            if key not in self._data:
+                return default
+            self._order.remove(key)
+            self._order.append(key)
+            return self._data[key]
+        finally:
+            self._lock.release()
+
+    def set(self, key, value):
+        self._lock.acquire()
+        try:
+            if key in self._data:
+                self._order.remove(key)
+            self._data[key] = value
+            self._order.append(key)
+            while len(self._order) > self.size:
+                del self._data[self._order.pop(0)]
+        finally:
+            self._lock.release()
+
+    def delete(self, key):
+        self._lock.acquire()
+        try:
+            if key in self._data:
+                del self._data[key]
+                self._order.remove(key)
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._data.clear()
+            del self._order[:]
+        finally:
+            self._lock.release()
+
+local_cache = LRUCache(LRU_SIZE)
+_local = threading.local()
+
+
+def _version_key(pk):
+    return '%s:version:%s' % (CACHE_PREFIX, pk)
+
+def _compiled_key(pk, version):
+    return '%s:quiz:%s:%s' % (CACHE_PREFIX, pk, version)
+
+def _slug_key(slug):
+    return '%s:slug:%s' % (CACHE_PREFIX, slug)
+
+def get_version(pk):
+    """Returns the current revision token for a quiz, creating one if the
+    cache backend has none (e.g. after an eviction)."""
+    version = cache.get(_version_key(pk))
+    if version is None:
+        cache.add(_version_key(pk), uuid.uuid4().hex, CACHE_TIMEOUT)
+        version = cache.get(_version_key(pk))
+    return version
+
+def _bump_versions(pks):
+    for pk in pks:
+        old_version = cache.get(_version_key(pk))
+        if old_version is not None:
+            cache.delete(_compiled_key(pk, old_version))
+        cache.set(_version_key(pk), uuid.uuid4().hex, CACHE_TIMEOUT)
+        local_cache.delete(pk)
+
+def invalidate_compiled_quiz(*pks):
+    """Moves the given quizzes on to a new revision, so their compiled
+    papers are rebuilt on next use. Inside a managed transaction they are
+    moved on again by ``flush_invalidations``, once it has committed."""
+    _bump_versions(pks)
+    if pks and transaction.is_managed():
+        if not hasattr(_local, 'pending'):
+            _local.pending = set()
+        _local.pending.update(pks)
+
+def flush_invalidations(**kwargs):
+    """Moves the quizzes invalidated inside managed transactions on to yet
+    another revision, once transaction management has been left. Connected
+    to ``request_finished``, by which time the transaction middleware has
+    committed; code which manages its own transactions outside a request
+    should call it afterwards."""
+    if transaction.is_managed():
+        return
+    pending = getattr(_local, 'pending', None)
+    _local.pending = set()
+    if pending:
+        _bump_versions(pending)
+
+request_finished.connect(flush_invalidations,
+                         dispatch_uid='quiz.compiled.flush_invalidations')
+
+@use_primary
+def compile_quiz(quiz, version=None):
+    """Builds a ``CompiledQuiz`` from a ``Quiz`` instance. Only live questions
+    and live answers are included."""
+    answers = {}
+    modified = [quiz.datetime_modified]
+    answer_rows = Answer.objects.live.filter(
+        question__quizzes=quiz, question__is_active=True
+    ).order_by('id').values_list(
+        'pk', 'question', 'answer', 'score', 'datetime_modified'
+    )
+    for pk, question_id, answer, score, datetime_modified in answer_rows:
+        answers.setdefault(question_id, []).append(
+            CompiledAnswer(pk, answer, score)
+        )
+        modified.append(datetime_modified)
+
+    question_rows = quiz.questions.live.order_by('id').values_list(
+        'pk', 'question', 'difficulty', 'datetime_modified'
+    )
+    questions = []
+    for pk, question, difficulty, datetime_modified in question_rows:
+        questions.append(
+            CompiledQuestion(pk, question, difficulty, answers.get(pk, ()))
+        )
+        modified.append(datetime_modified)
+    return CompiledQuiz(quiz.pk, quiz.slug, quiz.name, quiz.description,
+                        quiz.status, version, questions,
+                        max([m for m in modified if m is not None] or [None]),
+                        quiz.sample_size, quiz.shuffle_answers)
+
+def _get_cached(pk, version):
+    compiled = local_cache.get(pk)
+    if compiled is not None and compiled.version == version:
+        return compiled
+    compiled = cache.get(_compiled_key(pk, version))
+    if compiled is not None:
+        local_cache.set(pk, compiled)
+    return compiled
+
+def get_compiled_quiz_for(quiz):
+    """Returns the ``CompiledQuiz`` for the current revision of ``quiz``,
+    compiling and caching it if necessary."""
+    version = get_version(quiz.pk)
+    compiled = _get_cached(quiz.pk, version)
+    if compiled is None:
+        compiled = compile_quiz(quiz, version)
+        cache.set(_compiled_key(quiz.pk, version), compiled, CACHE_TIMEOUT)
+        local_cache.set(quiz.pk, compiled)
+    cache.set(_slug_key(quiz.slug), quiz.pk, CACHE_TIMEOUT)
+    return compiled
+
+def get_compiled_quiz(slug):
+    """Returns the ``CompiledQuiz`` for the quiz with the given slug. When the
+    current revision is cached this costs no queries at all.
+
+    Raises ``Quiz.DoesNotExist`` if there is no such quiz."""
+    pk = cache.get(_slug_key(slug))
+    if pk is not None:
+        version = cache.get(_version_key(pk))
+        if version is not None:
+            compiled = _get_cached(pk, version)
+            # A quiz's slug may have changed since the slug was cached.
+            if compiled is not None and compiled.slug == slug:
+                return compiled
+    return get_compiled_quiz_for(Quiz.objects.get(slug=slug))
@@ -0,0 +1,150 @@
+"""Streaming export of quiz results.
+
+Results are read in keyset-paginated chunks - ``WHERE id > <last id> ORDER BY
+id LIMIT <chunk size>`` - as plain values rather than model instances, and the
+answers for each chunk are fetched with one query against the through table
+(or unpacked from the rows, see ``quiz.packing``).
+Nothing outlives its chunk, so memory use is the same for ten thousand
+results as for ten million, and every chunk is an index range scan no matter
+how deep into the table it is.
+
+Archived results (see ``quiz.archive``) are exported along with the live
+ones: ``get_export_querysets`` selects both, and ``export_results`` merges
+them in id order.
+"""
+import csv
+import heapq
+from datetime import datetime, timedelta
+
+from django.utils import simplejson
+from django.utils.encoding import smart_str
+
+from quiz.models import ArchivedResult, QuizResult
+from quiz.packing import get_answer_ids
+from quiz.stats import CHUNK_SIZE
+
+FIELDS = ('id', 'quiz', 'user', 'username', 'email', 'score',
+          'maximum_score', 'datetime_created', 'answers')
+FORMATS = ('csv', 'jsonl')
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+_VALUES = ('pk', 'quiz__slug', 'user', 'user__username', 'email', 'score',
+           'maximum_score', 'datetime_created')
+_DATE_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d')
+
+
+def parse_date(value):
+    """Parses an ``until``/``since`` bound. Returns ``None`` for an empty
+    value and raises ``ValueError`` for a malformed one."""
+    if not value:
+        return None
+    for format in _DATE_FORMATS:
+        try:
+            return datetime.strptime(value, format)
+        except ValueError:
+            pass
+    raise ValueError("'%s' is not a date or date and time." % value)
+
+def get_export_queryset(quiz=None, since=None, until=None, model=QuizResult):
+    """Returns the results of ``model`` to export: optionally only those for
+    ``quiz`` and those created on or after ``since`` and before ``until``. A
+    date (rather than a date and time) ``until`` includes the whole day."""
+    results = model.objects.all()
+    if quiz is not None:
+        results = results.filter(quiz=quiz)
+    if since is not None:
+        results = results.filter(datetime_created__gte=since)
+    if until is not None:
+        if until.time() == datetime.min.time():
+            until += timedelta(days=1)
+        results = results.filter(datetime_created__lt=until)
+    return results
+
+def get_export_querysets(quiz=None, since=None, until=None):
+    """Returns the live and the archived results to export, as
+    ``get_export_queryset``."""
+    return [get_export_queryset(quiz, since, until, model)
+            for model in (QuizResult, ArchivedResult)]
+
+def iter_results(queryset, chunk_size=CHUNK_SIZE):
+    """Yields a dictionary (keyed by ``FIELDS``) per result in ``queryset``
+    of live or archived results, in id order, reading ``chunk_size`` results
+    and their answers at a time."""
+    archived = queryset.model is ArchivedResult
+    queryset = queryset.order_by('pk').values_list(
+        *(_VALUES + (archived and 'answers' or 'packed_answers',)))
+    last_pk = 0
+    while True:
+        rows = list(queryset.filter(pk__gt=last_pk)[:chunk_size])
+        if not rows:
+            return
+        last_pk = rows[-1][0]
+        if archived:
+            answers = dict([(row[0], [int(pk) for pk in row[-1].split(',')
+                                      if pk]) for row in rows])
+        else:
+            answers = get_answer_ids([(row[0], row[-1]) for row in rows])
+        for row in rows:
+            result = dict(zip(FIELDS, row[:-1]))
+            result['answers'] = answers.get(row[0], [])
+            yield result
+        if len(rows) < chunk_size:
+            return
+
+
+class _Echo(object):
+    """A file-like object which hands back whatever is written to it."""
+
+    def write(self, value):
+        return value
+
+
+def _format_date(value):
+    return value and value.strftime('%Y-%m-%dT%H:%M:%S') or ''
+
+def _format_cell(value):
+    if value is None:
+        return ''
+    return smart_str(value)
+
+def as_csv(results, header=True):
+    """Yields the lines of a CSV document for an iterable of results."""
+    writer = csv.writer(_Echo())
+    if header:
+        yield writer.writerow(FIELDS)
+    for result in results:
+        result['datetime_created'] = _format_date(result['datetime_created'])
+        result['answers'] = ' '.join([str(pk) for pk in result['answers']])
+        yield writer.writerow([_format_cell(result[name]) for name in FIELDS])
+
+def as_jsonl(results):
+    """Yields the lines of a JSON Lines document for an iterable of
+    results."""
+    for result in results:
+        result['datetime_created'] = _format_date(result['datetime_created'])
+        yield simplejson.dumps(result, sort_keys=True) + '\n'
+
+def merge_results(querysets, chunk_size=CHUNK_SIZE):
+    """Yields the results of several querysets, as ``iter_results``, merged
+    in id order."""
+    streams = [((result['id'], result) for result in
+                iter_results(queryset, chunk_size))
+               for queryset in querysets]
+    for pk, result in heapq.merge(*streams):
+        yield result
+
+def export_results(querysets, format='csv', chunk_size=CHUNK_SIZE):
+    """Yields a queryset's results, or those of a list of querysets (see
+    ``get_export_querysets``) merged in id order, serialised as ``format``
+    (one of ``FORMATS``), a line at a time."""
+    if hasattr(querysets, 'model'):
+        querysets = [querysets]
+    results = merge_results(querysets, chunk_size)
+    if format == 'csv':
+        return as_csv(results)
+    if format == 'jsonl':
+        return as_jsonl(results)
+    raise ValueError("Unknown export format '%s'." % format)
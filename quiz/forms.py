@@ -1,10 +1,22 @@
 from django import forms
 from django.contrib.auth.models import User
+from django.db.models import Q
+from django.core.urlresolvers import reverse
 from django.forms.formsets import formset_factory, BaseFormSet, INITIAL_FORM_COUNT
-from django.http import HttpResponseRedirect
+from django.http import HttpResponseRedirect, Http404
+from django.utils.datastructures import MultiValueDict
+from django.utils.decorators import method_decorator
 from django.utils.translation import ugettext_lazy as _
+from django.views.decorators.csrf import csrf_protect
 
-from quiz.models import Answer, QuizResult
+from quiz.compiled import (
+    CompiledQuiz, new_seed, sample_questions, shuffle_choices
+)
+from quiz.instrumentation import phase
+from quiz.models import Answer, Question, Quiz, QuizResult
+from quiz.scoring import AnswerKey
+from quiz.submissions import Submission, get_submission_queue
+from quiz.wizard import get_draft_initial, get_wizard_storage
 from wadofstuff.django.forms import BoundFormWizard
 
 
@@ -28,6 +40,38 @@ class EmailForm(forms.Form):
         pass
 
 
+class QuizListForm(forms.Form):
+    """Filters the quiz list by name or description, and by the difficulty
+    levels a quiz must have live questions at."""
+    q = forms.CharField(label=_('Search'), required=False, max_length=100)
+    difficulty = forms.MultipleChoiceField(
+        label=_('Difficulty'), required=False,
+        choices=Question.DIFFICULTY_CHOICES,
+        widget=forms.CheckboxSelectMultiple()
+    )
+
+    def clean_difficulty(self):
+        return [int(d) for d in self.cleaned_data['difficulty']]
+
+    def filter(self, queryset):
+        """Applies the form's filters to a ``Quiz`` queryset."""
+        if not self.is_valid():
+            return queryset
+        search = self.cleaned_data['q'].strip()
+        if search:
+            queryset = queryset.filter(
+                Q(name__icontains=search) | Q(description__icontains=search)
+            )
+        for difficulty in self.cleaned_data['difficulty']:
+            # A subquery per level keeps the quiz rows distinct, and leaves
+            # the ordering to the quiz list index.
+            queryset = queryset.filter(pk__in=Quiz.questions.through.objects
+                .filter(question__difficulty=difficulty,
+                        question__is_active=True)
+                .values('quiz'))
+        return queryset
+
+
 class QuestionForm(forms.Form):
     answers = forms.TypedChoiceField(
         widget=forms.RadioSelect(),
@@ -35,11 +79,12 @@ class QuestionForm(forms.Form):
         label=_("Please select an answer:")
     )
 
-    def __init__(self, question, *args, **kwargs):
+    def __init__(self, question, choices=None, *args, **kwargs):
         super(QuestionForm, self).__init__(*args, **kwargs)
         self.question = question.question
-        answers = question.answers.live
-        self.fields['answers'].choices = question.answers.values_list('pk', 'answer')
+        if choices is None:
+            choices = question.answers.live.values_list('pk', 'answer')
+        self.fields['answers'].choices = choices
 
     @property
     def score(self):
@@ -58,45 +103,115 @@ class QuizBaseFormSet(BaseFormSet):
             val = kwargs.pop(var, None)
             if val:
                 setattr(self, var, val)
+        # Picks this attempt's questions and the order of their answers, if
+        # the quiz samples or shuffles them.
+        self.seed = kwargs.pop('seed', None)
         super(QuizBaseFormSet, self).__init__(*args, **kwargs)
 
+    @property
+    def is_compiled(self):
+        """True if this formset is backed by a cached ``CompiledQuiz`` rather
+        than a ``Quiz`` instance."""
+        return isinstance(self.quiz, CompiledQuiz)
+
+    @phase('choices')
+    def get_questions(self):
+        """Returns the live questions for this formset's difficulty level, in
+        display order. Questions loaded from the database are fetched in one
+        query, have their live answer choices attached by a second, and are
+        remembered for the lifetime of the formset."""
+        if self.is_compiled:
+            return self.quiz.get_questions(getattr(self, 'difficulty', None),
+                                           self.seed)
+        if getattr(self, '_questions', None) is None:
+            questions = self.quiz.questions.live.order_by('id')
+            answers = Answer.objects.live.filter(
+                question__quizzes=self.quiz, question__is_active=True
+            )
+            if hasattr(self, 'difficulty'):
+                questions = questions.filter(difficulty=self.difficulty)
+                answers = answers.filter(question__difficulty=self.difficulty)
+            choices = {}
+            self._questions = list(questions)
+            if self.seed is not None and self.quiz.sample_size:
+                self._questions = list(sample_questions(self._questions,
+                    self.quiz.sample_size, self.seed,
+                    getattr(self, 'difficulty', None)))
+            sampled = set([q.pk for q in self._questions])
+            self._answer_key = AnswerKey(question_ids=[q.pk for q in self._questions])
+            answers = answers.order_by('id').values_list(
+                'pk', 'question', 'answer', 'score'
+            )
+            for pk, question_id, answer, score in answers:
+                if question_id not in sampled:
+                    continue
+                choices.setdefault(question_id, []).append((pk, answer))
+                self._answer_key.add_answer(question_id, pk, score)
+            for question in self._questions:
+                question.choices = choices.get(question.pk, [])
+        return self._questions
+
+    def get_answer_key(self):
+        """Returns the ``AnswerKey`` for this formset's questions. This costs
+        no queries beyond those made to construct the formset."""
+        if self.is_compiled:
+            return self.quiz.get_answer_key(getattr(self, 'difficulty', None),
+                                            self.seed)
+        self.get_questions()
+        return self._answer_key
+
     def initial_form_count(self):
         """Returns the number of forms that are required in this FormSet."""
         if self.data or self.files:
             return self.management_form.cleaned_data[INITIAL_FORM_COUNT]
         else:
-            questions = self.quiz.questions.live
-            if hasattr(self, 'difficulty'):
-                questions = questions.filter(difficulty=self.difficulty)
-            return questions.count()
+            return len(self.get_questions())
+
+    @phase('validation')
+    def full_clean(self):
+        super(QuizBaseFormSet, self).full_clean()
 
+    @phase('formsets')
     def _construct_forms(self):
-        # TODO: Find cleaner way of making this happen.
         self.forms = []
-        questions = self.quiz.questions.live.order_by('id')
-        if hasattr(self, 'difficulty'):
-            questions = questions.filter(difficulty=self.difficulty)
+        questions = self.get_questions()
+        shuffle = (self.seed is not None and
+                   getattr(self.quiz, 'shuffle_answers', False))
         for i in xrange(self.total_form_count()):
-            self.forms.append(self._construct_form(i, question=questions[i]))
+            choices = questions[i].choices
+            if shuffle:
+                choices = shuffle_choices(choices, self.seed, questions[i].pk)
+            self.forms.append(self._construct_form(i,
+                question=questions[i], choices=choices
+            ))
+
+    def get_answer_ids(self):
+        if self.is_valid():
+            return [f.cleaned_data['answers'] for f in self.forms]
 
     def get_answers(self):
         if self.is_valid():
-            answer_ids = [f.cleaned_data['answers'] for f in self.forms]
-            answers = Answer.objects.filter(id__in=answer_ids)
-            return answers
+            return Answer.objects.filter(id__in=self.get_answer_ids())
+
+    def get_score_card(self):
+        """Scores this formset's answers in memory, returning a
+        ``quiz.scoring.ScoreCard``."""
+        if self.is_valid():
+            return self.get_answer_key().score(self.get_answer_ids())
 
     def calculate_score(self):
-        answers = self.get_answers()
-        self.result = answers.score
+        self.result = self.get_score_card().score
         return self.result
 
     @property
     def maximum_score(self):
-        questions = self.quiz.questions.live
-        if hasattr(self, 'difficulty'):
-            questions = questions.filter(difficulty=self.difficulty)
-        relevant_answers = Answer.objects.filter(question__in=questions)
-        return relevant_answers.maximum_score
+        difficulty = getattr(self, 'difficulty', None)
+        if self.is_compiled:
+            return self.quiz.get_maximum_score(difficulty, self.seed)
+        if self.seed is None or not self.quiz.sample_size:
+            # Kept on the quiz by quiz.summaries, so costs no queries.
+            return self.quiz.get_maximum_score(difficulty)
+        return self.get_answer_key().maximum_score
 
 
 def quiz_formset_factory(quiz, form=QuestionForm, formset=QuizBaseFormSet,
@@ -112,29 +227,190 @@ class QuizBoundFormWizard(BoundFormWizard):
     # The BoundFormWizard parent is necessary because the default FormWizard
     # doesn't handle formsets.
 
+    # The POST field holding the attempt id, when state is kept server-side.
+    attempt_field_name = 'wizard_attempt'
+    attempt = storage = seed = None
+
     def get_template(self, step):
         return 'quiz/wizard.html'
 
+    def get_form(self, step, data=None):
+        return self.form_list[step](data,
+            prefix=self.prefix_for_step(step),
+            initial=self.initial.get(step, None),
+            seed=self.seed
+        )
+
+    def get_session_seed(self, request, quiz):
+        """Returns the seed of the taker's current attempt at a quiz which
+        samples its questions or shuffles their answers, kept in the session
+        until the quiz is done."""
+        key = 'quiz:seed:%s' % quiz.pk
+        if key not in request.session:
+            request.session[key] = new_seed()
+        return request.session[key]
+
+    @method_decorator(csrf_protect)
+    def __call__(self, request, *args, **kwargs):
+        storage = get_wizard_storage(request)
+        if storage is None:
+            quiz = kwargs.get('extra_context', {}).get('quiz')
+            if quiz is not None and quiz.is_seeded:
+                self.seed = self.get_session_seed(request, quiz)
+            return super(QuizBoundFormWizard, self).__call__(
+                request, *args, **kwargs)
+        return self.call_with_storage(storage, request, *args, **kwargs)
+
+    def call_with_storage(self, storage, request, *args, **kwargs):
+        """Runs the wizard with the answers to previous steps held in
+        ``storage`` (see ``quiz.wizard``) rather than in hidden fields, so
+        that each POST validates only the current step."""
+        if 'extra_context' in kwargs:
+            self.extra_context.update(kwargs['extra_context'])
+        current_step = self.determine_step(request, *args, **kwargs)
+        self.parse_params(request, *args, **kwargs)
+        if current_step >= self.num_steps():
+            raise Http404('Step %s does not exist' % current_step)
+
+        self.storage, state = storage, None
+        if request.method == 'POST':
+            self.attempt = request.POST.get(self.attempt_field_name)
+            if self.attempt:
+                state = storage.load(self.attempt)
+        elif 'quiz' in self.extra_context:
+            resumed = storage.resume(self.extra_context['quiz'].pk)
+            if resumed is not None:
+                return self.render_resumed(request, *resumed)
+        if state is None:
+            self.attempt, state = storage.start(
+                'quiz' in self.extra_context and
+                self.extra_context['quiz'].pk or None)
+        self.seed = state.get('seed')
+        for i in range(current_step):
+            if i not in state['steps']:
+                # Expired, or never seen: pick up from the missing step.
+                return self.render_hash_failure(request, i)
+
+        if request.method == 'POST':
+            form = self.get_form(current_step, request.POST)
+        else:
+            form = self.get_form(current_step)
+        if form.is_valid():
+            self.process_step(request, form, current_step)
+            prefix = '%s-' % self.prefix_for_step(current_step)
+            for key in request.POST:
+                if key.startswith(prefix):
+                    state['data'][key] = request.POST.getlist(key)
+            if current_step not in state['steps']:
+                state['steps'].append(current_step)
+            next_step = current_step + 1
+
+            num = self.num_steps()
+            if next_step == num:
+                data = MultiValueDict(state['data'])
+                final_form_list = [self.get_form(i, data) for i in range(num)]
+                for i, f in enumerate(final_form_list):
+                    if not f.is_valid():
+                        return self.render_revalidation_failure(request, i, f)
+                response = self.done(request, final_form_list)
+                storage.finish(self.attempt, getattr(self, 'result', None))
+                return response
+            storage.save(self.attempt, state)
+            form = self.get_form(next_step)
+            self.step = current_step = next_step
+
+        return self.render(form, request, current_step)
+
+    def render_resumed(self, request, attempt, state, draft=None):
+        """Picks an unfinished attempt up at its first incomplete step, with
+        any autosaved answers to that step filled in."""
+        self.attempt, self.seed = attempt, state.get('seed')
+        step = 0
+        while step in state['steps'] and step < self.num_steps() - 1:
+            step += 1
+        self.step = step
+        initial = None
+        if draft and draft.get('step') == step:
+            initial = get_draft_initial(draft, self.prefix_for_step(step))
+        if initial:
+            self.initial[step] = initial
+        return self.render(self.get_form(step), request, step)
+
+    def render(self, form, request, step, context=None):
+        if self.attempt is None:
+            return super(QuizBoundFormWizard, self).render(
+                form, request, step, context)
+        context = dict(context or {})
+        context.update({
+            'attempt_field': self.attempt_field_name,
+            'attempt': self.attempt,
+        })
+        if hasattr(self.storage, 'autosave') and 'quiz' in self.extra_context:
+            context['autosave_url'] = reverse('quiz_autosave',
+                kwargs={'slug': self.extra_context['quiz'].slug})
+        return self.render_template(request, form, [], step, context)
+
+    @phase('render')
+    def render_template(self, *args, **kwargs):
+        return super(QuizBoundFormWizard, self).render_template(*args, **kwargs)
+
+    @phase('scoring')
+    def get_score_card(self, formset_list):
+        """Scores every step of the quiz in a single in-memory pass, returning
+        a ``quiz.scoring.ScoreCard``. The card is kept, so the total and
+        maximum scores of the same steps don't score them again."""
+        scored = getattr(self, '_scored', None)
+        if scored is not None and scored[0] is formset_list:
+            return scored[1]
+        answer_key, answer_ids = AnswerKey(), []
+        for formset in formset_list:
+            answer_key.update(formset.get_answer_key())
+            answer_ids.extend(formset.get_answer_ids())
+        score_card = answer_key.score(answer_ids)
+        self._scored = (formset_list, score_card)
+        return score_card
+
     def get_total_score(self, formset_list):
-        return sum(formset.calculate_score() for formset in formset_list)
+        return self.get_score_card(formset_list).score
 
     def get_maximum_score(self, formset_list):
-        return sum(formset.maximum_score for formset in formset_list)
+        return self.get_score_card(formset_list).maximum_score
 
+    @phase('done')
     def done(self, request, formset_list):
-        quiz      = formset_list[0].quiz
-        score     = self.get_total_score(formset_list)
-        max_score = self.get_maximum_score(formset_list)
-        answers   = reduce(lambda x,y: x|y, (fs.get_answers() for fs in formset_list))
+        quiz = formset_list[0].quiz
         if request.user.is_authenticated():
             data = {'user': request.user, 'email': request.user.email}
         else:
             data = {'email': request.session['email']}
-        result = QuizResult.objects.create(
-            quiz=quiz,
-            score=score,
-            maximum_score=max_score,
+        request.session.pop('quiz:seed:%s' % quiz.pk, None)
+
+        queue = get_submission_queue()
+        if queue is not None:
+            return self.enqueue(request, queue, quiz, formset_list, data)
+
+        score_card = self.get_score_card(formset_list)
+        result = QuizResult.objects.record(
+            quiz_id=quiz.pk,
+            score=score_card.score,
+            maximum_score=score_card.maximum_score,
+            answers=score_card.answer_ids,
             **data
         )
-        result.answers.add(*answers)
+        self.result = result
         return HttpResponseRedirect(result.get_absolute_url())
+
+    def enqueue(self, request, queue, quiz, formset_list, data):
+        """Hands the validated answers to a submission queue instead of
+        scoring them now, and redirects to a page which waits for the
+        result. See ``quiz.submissions``."""
+        answer_ids = []
+        for formset in formset_list:
+            answer_ids.extend(formset.get_answer_ids())
+        user = data.get('user')
+        token = queue.put(Submission(quiz.pk, answer_ids,
+            user_id=user and user.pk, email=data['email'], seed=self.seed
+        ))
+        return HttpResponseRedirect(reverse('quiz_pending',
+            kwargs={'slug': quiz.slug, 'token': token}
+        ))
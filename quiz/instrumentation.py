@@ -0,0 +1,290 @@
+"""Opt-in per-request instrumentation for the quiz views.
+
+List the sinks to report to in settings, as dotted paths or ``(dotted path,
+keyword arguments)`` pairs::
+
+    QUIZ_INSTRUMENTATION_SINKS = [
+        'quiz.instrumentation.LogSink',
+        ('quiz.instrumentation.StatsdSink', {'host': 'localhost'}),
+        ('quiz.instrumentation.RingBufferSink', {'size': 500}),
+    ]
+
+Views wrapped with ``instrument`` then record their wall time, their query
+count and database time (whether or not ``DEBUG`` is on), and the time spent
+in each phase wrapped with ``phase``: building formsets, loading answer
+choices, scoring, rendering and so on. The latest measurements held by a
+``RingBufferSink`` are shown to staff by the ``quiz_instrumentation`` view.
+
+With no sinks configured (the default) ``instrument`` and ``phase`` add a
+function call and an attribute lookup, and nothing more.
+"""
+import logging
+import re
+import socket
+import threading
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+from django.utils.importlib import import_module
+
+try:
+    from functools import wraps
+except ImportError: # Python 2.4 fallback.
+    from django.utils.functional import wraps
+
+logger = logging.getLogger('quiz.instrumentation')
+# Anything but these could end a statsd metric name or start another.
+unsafe_re = re.compile(r'[^\w]')
+_state = threading.local()
+
+
+class Recorder(object):
+    """Collects the measurements of a single instrumented request."""
+
+    def __init__(self, name):
+        self.name = name
+        self.tags = {}
+        self.queries = 0
+        self.db_time = 0.0
+        self.phases = {}
+        self.started = time.time()
+
+    def add_query(self, elapsed):
+        self.queries += 1
+        self.db_time += elapsed
+
+    def add_phase(self, name, elapsed):
+        self.phases[name] = self.phases.get(name, 0.0) + elapsed
+
+    def finish(self):
+        """Returns the measurements as a dictionary."""
+        return {
+            'name': self.name,
+            'tags': self.tags,
+            'timestamp': datetime.now(),
+            'time_ms': (time.time() - self.started) * 1000,
+            'queries': self.queries,
+            'db_time_ms': self.db_time * 1000,
+            'phases': dict([(name, elapsed * 1000)
+                            for name, elapsed in self.phases.items()]),
+        }
+
+
+def get_recorder():
+    """Returns the ``Recorder`` for the current thread's instrumented
+    request, if there is one."""
+    return getattr(_state, 'recorder', None)
+
+
+class _TimedCursor(object):
+    """Wraps a database cursor, reporting each statement to a recorder."""
+
+    def __init__(self, cursor, recorder):
+        self.cursor = cursor
+        self.recorder = recorder
+
+    def execute(self, sql, params=()):
+        started = time.time()
+        try:
+            return self.cursor.execute(sql, params)
+        finally:
+            self.recorder.add_query(time.time() - started)
+
+    def executemany(self, sql, param_list):
+        started = time.time()
+        try:
+            return self.cursor.executemany(sql, param_list)
+        finally:
+            self.recorder.add_query(time.time() - started)
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+
+def _wrap_cursors(recorder):
+    # Database connections are thread-local, so this only affects the
+    # current thread.
+    for connection in connections.all():
+        def cursor(original=connection.cursor):
+            return _TimedCursor(original(), recorder)
+        connection.cursor = cursor
+
+def _unwrap_cursors():
+    for connection in connections.all():
+        if 'cursor' in connection.__dict__:
+            del connection.cursor
+
+
+class LogSink(object):
+    """Logs a line per measurement to the ``quiz.instrumentation`` logger."""
+
+    def __init__(self, level=logging.INFO):
+        self.level = level
+
+    def emit(self, measurement):
+        phases = ' '.join(['%s=%.1fms' % item
+                           for item in sorted(measurement['phases'].items())])
+        tags = ' '.join(['%s=%s' % item
+                         for item in sorted(measurement['tags'].items())])
+        logger.log(self.level, '%s %s time=%.1fms queries=%d db=%.1fms %s',
+            measurement['name'], tags, measurement['time_ms'],
+            measurement['queries'], measurement['db_time_ms'], phases)
+
+
+class StatsdSink(object):
+    """Sends each measurement to a statsd server as timers, over UDP."""
+
+    def __init__(self, host='localhost', port=8125, prefix='quiz'):
+        self.address = (host, int(port))
+        self.prefix = prefix
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def get_stats(self, measurement):
+        """Returns the statsd lines for a measurement."""
+        name = '%s.%s' % (self.prefix, measurement['name'])
+        if 'step' in measurement['tags']:
+            name = '%s.step%s' % (name, unsafe_re.sub('_',
+                str(measurement['tags']['step'])))
+        stats = [
+            '%s.time:%.3f|ms' % (name, measurement['time_ms']),
+            '%s.queries:%d|ms' % (name, measurement['queries']),
+            '%s.db_time:%.3f|ms' % (name, measurement['db_time_ms']),
+        ]
+        for phase, elapsed in sorted(measurement['phases'].items()):
+            stats.append('%s.phase.%s:%.3f|ms' % (name, phase, elapsed))
+        return stats
+
+    def send(self, data):
+        try:
+            self.socket.sendto(data, self.address)
+        except socket.error:
+            # Metrics are best effort; never fail a request over them.
+            pass
+
+    def emit(self, measurement):
+        self.send('\n'.join(self.get_stats(measurement)))
+
+
+class LocalStatsdSink(StatsdSink):
+    """A stand-in for ``StatsdSink`` which keeps the packets it would have
+    sent in ``packets``, for development and tests."""
+
+    def __init__(self, prefix='quiz', size=1000):
+        self.prefix = prefix
+        self.size = int(size)
+        self.packets = []
+
+    def send(self, data):
+        self.packets.append(data)
+        del self.packets[:-self.size]
+
+
+class RingBufferSink(object):
+    """Keeps the latest ``size`` measurements in memory, for the
+    ``quiz_instrumentation`` view. Per process, so with several workers each
+    shows only its own requests."""
+
+    def __init__(self, size=200):
+        self.size = int(size)
+        self.measurements = []
+
+    def emit(self, measurement):
+        self.measurements.append(measurement)
+        del self.measurements[:-self.size]
+
+    def latest(self):
+        """Returns the measurements, newest first."""
+        measurements = list(self.measurements)
+        measurements.reverse()
+        return measurements
+
+
+_sinks = {}
+
+def get_sinks(config=None):
+    """Returns the sinks named by ``QUIZ_INSTRUMENTATION_SINKS``, building
+    them on first use."""
+    if config is None:
+        config = getattr(settings, 'QUIZ_INSTRUMENTATION_SINKS', ())
+    if not config:
+        return ()
+    key = repr(config)
+    if key not in _sinks:
+        sinks = []
+        for sink in config:
+            if isinstance(sink, basestring):
+                path, kwargs = sink, {}
+            else:
+                path, kwargs = sink
+            module, attr = path.rsplit('.', 1)
+            try:
+                sinks.append(getattr(import_module(module), attr)(**kwargs))
+            except (ImportError, AttributeError) as e:
+                raise ImproperlyConfigured(
+                    'Error loading quiz instrumentation sink %s: "%s"' %
+                    (path, e))
+        _sinks[key] = sinks
+    return _sinks[key]
+
+def get_ring_buffer():
+    """Returns the first configured ``RingBufferSink``, or ``None``."""
+    for sink in get_sinks():
+        if isinstance(sink, RingBufferSink):
+            return sink
+    return None
+
+
+def instrument(name):
+    """Decorates a view so that each request to it is measured and reported
+    to the configured sinks. Instrumented calls made within another are
+    recorded as phases of it."""
+    def decorator(func):
+        def wrapper(*args, **kwargs):
+            sinks = get_sinks()
+            if not sinks:
+                return func(*args, **kwargs)
+            if get_recorder() is not None:
+                return phase(name)(func)(*args, **kwargs)
+            recorder = _state.recorder = Recorder(name)
+            _wrap_cursors(recorder)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _unwrap_cursors()
+                _state.recorder = None
+                measurement = recorder.finish()
+                for sink in sinks:
+                    try:
+                        sink.emit(measurement)
+                    except Exception:
+                        logger.exception('Quiz instrumentation sink failed.')
+        return wraps(func)(wrapper)
+    return decorator
+
+def phase(name):
+    """Decorates a function so that the time spent in it is recorded as a
+    phase of the current instrumented request, if there is one."""
+    def decorator(func):
+        def wrapper(*args, **kwargs):
+            recorder = get_recorder()
+            if recorder is None:
+                return func(*args, **kwargs)
+            started = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                recorder.add_phase(name, time.time() - started)
+        return wraps(func)(wrapper)
+    return decorator
+
+def tag(name, value):
+    """Tags the current instrumented request, if there is one."""
+    recorder = get_recorder()
+    if recorder is not None:
+        recorder.tags[name] = value
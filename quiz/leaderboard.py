@@ -0,0 +1,132 @@
+"""Materialised quiz leaderboards.
+
+Ranking a result, or placing a score within a quiz's distribution, by
+sorting ``QuizResult`` rows gets slower with every result recorded. Instead
+each quiz keeps a ``ScoreBucket`` per distinct score, counting the results
+which achieved it. The buckets are bumped as batches of results are
+recorded and decremented when results are deleted, and there are only ever
+as many of them as there are possible scores, so ranks and percentiles cost
+one small query however many results there are. Archived results (see
+``quiz.archive``) stay in the buckets, and in the running for ``top``.
+"""
+from django.db import transaction, IntegrityError
+from django.db.models import Count, F
+
+from quiz.instrumentation import phase
+from quiz.models import ArchivedResult, QuizResult, ScoreBucket
+
+
+class Leaderboard(object):
+    """Score distribution, ranks and top results for a single quiz."""
+
+    def __init__(self, quiz):
+        self.quiz_id = getattr(quiz, 'pk', quiz)
+        self._distribution = None
+
+    @phase('leaderboard')
+    def get_distribution(self):
+        """Returns a list of ``(score, count)`` pairs in ascending order of
+        score."""
+        if self._distribution is None:
+            self._distribution = list(ScoreBucket.objects.filter(
+                quiz=self.quiz_id, count__gt=0
+            ).order_by('score').values_list('score', 'count'))
+        return self._distribution
+
+    @property
+    def total(self):
+        """The number of results recorded for the quiz."""
+        return sum(count for score, count in self.get_distribution())
+
+    def count_above(self, score):
+        return sum(c for s, c in self.get_distribution() if s > score)
+
+    def count_below(self, score):
+        return sum(c for s, c in self.get_distribution() if s < score)
+
+    def rank(self, score):
+        """Returns the 1-based rank of a score; equal scores share a rank."""
+        return self.count_above(score) + 1
+
+    def percentile(self, score):
+        """Returns the percentage of results which scored below ``score``, or
+        ``None`` if there are no results."""
+        total = self.total
+        if not total:
+            return None
+        return (float(self.count_below(score)) / total) * 100
+
+    def get_top_queryset(self, n=10, model=QuizResult):
+        """Returns the ``n`` best results of ``model``, earliest first among
+        equals. The distribution tells us the lowest score which can make the
+        cut, so only those results are sorted."""
+        threshold, seen = 0, 0
+        for score, count in reversed(self.get_distribution()):
+            threshold, seen = score, seen + count
+            if seen >= n:
+                break
+        return model.objects.filter(
+            quiz=self.quiz_id, score__gte=threshold
+        ).select_related('user').order_by('-score', 'datetime_created', 'id')[:n]
+
+    def top(self, n=10):
+        """Returns the ``n`` best results, live or archived."""
+        results = []
+        for model in (QuizResult, ArchivedResult):
+            results.extend(self.get_top_queryset(n, model))
+        results.sort(key=lambda r: (-r.score, r.datetime_created, r.pk))
+        return results[:n]
+
+
+def _ensure_buckets(quiz_id, scores):
+    existing = set(ScoreBucket.objects.filter(
+        quiz=quiz_id, score__in=scores).values_list('score', flat=True))
+    for score in set(scores) - existing:
+        # Another process may have created the bucket in the meantime.
+        sid = transaction.savepoint()
+        try:
+            ScoreBucket.objects.create(quiz_id=quiz_id, score=score)
+            transaction.savepoint_commit(sid)
+        except IntegrityError:
+            transaction.savepoint_rollback(sid)
+
+def add_scores(counts):
+    """Adds ``{(quiz id, score): number of results}`` to the score buckets,
+    with one ``UPDATE`` per quiz and distinct amount. Amounts may be
+    negative. The listeners call this as results are saved, so it is left
+    to the caller's transaction to commit."""
+    by_quiz = {}
+    for (quiz_id, score), amount in counts.items():
+        if amount:
+            by_quiz.setdefault(quiz_id, {}).setdefault(amount, []).append(score)
+    for quiz_id, by_amount in by_quiz.items():
+        # Only increments need a bucket: there's nothing to take a result
+        # out of where there is none (say, its quiz is being deleted).
+        _ensure_buckets(quiz_id, [s for amount, ss in by_amount.items()
+                                  if amount > 0 for s in ss])
+        for amount, scores in by_amount.items():
+            buckets = ScoreBucket.objects.filter(quiz=quiz_id, score__in=scores)
+            if amount < 0:
+                buckets = buckets.filter(count__gte=-amount)
+            buckets.update(count=F('count') + amount)
+
+def record_scores(results):
+    """Counts a batch of newly recorded results into their quizzes' score
+    buckets."""
+    counts = {}
+    for result in results:
+        key = (result.quiz_id, result.score)
+        counts[key] = counts.get(key, 0) + 1
+    add_scores(counts)
+
+@transaction.commit_on_success
+def rebuild_leaderboards():
+    """Recomputes every quiz's score buckets from the recorded results, live
+    and archived."""
+    ScoreBucket.objects.all().delete()
+    counts = {}
+    for model in (QuizResult, ArchivedResult):
+        for quiz_id, score, n in model.objects.values_list(
+                'quiz', 'score').annotate(Count('id')).order_by():
+            counts[(quiz_id, score)] = counts.get((quiz_id, score), 0) + n
+    add_scores(counts)
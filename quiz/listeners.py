@@ -1,21 +1,289 @@
+import threading
+
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.core.signals import request_started, request_finished
+from django.db.models.signals import (
+    pre_save, post_save, pre_delete, post_delete, m2m_changed
+)
+
+from quiz.models import Quiz, Question, Answer, QuizResult, ArchivedResult
+# quiz.caching, quiz.compiled, quiz.leaderboard, quiz.relinking, quiz.stats,
+# quiz.summaries and quiz.taken import quiz.models, which imports this
+# module, so they are imported where they're used.
+from quiz.signals import results_recorded
 
-from quiz.models import QuizResult
+# The ids of the quizzes this thread is deleting.
+_deleting = threading.local()
 
 def update_quiz_results(sender, instance, created, **kwargs):
     """When a user registers, check to see if they had any previous quiz
     results under their email-address. If so, modify them so that they now
-    point to this user."""
+    point to this user - straight away, or in batches if
+    ``QUIZ_RELINK_BATCH_SIZE`` is set (see ``quiz.relinking``)."""
     if created:
-        quiz_results = QuizResult.objects.filter(
-            email=instance.email, user=None).update(user=instance)
+        from quiz.relinking import queue_relink
+        queue_relink(instance.pk)
 
 def start_listening():
     """Import this function in a models file and call it to activate the above
     listener."""
+    from quiz.relinking import relink_queue
     post_save.connect(update_quiz_results, sender=User)
+    request_finished.connect(relink_queue.flush)
 
 def stop_listening():
     """Inverse of start_listening."""
+    from quiz.relinking import relink_queue
     post_save.disconnect(update_quiz_results, sender=User)
+    request_finished.disconnect(relink_queue.flush)
+
+def quiz_changed(sender, instance, **kwargs):
+    """Invalidates the compiled paper of a saved or deleted quiz."""
+    from quiz.compiled import invalidate_compiled_quiz
+    invalidate_compiled_quiz(instance.pk)
+
+def question_changed(sender, instance, **kwargs):
+    """Invalidates the compiled papers of every quiz using a saved or deleted
+    question."""
+    from quiz.compiled import invalidate_compiled_quiz
+    invalidate_compiled_quiz(*instance.quizzes.values_list('pk', flat=True))
+
+def answer_changed(sender, instance, **kwargs):
+    """Invalidates the compiled papers of every quiz using the question a
+    saved or deleted answer belongs to."""
+    from quiz.compiled import invalidate_compiled_quiz
+    invalidate_compiled_quiz(*Quiz.objects.filter(
+        questions=instance.question_id).values_list('pk', flat=True))
+
+def quiz_questions_changed(sender, instance, action, reverse, pk_set,
+                           **kwargs):
+    """Invalidates the compiled papers of quizzes whose question set has been
+    altered, from either side of the relation."""
+    from quiz.compiled import invalidate_compiled_quiz
+    if not action.startswith('post_') and action != 'pre_clear':
+        return
+    if not reverse:
+        if action != 'pre_clear':
+            invalidate_compiled_quiz(instance.pk)
+    elif pk_set:
+        invalidate_compiled_quiz(*pk_set)
+    elif action == 'pre_clear':
+        # pk_set isn't provided when clearing, so grab the quizzes first.
+        question_changed(sender, instance)
+
+def quiz_list_changed(sender, instance, action=None, **kwargs):
+    """Marks the cached quiz list as changed when a quiz or question is saved
+    or deleted, or a quiz's questions change - the list can be filtered on
+    the difficulty of each quiz's live questions."""
+    from quiz.caching import mark_changed
+    if action is None or action.startswith('post_'):
+        mark_changed('quiz_list')
+
+def start_invalidating():
+    """Connects the compiled quiz and page cache invalidation listeners.
+    Called from ``quiz.models`` so that cached papers can never outlive an
+    edit."""
+    for model, listener in ((Quiz, quiz_changed),
+                            (Question, question_changed),
+                            (Answer, answer_changed)):
+        post_save.connect(listener, sender=model)
+        pre_delete.connect(listener, sender=model)
+    m2m_changed.connect(quiz_questions_changed, sender=Quiz.questions.through)
+    for model in (Quiz, Question):
+        post_save.connect(quiz_list_changed, sender=model)
+        post_delete.connect(quiz_list_changed, sender=model)
+    m2m_changed.connect(quiz_list_changed, sender=Quiz.questions.through)
+
+def stop_invalidating():
+    """Inverse of start_invalidating."""
+    for model, listener in ((Quiz, quiz_changed),
+                            (Question, question_changed),
+                            (Answer, answer_changed)):
+        post_save.disconnect(listener, sender=model)
+        pre_delete.disconnect(listener, sender=model)
+    m2m_changed.disconnect(quiz_questions_changed,
+                           sender=Quiz.questions.through)
+    for model in (Quiz, Question):
+        post_save.disconnect(quiz_list_changed, sender=model)
+        post_delete.disconnect(quiz_list_changed, sender=model)
+    m2m_changed.disconnect(quiz_list_changed, sender=Quiz.questions.through)
+
+def update_answer_stats(sender, results, **kwargs):
+    """Counts the answers of a batch of newly recorded results into the
+    answer statistics."""
+    from quiz.stats import record_answer_stats
+    record_answer_stats(pk for result in results for pk in result.answer_ids)
+
+def _leaderboards_changed(*quiz_ids):
+    # Results pages show the taker's rank, so they change along with their
+    # quiz's leaderboard.
+    from quiz.caching import mark_changed
+    mark_changed(*['leaderboard:%s' % pk for pk in set(quiz_ids)])
+
+def _count_taken(results, amount=1):
+    from quiz.taken import add_taken_counts
+    counts = {}
+    for result in results:
+        if result.user_id is not None:
+            key = (result.user_id, result.quiz_id)
+            counts[key] = counts.get(key, 0) + amount
+    add_taken_counts(counts)
+
+def update_taken_counts(sender, results, **kwargs):
+    """Counts a batch of newly recorded results into the per-user counts of
+    quizzes taken."""
+    _count_taken(results)
+
+def update_leaderboards(sender, results, **kwargs):
+    """Counts a batch of newly recorded results into the leaderboards."""
+    from quiz.leaderboard import record_scores
+    record_scores(results)
+    _leaderboards_changed(*[result.quiz_id for result in results])
+
+def result_saving(sender, instance, raw=False, **kwargs):
+    # Remember where an existing result was counted, so that an edit can
+    # move it.
+    if instance.pk is not None and not raw:
+        instance._counted_as = tuple(QuizResult.objects.filter(
+            pk=instance.pk).values_list('quiz', 'score')[:1]) or None
+
+def result_saved(sender, instance, created, **kwargs):
+    """Counts results created outside ``QuizResult.objects.record`` (which
+    sends ``results_recorded`` instead) into the leaderboards, and moves an
+    edited result between its quiz's score buckets."""
+    from quiz.leaderboard import add_scores
+    if created and not hasattr(instance, 'answer_ids'):
+        add_scores({(instance.quiz_id, instance.score): 1})
+        _leaderboards_changed(instance.quiz_id)
+        _count_taken([instance])
+    elif not created and getattr(instance, '_counted_as', None):
+        old = instance._counted_as[0]
+        new = (instance.quiz_id, instance.score)
+        del instance._counted_as
+        if old != new:
+            add_scores({old: -1, new: 1})
+            _leaderboards_changed(old[0], new[0])
+
+def quiz_deleting(sender, instance, **kwargs):
+    # The quiz's score buckets go with it, so its results needn't be taken
+    # out of them one by one as they are deleted in turn.
+    _deleting.quiz_ids = getattr(_deleting, 'quiz_ids', set())
+    _deleting.quiz_ids.add(instance.pk)
+
+def quiz_deleted(sender, instance, **kwargs):
+    getattr(_deleting, 'quiz_ids', set()).discard(instance.pk)
+
+def forget_deleting(**kwargs):
+    # A deletion which raised never reached quiz_deleted.
+    _deleting.quiz_ids = set()
+
+def result_deleted(sender, instance, **kwargs):
+    """Removes a deleted result, live or archived, from its quiz's
+    leaderboard and its taker's count of quizzes taken."""
+    from quiz.leaderboard import add_scores
+    if instance.quiz_id not in getattr(_deleting, 'quiz_ids', ()):
+        add_scores({(instance.quiz_id, instance.score): -1})
+        _leaderboards_changed(instance.quiz_id)
+    _count_taken([instance], -1)
+
+def start_counting():
+    """Connects the answer statistics, leaderboard and quizzes taken
+    listeners. Called from ``quiz.models`` so that they see every recorded
+    result."""
+    from quiz.taken import clear_memo
+    results_recorded.connect(update_answer_stats, sender=QuizResult)
+    results_recorded.connect(update_leaderboards, sender=QuizResult)
+    results_recorded.connect(update_taken_counts, sender=QuizResult)
+    pre_save.connect(result_saving, sender=QuizResult)
+    post_save.connect(result_saved, sender=QuizResult)
+    pre_delete.connect(quiz_deleting, sender=Quiz)
+    post_delete.connect(quiz_deleted, sender=Quiz)
+    post_delete.connect(result_deleted, sender=QuizResult)
+    post_delete.connect(result_deleted, sender=ArchivedResult)
+    request_started.connect(clear_memo)
+    request_started.connect(forget_deleting)
+
+def stop_counting():
+    """Inverse of start_counting."""
+    from quiz.taken import clear_memo
+    results_recorded.disconnect(update_answer_stats, sender=QuizResult)
+    results_recorded.disconnect(update_leaderboards, sender=QuizResult)
+    results_recorded.disconnect(update_taken_counts, sender=QuizResult)
+    pre_save.disconnect(result_saving, sender=QuizResult)
+    post_save.disconnect(result_saved, sender=QuizResult)
+    pre_delete.disconnect(quiz_deleting, sender=Quiz)
+    post_delete.disconnect(quiz_deleted, sender=Quiz)
+    post_delete.disconnect(result_deleted, sender=QuizResult)
+    post_delete.disconnect(result_deleted, sender=ArchivedResult)
+    request_started.disconnect(clear_memo)
+    request_started.disconnect(forget_deleting)
+
+def _summarize(*quiz_ids):
+    from quiz.summaries import update_quiz_summaries
+    return update_quiz_summaries(quiz_ids)
+
+def quiz_summary_changed(sender, instance, **kwargs):
+    """Recomputes a saved quiz's summary, which the saved instance may have
+    held a stale copy of."""
+    summary = _summarize(instance.pk).get(instance.pk)
+    if summary is not None:
+        (instance.maximum_score, instance.maximum_scores,
+         instance.answer_key_digest) = summary
+
+def question_summary_changed(sender, instance, **kwargs):
+    """Recomputes the summaries of every quiz using a saved question."""
+    _summarize(*instance.quizzes.values_list('pk', flat=True))
+
+def question_summary_deleting(sender, instance, **kwargs):
+    # The question's quizzes can't be found once it has gone.
+    instance._summary_quiz_ids = list(
+        instance.quizzes.values_list('pk', flat=True))
+
+def question_summary_deleted(sender, instance, **kwargs):
+    """Recomputes the summaries of every quiz a deleted question was in."""
+    _summarize(*getattr(instance, '_summary_quiz_ids', ()))
+
+def answer_summary_changed(sender, instance, **kwargs):
+    """Recomputes the summaries of every quiz using the question a saved or
+    deleted answer belongs to."""
+    _summarize(*Quiz.objects.filter(
+        questions=instance.question_id).values_list('pk', flat=True))
+
+def quiz_questions_summary_changed(sender, instance, action, reverse, pk_set,
+                                   **kwargs):
+    """Recomputes the summaries of quizzes whose question set has been
+    altered, from either side of the relation."""
+    if action == 'pre_clear' and reverse:
+        question_summary_deleting(sender, instance)
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        quiz_summary_changed(sender, instance)
+    elif pk_set:
+        _summarize(*pk_set)
+    elif action == 'post_clear':
+        question_summary_deleted(sender, instance)
+
+def start_summarizing():
+    """Connects the quiz summary listeners. Called from ``quiz.models`` so
+    that the maximum scores and answer key digests kept on each quiz never
+    fall behind an edit."""
+    post_save.connect(quiz_summary_changed, sender=Quiz)
+    post_save.connect(question_summary_changed, sender=Question)
+    pre_delete.connect(question_summary_deleting, sender=Question)
+    post_delete.connect(question_summary_deleted, sender=Question)
+    post_save.connect(answer_summary_changed, sender=Answer)
+    post_delete.connect(answer_summary_changed, sender=Answer)
+    m2m_changed.connect(quiz_questions_summary_changed,
+                        sender=Quiz.questions.through)
+
+def stop_summarizing():
+    """Inverse of start_summarizing."""
+    post_save.disconnect(quiz_summary_changed, sender=Quiz)
+    post_save.disconnect(question_summary_changed, sender=Question)
+    pre_delete.disconnect(question_summary_deleting, sender=Question)
+    post_delete.disconnect(question_summary_deleted, sender=Question)
+    post_save.disconnect(answer_summary_changed, sender=Answer)
+    post_delete.disconnect(answer_summary_changed, sender=Answer)
+    m2m_changed.disconnect(quiz_questions_summary_changed,
+                           sender=Quiz.questions.through)
@@ -0,0 +1,48 @@
+import sys
+from datetime import datetime, timedelta
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand, CommandError
+
+from quiz.archive import BATCH_SIZE, archive_results
+from quiz.export import parse_date
+from quiz.models import Quiz
+
+
+class Command(NoArgsCommand):
+    help = ("Moves quiz results created before a cutoff out of the live "
+            "tables and into the archive.")
+    option_list = NoArgsCommand.option_list + (
+        make_option('--before', dest='before', default=None,
+            help='Archive results created before this date '
+                 '(YYYY-MM-DD[ HH:MM:SS]).'),
+        make_option('--days', dest='days', type='int', default=None,
+            help='Archive results more than this many days old.'),
+        make_option('--quiz', dest='quiz', default=None,
+            help='Slug of the quiz to archive results for. Defaults to all.'),
+        make_option('--batch-size', dest='batch_size', type='int',
+            default=BATCH_SIZE, help='Number of results to move per '
+                                     'transaction.'),
+    )
+
+    def handle_noargs(self, **options):
+        if (options['before'] is None) == (options['days'] is None):
+            raise CommandError("Give one of --before or --days.")
+        try:
+            before = parse_date(options['before'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        if before is None:
+            before = datetime.now() - timedelta(days=options['days'])
+        quiz = None
+        if options['quiz']:
+            try:
+                quiz = Quiz.objects.get(slug=options['quiz'])
+            except Quiz.DoesNotExist:
+                raise CommandError("No quiz with the slug '%s'." %
+                                   options['quiz'])
+
+        archived = archive_results(before, quiz, options['batch_size'])
+        if int(options.get('verbosity', 1)) > 0:
+            sys.stdout.write("Archived %d quiz results created before %s.\n"
+                             % (archived, before))
@@ -0,0 +1,69 @@
+import sys
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand, CommandError
+from django.db import connection
+from django.utils import simplejson
+
+from quiz.benchmarks import data, flow
+
+
+class Command(NoArgsCommand):
+    help = ("Seeds a test database and measures the queries, time and memory "
+            "of every request made while taking a quiz. Exits with an error "
+            "if the run has regressed since --baseline.")
+    option_list = NoArgsCommand.option_list + (
+        make_option('--quizzes', dest='quizzes', type='int', default=1),
+        make_option('--questions', dest='questions', type='int', default=10,
+            help='Questions per difficulty level, per quiz.'),
+        make_option('--answers', dest='answers', type='int', default=4,
+            help='Answers per question.'),
+        make_option('--results', dest='results', type='int', default=1000,
+            help='Historical results to seed.'),
+        make_option('--users', dest='users', type='int', default=100),
+        make_option('--iterations', dest='iterations', type='int', default=5,
+            help='Number of times to take each quiz.'),
+        make_option('--output', dest='output', default=None,
+            help='File to save the results to, as JSON.'),
+        make_option('--baseline', dest='baseline', default=None,
+            help='JSON results of a previous run to compare against.'),
+        make_option('--tolerance', dest='tolerance', type='float',
+            default=0.25,
+            help='Fraction by which a step may slow down before it counts '
+                 'as a regression.'),
+    )
+
+    def handle_noargs(self, **options):
+        baseline = None
+        if options['baseline']:
+            try:
+                baseline = simplejson.load(open(options['baseline']))
+            except (IOError, ValueError) as e:
+                raise CommandError('Unable to read the baseline: %s' % e)
+
+        parameters = dict([(name, options[name]) for name in (
+            'quizzes', 'questions', 'answers', 'results', 'users',
+            'iterations')])
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            quizzes = data.seed(options['quizzes'], options['questions'],
+                options['answers'], options['results'], options['users'])
+            report = flow.make_report(
+                flow.run(quizzes, options['iterations']), **parameters)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if int(options.get('verbosity', 1)) > 0:
+            sys.stdout.write(flow.format_report(report))
+        if options['output']:
+            output = open(options['output'], 'w')
+            try:
+                simplejson.dump(report, output, indent=2, sort_keys=True)
+            finally:
+                output.close()
+        if baseline is not None:
+            regressions = flow.compare(baseline, report, options['tolerance'])
+            if regressions:
+                raise CommandError('Performance regressions:\n%s' %
+                                   '\n'.join(regressions))
@@ -0,0 +1,38 @@
+import sys
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+from django.db import connection
+
+from quiz.benchmarks import data, indexes
+
+
+class Command(NoArgsCommand):
+    help = ("Seeds a test database and compares the query plans and timings "
+            "of the hot quiz queries with and without their indexes.")
+    option_list = NoArgsCommand.option_list + (
+        make_option('--quizzes', dest='quizzes', type='int', default=5),
+        make_option('--questions', dest='questions', type='int', default=20,
+            help='Questions per difficulty level, per quiz.'),
+        make_option('--answers', dest='answers', type='int', default=4,
+            help='Answers per question.'),
+        make_option('--results', dest='results', type='int', default=10000),
+        make_option('--users', dest='users', type='int', default=1000),
+        make_option('--repeat', dest='repeat', type='int', default=20,
+            help='Number of times to run each query; the best is reported.'),
+    )
+
+    def handle_noargs(self, **options):
+        verbosity = int(options.get('verbosity', 1))
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            if verbosity > 0:
+                sys.stdout.write("Seeding %(quizzes)d quizzes, %(results)d "
+                                 "results...\n" % options)
+            quizzes = data.seed(options['quizzes'], options['questions'],
+                options['answers'], options['results'], options['users'])
+            measurements = indexes.run(quizzes[0], options['repeat'])
+            sys.stdout.write(indexes.format_report(measurements))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
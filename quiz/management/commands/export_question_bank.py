@@ -0,0 +1,54 @@
+import sys
+import time
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand, CommandError
+
+from quiz.bank import CHUNK_SIZE, FORMATS, export_bank
+from quiz.models import Quiz
+
+
+class Command(NoArgsCommand):
+    help = ("Exports questions, their answers and their quiz memberships as a "
+            "JSON Lines, CSV or YAML question bank.")
+    option_list = NoArgsCommand.option_list + (
+        make_option('--quiz', dest='quiz', default=None,
+            help='Slug of a quiz to export the questions of. Defaults to '
+                 'every question.'),
+        make_option('--format', dest='format', default='jsonl',
+            choices=FORMATS, help='One of %s.' % ', '.join(FORMATS)),
+        make_option('--chunk-size', dest='chunk_size', type='int',
+            default=CHUNK_SIZE, help='Number of questions to read per query.'),
+        make_option('--output', dest='output', default=None,
+            help='File to write to. Defaults to standard output.'),
+    )
+
+    def handle_noargs(self, **options):
+        questions = None
+        if options['quiz']:
+            try:
+                questions = Quiz.objects.get(slug=options['quiz']).questions.all()
+            except Quiz.DoesNotExist:
+                raise CommandError("No quiz with the slug '%s'." %
+                                   options['quiz'])
+
+        started, count = time.time(), 0
+        if options['output']:
+            output = open(options['output'], 'wb')
+        else:
+            output = sys.stdout
+        try:
+            for chunk in export_bank(questions, options['format'],
+                                     options['chunk_size']):
+                output.write(chunk)
+                count += 1
+        finally:
+            if output is not sys.stdout:
+                output.close()
+
+        # Report on stderr, as stdout may be the export itself.
+        if int(options.get('verbosity', 1)) > 0:
+            elapsed = time.time() - started
+            sys.stderr.write("Exported %d %s in %.2fs (%.0f/s).\n" % (
+                count, options['format'] == 'csv' and 'rows' or 'questions',
+                elapsed, count / max(elapsed, 1e-6)))
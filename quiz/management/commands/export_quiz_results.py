@@ -0,0 +1,57 @@
+import sys
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand, CommandError
+
+from quiz.export import (
+    CHUNK_SIZE, FORMATS, export_results, get_export_querysets, parse_date
+)
+from quiz.models import Quiz
+
+
+class Command(NoArgsCommand):
+    help = ("Streams quiz results out as CSV or JSON Lines, optionally for a "
+            "single quiz or a date range.")
+    option_list = NoArgsCommand.option_list + (
+        make_option('--quiz', dest='quiz', default=None,
+            help='Slug of the quiz to export results for. Defaults to all.'),
+        make_option('--since', dest='since', default=None,
+            help='Only export results created on or after this date '
+                 '(YYYY-MM-DD[ HH:MM:SS]).'),
+        make_option('--until', dest='until', default=None,
+            help='Only export results created up to this date '
+                 '(YYYY-MM-DD[ HH:MM:SS]).'),
+        make_option('--format', dest='format', default='csv',
+            choices=FORMATS, help='One of %s.' % ', '.join(FORMATS)),
+        make_option('--chunk-size', dest='chunk_size', type='int',
+            default=CHUNK_SIZE, help='Number of results to read per query.'),
+        make_option('--output', dest='output', default=None,
+            help='File to write to. Defaults to standard output.'),
+    )
+
+    def handle_noargs(self, **options):
+        quiz = None
+        if options['quiz']:
+            try:
+                quiz = Quiz.objects.get(slug=options['quiz'])
+            except Quiz.DoesNotExist:
+                raise CommandError("No quiz with the slug '%s'." %
+                                   options['quiz'])
+        try:
+            since = parse_date(options['since'])
+            until = parse_date(options['until'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        results = get_export_querysets(quiz, since, until)
+        if options['output']:
+            output = open(options['output'], 'w')
+        else:
+            output = sys.stdout
+        try:
+            for line in export_results(results, options['format'],
+                                       options['chunk_size']):
+                output.write(line)
+        finally:
+            if output is not sys.stdout:
+                output.close()
@@ -0,0 +1,44 @@
+import sys
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.encoding import smart_str
+
+from quiz.bank import CHUNK_SIZE, FORMATS, guess_format, import_bank
+
+
+class Command(BaseCommand):
+    help = ("Imports questions, their answers and their quiz memberships from "
+            "a JSON Lines, CSV or YAML question bank, updating questions and "
+            "answers which already exist.")
+    args = '<path>'
+    option_list = BaseCommand.option_list + (
+        make_option('--format', dest='format', default=None, choices=FORMATS,
+            help='One of %s. Guessed from the file name by default.' %
+                 ', '.join(FORMATS)),
+        make_option('--chunk-size', dest='chunk_size', type='int',
+            default=CHUNK_SIZE,
+            help='Number of questions to validate and write at a time.'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError('Give the path of a single question bank.')
+        path = args[0]
+        format = options['format'] or guess_format(path)
+        if format not in FORMATS:
+            raise CommandError("Can't tell the format of '%s'; use --format."
+                               % path)
+        try:
+            stream = open(path, 'rb')
+        except IOError as e:
+            raise CommandError(str(e))
+        try:
+            report = import_bank(stream, format, options['chunk_size'])
+        finally:
+            stream.close()
+
+        if int(options.get('verbosity', 1)) > 0:
+            for number, error in report.errors:
+                sys.stderr.write(smart_str(u"%s:%s: %s\n" % (path, number, error)))
+            sys.stdout.write(smart_str(report.__unicode__()) + '\n')
@@ -0,0 +1,26 @@
+import sys
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+
+from quiz.packing import BATCH_SIZE, pack_results
+
+
+class Command(NoArgsCommand):
+    help = ("Packs the answers of quiz results recorded before "
+            "QUIZ_RESULT_ANSWER_STORAGE was set to 'packed' or 'both' into "
+            "their rows.")
+    option_list = NoArgsCommand.option_list + (
+        make_option('--delete-rows', action='store_true', dest='delete_rows',
+            default=False, help='Delete the answers table rows of every '
+                                'packed result.'),
+        make_option('--batch-size', dest='batch_size', type='int',
+            default=BATCH_SIZE, help='Number of results to pack per '
+                                     'transaction.'),
+    )
+
+    def handle_noargs(self, **options):
+        packed = pack_results(options['delete_rows'], options['batch_size'])
+        if int(options.get('verbosity', 1)) > 0:
+            sys.stdout.write("Packed the answers of %d quiz results.\n"
+                             % packed)
@@ -0,0 +1,43 @@
+import sys
+import time
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand, CommandError
+
+from quiz.submissions import get_submission_queue, process_submissions
+
+
+class Command(NoArgsCommand):
+    help = ("Scores queued quiz submissions and records their results, in "
+            "batches, until the queue is empty.")
+    option_list = NoArgsCommand.option_list + (
+        make_option('--batch-size', dest='batch_size', type='int', default=100,
+            help='Number of submissions to process per batch.'),
+        make_option('--queue', dest='queue', default=None,
+            help='Dotted path to the queue backend. Defaults to the '
+                 'QUIZ_SUBMISSION_QUEUE setting.'),
+        make_option('--forever', action='store_true', dest='forever',
+            default=False,
+            help='Keep polling the queue rather than exiting once drained.'),
+        make_option('--sleep', dest='sleep', type='float', default=1.0,
+            help='Seconds to wait between polls of an empty queue.'),
+    )
+
+    def handle_noargs(self, **options):
+        queue = get_submission_queue(options['queue'])
+        if queue is None:
+            raise CommandError('No submission queue is configured; set '
+                               'QUIZ_SUBMISSION_QUEUE or pass --queue.')
+        verbosity = int(options.get('verbosity', 1))
+        total = 0
+        while True:
+            processed = process_submissions(queue, options['batch_size'])
+            total += processed
+            if processed and verbosity > 1:
+                sys.stdout.write("Processed %d submissions.\n" % processed)
+            if not processed:
+                if not options['forever']:
+                    break
+                time.sleep(options['sleep'])
+        if verbosity > 0:
+            sys.stdout.write("Processed %d submissions in total.\n" % total)
@@ -0,0 +1,22 @@
+import sys
+
+from django.core.management.base import NoArgsCommand
+
+from quiz.leaderboard import rebuild_leaderboards
+from quiz.models import QuestionStats, AnswerStats, ScoreBucket
+from quiz.stats import rebuild_stats
+
+
+class Command(NoArgsCommand):
+    help = ("Recomputes the question and answer statistics and the quiz "
+            "leaderboards from every recorded quiz result.")
+
+    def handle_noargs(self, **options):
+        rebuild_stats()
+        rebuild_leaderboards()
+        if int(options.get('verbosity', 1)) > 0:
+            sys.stdout.write(
+                "Rebuilt statistics for %d questions and %d answers, and %d "
+                "score buckets.\n" % (QuestionStats.objects.count(),
+                AnswerStats.objects.count(), ScoreBucket.objects.count()
+            ))
@@ -0,0 +1,18 @@
+import sys
+
+from django.core.management.base import NoArgsCommand
+
+from quiz.summaries import update_quiz_summaries
+
+
+class Command(NoArgsCommand):
+    help = ("Recomputes the maximum scores and answer key digest kept on "
+            "every quiz, and rebuilds the compiled paper of each quiz whose "
+            "answer key has changed, e.g. after editing questions or answers "
+            "with raw SQL.")
+
+    def handle_noargs(self, **options):
+        summaries = update_quiz_summaries()
+        if int(options.get('verbosity', 1)) > 0:
+            sys.stdout.write("Rebuilt the summaries of %d quizzes.\n"
+                             % len(summaries))
@@ -0,0 +1,15 @@
+import sys
+
+from django.core.management.base import NoArgsCommand
+
+from quiz.relinking import relink_results
+
+
+class Command(NoArgsCommand):
+    help = ("Gives every result taken under an email address to the user "
+            "registered with it, e.g. after a bulk import of users.")
+
+    def handle_noargs(self, **options):
+        relinked = relink_results()
+        if int(options.get('verbosity', 1)) > 0:
+            sys.stdout.write("Re-linked %d quiz results.\n" % relinked)
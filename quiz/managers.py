@@ -1,7 +1,10 @@
-from django.db import models
+from django.db import models, connections, router, transaction
 from django.db.models import Count, Sum, Max
 from django.db.models.query import QuerySet
 
+from quiz import packing
+from quiz.signals import results_recorded
+
 
 class DRYManager(models.Manager):
     """Will try and use the queryset's methods if it cannot find
@@ -83,3 +86,84 @@ class QuestionManager(DRYManager):
 
     def get_query_set(self):
         return QuestionQuerySet(self.model)
+
+
+class QuizResultManager(DRYManager):
+
+    def record(self, answers=(), **kwargs):
+        """Creates and returns a ``QuizResult`` along with its answers.
+
+        ``answers`` may be ``Answer`` instances or ids; the remaining keyword
+        arguments are passed to the model. The result row and all of its
+        answer rows are written in two statements, in the caller's
+        transaction, rather than going through the many-to-many manager -
+        or, with ``QUIZ_RESULT_ANSWER_STORAGE = 'packed'``, as the one
+        result row.
+        """
+        result = self.model(**kwargs)
+        result.answer_ids = answers
+        self.record_batch([result])
+        return result
+
+    def record_many(self, results, batch_size=500):
+        """Bulk version of ``record`` for importing historical results.
+
+        ``results`` is an iterable of dicts of ``record`` keyword arguments
+        (including ``answers``), which is consumed lazily: each batch of
+        ``batch_size`` results is written and committed in its own
+        transaction. Returns the number of results recorded.
+        """
+        count, batch = 0, []
+        for kwargs in results:
+            kwargs = dict(kwargs)
+            answers = kwargs.pop('answers', ())
+            result = self.model(**kwargs)
+            result.answer_ids = answers
+            batch.append(result)
+            if len(batch) >= batch_size:
+                count += self._commit_batch(batch)
+                batch = []
+        if batch:
+            count += self._commit_batch(batch)
+        return count
+
+    def _commit_batch(self, results):
+        using = router.db_for_write(self.model)
+        return transaction.commit_on_success(using=using)(
+            self.record_batch)(results)
+
+    def record_batch(self, results):
+        """Writes a list of unsaved ``QuizResult`` instances, each with an
+        ``answer_ids`` attribute, leaving the caller to commit them. Returns
+        the number of results recorded."""
+        using = router.db_for_write(self.model)
+        self._insert_batch(results, using)
+        results_recorded.send(sender=self.model, results=results)
+        return len(results)
+
+    def _insert_batch(self, results, using):
+        rows = []
+        for result in results:
+            seen = set()
+            answer_ids = []
+            for answer in result.answer_ids:
+                answer_id = getattr(answer, 'pk', answer)
+                if answer_id not in seen:
+                    seen.add(answer_id)
+                    answer_ids.append(answer_id)
+            result.answer_ids = answer_ids
+            if packing.writes_packed():
+                result.packed_answers = packing.encode_answers(answer_ids)
+            result.save(using=using)
+            if packing.writes_rows():
+                rows.extend((result.pk, answer_id) for answer_id in answer_ids)
+        if rows:
+            field = self.model._meta.get_field('answers')
+            qn = connections[using].ops.quote_name
+            sql = "INSERT INTO %s (%s, %s) VALUES (%%s, %%s)" % (
+                qn(field.m2m_db_table()),
+                qn(field.m2m_column_name()),
+                qn(field.m2m_reverse_name()),
+            )
+            connections[using].cursor().executemany(sql, rows)
+            transaction.commit_unless_managed(using=using)
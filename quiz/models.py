@@ -6,7 +6,8 @@ from django_extensions.db.fields import (
 )
 from threaded_multihost.fields import CreatorField, EditorField
 
-from quiz.managers import QuestionManager, AnswerManager
+from quiz.managers import QuestionManager, AnswerManager, QuizResultManager
+from quiz.packing import get_answer_ids
 
 
 class AuditedModel(models.Model):
@@ -131,6 +132,26 @@ class Quiz(AuditedModel):
     status = models.SmallIntegerField(
         _('status'), choices=STATUS_CHOICES, default=DRAFT
     )
+    sample_size = models.PositiveSmallIntegerField(
+        _('questions per level'), null=True, blank=True, help_text=_(
+            "Ask each quiz taker this many questions from each difficulty "
+            "level, chosen at random. Leave blank to ask every question."
+        )
+    )
+    shuffle_answers = models.BooleanField(_('shuffle answers'), default=False,
+        help_text=_("Show each quiz taker the answers in a different order.")
+    )
+
+    # Summary data, kept up to date by quiz.summaries:
+    maximum_score = models.PositiveIntegerField(_('maximum score'),
+        default=0, editable=False
+    )
+    maximum_scores = models.CharField(_('maximum score per difficulty'),
+        max_length=255, blank=True, editable=False
+    )
+    answer_key_digest = models.CharField(_('answer key digest'),
+        max_length=40, blank=True, editable=False
+    )
 
     # Metadata:
     creator = CreatorField(
@@ -157,6 +178,25 @@ class Quiz(AuditedModel):
     def get_absolute_url(self):
         return ('quiz_detail', [], {'slug': self.slug})
 
+    @property
+    def is_seeded(self):
+        """True if each attempt needs a seed, to sample its questions or
+        shuffle their answers."""
+        return bool(self.sample_size or self.shuffle_answers)
+
+    def get_maximum_scores(self):
+        """Returns a dictionary of the maximum score possible for each
+        difficulty level."""
+        return dict([[int(value) for value in pair.split(':')]
+                     for pair in self.maximum_scores.split(',') if pair])
+
+    def get_maximum_score(self, difficulty=None):
+        """Returns the maximum score possible for a difficulty level, or for
+        the whole quiz if no difficulty is given."""
+        if difficulty is None:
+            return self.maximum_score
+        return self.get_maximum_scores().get(difficulty, 0)
+
 
 class QuizResult(AuditedModel):
     """Stores a snapshot of the quiz results for both users and
@@ -178,6 +218,11 @@ class QuizResult(AuditedModel):
             "the test these may not provide a true reflection of their "
             "actual responses."
     ))
+    packed_answers = models.TextField(_('packed answers'), null=True,
+        blank=True, editable=False, help_text=_(
+            "The ids of the answers provided, packed in the order given by "
+            "quiz.packing. Null if they are only in the answers table."
+    ))
 
     # Snapshot data:
     score = models.PositiveIntegerField(_('score'))
@@ -195,6 +240,8 @@ class QuizResult(AuditedModel):
         limit_choices_to={'is_staff': True}
     )
 
+    objects = QuizResultManager()
+
 
     class Meta(object):
         verbose_name = _('Quiz Result')
@@ -211,3 +258,230 @@ class QuizResult(AuditedModel):
     @models.permalink
     def get_absolute_url(self):
         return ('quiz_completed', [], {'slug': self.quiz.slug, 'pk': self.pk})
+
+    def get_answer_ids(self):
+        return get_answer_ids([(self.pk, self.packed_answers)]).get(
+            self.pk, [])
+
+
+class ArchivedResult(models.Model):
+    """A ``QuizResult`` moved out of the live tables by ``quiz.archive``. It
+    keeps the result's id, so that its URL still works, and packs the
+    answers into a single column rather than a row each."""
+    id = models.IntegerField(_('id'), primary_key=True)
+    quiz = models.ForeignKey(Quiz, verbose_name=_('quiz'),
+        related_name='archived_results'
+    )
+    user = models.ForeignKey(User, verbose_name=_('user'),
+        null=True, blank=True, related_name='archived_quiz_results'
+    )
+    email = models.EmailField(_('email'), blank=True)
+    answers = models.TextField(_('answers'), blank=True,
+        help_text=_("Comma-separated ids of the answers provided.")
+    )
+    score = models.PositiveIntegerField(_('score'))
+    maximum_score = models.PositiveIntegerField(_('maximum score'))
+
+    datetime_created = models.DateTimeField(_('Created'))
+    datetime_modified = models.DateTimeField(_('Last Modified'))
+    datetime_archived = models.DateTimeField(_('Archived'), auto_now_add=True)
+
+
+    class Meta(object):
+        verbose_name = _('Archived Quiz Result')
+        verbose_name_plural = _('Archived Quiz Results')
+        get_latest_by = 'datetime_created'
+
+    def __unicode__(self):
+        username = self.user_id and self.user.username or self.email
+        return u"%s - %s: (%s)" % (
+            username, self.quiz,
+            self.datetime_created.strftime('%d/%m/%Y, %H:%M:%S')
+        )
+
+    @models.permalink
+    def get_absolute_url(self):
+        return ('quiz_completed', [], {'slug': self.quiz.slug, 'pk': self.pk})
+
+    def get_answer_ids(self):
+        return [int(pk) for pk in self.answers.split(',') if pk]
+
+    def set_answer_ids(self, answer_ids):
+        self.answers = ','.join(str(pk) for pk in answer_ids)
+
+
+class QuizSubmission(AuditedModel):
+    """A completed quiz waiting to be scored and turned into a
+    ``QuizResult``. Only used when submissions are queued through
+    ``quiz.submissions.DatabaseQueue``."""
+    PENDING, PROCESSING, DONE, FAILED = 1, 2, 3, 4
+    STATUS_CHOICES = (
+        (PENDING,    _('Pending')),
+        (PROCESSING, _('Processing')),
+        (DONE,       _('Done')),
+        (FAILED,     _('Failed')),
+    )
+
+    quiz = models.ForeignKey(Quiz, verbose_name=_('quiz'),
+        related_name='submissions'
+    )
+    user = models.ForeignKey(User, verbose_name=_('user'),
+        null=True, blank=True, related_name='quiz_submissions'
+    )
+    email = models.EmailField(_('email'), blank=True)
+    answers = models.TextField(_('answers'), blank=True,
+        help_text=_("Comma-separated ids of the answers provided.")
+    )
+    seed = models.IntegerField(_('seed'), null=True, blank=True,
+        help_text=_("Picked the questions asked, if the quiz samples them.")
+    )
+
+    status = models.SmallIntegerField(
+        _('status'), choices=STATUS_CHOICES, default=PENDING, db_index=True
+    )
+    claimed_by = models.CharField(_('claimed by'), max_length=32, blank=True,
+        db_index=True
+    )
+    result = models.ForeignKey(QuizResult, verbose_name=_('result'),
+        null=True, blank=True, related_name='submissions'
+    )
+
+
+    class Meta(object):
+        verbose_name = _('Quiz Submission')
+        verbose_name_plural = _('Quiz Submissions')
+        get_latest_by = 'datetime_created'
+
+    def __unicode__(self):
+        username = self.user_id and self.user.username or self.email
+        return u"%s - %s (%s)" % (
+            username, self.quiz, self.get_status_display()
+        )
+
+    def get_answer_ids(self):
+        return [int(pk) for pk in self.answers.split(',') if pk]
+
+    def set_answer_ids(self, answer_ids):
+        self.answers = ','.join(str(pk) for pk in answer_ids)
+
+
+class QuizAttempt(AuditedModel):
+    """A quiz in progress. Holds the answers to each completed step of the
+    quiz wizard, and a draft of the current step, so that a candidate can
+    pick up where they left off; see ``quiz.attempts``."""
+    IN_PROGRESS, COMPLETED = 1, 2
+    STATUS_CHOICES = (
+        (IN_PROGRESS, _('In progress')),
+        (COMPLETED,   _('Completed')),
+    )
+
+    quiz = models.ForeignKey(Quiz, verbose_name=_('quiz'),
+        related_name='attempts'
+    )
+    user = models.ForeignKey(User, verbose_name=_('user'),
+        null=True, blank=True, related_name='quiz_attempts'
+    )
+    email = models.EmailField(_('email'), blank=True)
+    token = models.CharField(_('token'), max_length=32, unique=True)
+
+    state = models.TextField(_('state'), blank=True,
+        help_text=_("The answers to each completed step, as JSON.")
+    )
+    draft = models.TextField(_('draft'), blank=True,
+        help_text=_("Autosaved answers to the current step, as JSON.")
+    )
+    current_step = models.SmallIntegerField(_('current step'), default=0)
+
+    status = models.SmallIntegerField(
+        _('status'), choices=STATUS_CHOICES, default=IN_PROGRESS
+    )
+    result = models.ForeignKey(QuizResult, verbose_name=_('result'),
+        null=True, blank=True, related_name='attempts'
+    )
+
+
+    class Meta(object):
+        verbose_name = _('Quiz Attempt')
+        verbose_name_plural = _('Quiz Attempts')
+        get_latest_by = 'datetime_created'
+
+    def __unicode__(self):
+        username = self.user_id and self.user.username or self.email
+        return u"%s - %s (%s)" % (
+            username, self.quiz, self.get_status_display()
+        )
+
+
+class QuestionStats(models.Model):
+    """Denormalised counters of how often a question has been answered, and
+    answered correctly. Kept up to date as results are recorded; see
+    ``quiz.stats``."""
+
+    question = models.OneToOneField(Question, verbose_name=_('question'),
+        primary_key=True, related_name='stats'
+    )
+    times_answered = models.PositiveIntegerField(_('times answered'), default=0)
+    times_correct = models.PositiveIntegerField(_('times correct'), default=0)
+
+
+    class Meta(object):
+        verbose_name = _('Question Statistics')
+        verbose_name_plural = _('Question Statistics')
+
+    def __unicode__(self):
+        return u"%s: %s/%s" % (
+            self.question_id, self.times_correct, self.times_answered
+        )
+
+    @property
+    def percent_correct(self):
+        if not self.times_answered:
+            return None
+        return (float(self.times_correct) / self.times_answered) * 100
+
+
+class AnswerStats(models.Model):
+    """Denormalised counter of how often an answer has been chosen. Kept up
+    to date as results are recorded; see ``quiz.stats``."""
+
+    answer = models.OneToOneField(Answer, verbose_name=_('answer'),
+        primary_key=True, related_name='stats'
+    )
+    times_chosen = models.PositiveIntegerField(_('times chosen'), default=0)
+
+
+    class Meta(object):
+        verbose_name = _('Answer Statistics')
+        verbose_name_plural = _('Answer Statistics')
+
+    def __unicode__(self):
+        return u"%s: %s" % (self.answer_id, self.times_chosen)
+
+
+class ScoreBucket(models.Model):
+    """How many results for a quiz achieved a given score. Together a quiz's
+    buckets form its score distribution, from which ranks and percentiles
+    are read without touching ``QuizResult``; see ``quiz.leaderboard``."""
+
+    quiz = models.ForeignKey(Quiz, verbose_name=_('quiz'),
+        related_name='score_buckets'
+    )
+    score = models.PositiveIntegerField(_('score'))
+    count = models.PositiveIntegerField(_('count'), default=0)
+
+
+    class Meta(object):
+        unique_together = (('quiz', 'score'),)
+        verbose_name = _('Score Bucket')
+        verbose_name_plural = _('Score Buckets')
+
+    def __unicode__(self):
+        return u"%s - %s: %s" % (self.quiz_id, self.score, self.count)
+
+# Compiled quiz papers are cached and quiz summaries denormalised, so keep
+# them in step with any edits, and keep the answer statistics and
+# leaderboards in step with recorded results.
+from quiz.listeners import start_invalidating, start_counting, start_summarizing
+start_invalidating()
+start_counting()
+start_summarizing()
@@ -0,0 +1,120 @@
+"""Packed storage of a result's answers.
+
+By default each recorded answer is a row of the ``QuizResult.answers``
+through table, so a 50 question quiz writes 51 rows per result and reading
+one back means a second query. With::
+
+    QUIZ_RESULT_ANSWER_STORAGE = 'packed'
+
+``QuizResult.objects.record`` instead writes the ids of the chosen answers,
+in the order they were given, into the result's own ``packed_answers``
+column: a fixed width, big-endian unsigned 32 bit integer per answer, base64
+encoded so that it fits in a text column on every backend. A result is then
+one row to write and one to read. Like the through table, the column only
+holds the answers chosen; which question each answered is the answer's
+``question``, not its place in the list. ``'both'``
+writes the packed column and the through table rows, for sites moving from
+one to the other; ``'m2m'`` (the default) only the through table.
+
+A result whose ``packed_answers`` is ``NULL`` was recorded before packing,
+and its answers are read from the through table. ``pack_results`` (and the
+``pack_quiz_results`` command) packs them, optionally deleting their through
+table rows.
+"""
+import base64
+import struct
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from quiz.routers import use_primary
+
+STORAGE = getattr(settings, 'QUIZ_RESULT_ANSWER_STORAGE', 'm2m')
+BATCH_SIZE = 500
+# Bytes per answer id.
+WIDTH = 4
+
+
+def writes_packed():
+    return STORAGE in ('packed', 'both')
+
+def writes_rows():
+    return STORAGE in ('m2m', 'both')
+
+def encode_answers(answer_ids):
+    """Packs a sequence of answer ids - or ``Answer`` instances. ``None`` is
+    packed as 0."""
+    answer_ids = [getattr(answer, 'pk', answer) or 0 for answer in answer_ids]
+    data = struct.pack('>%dI' % len(answer_ids), *answer_ids)
+    return base64.b64encode(data).decode('ascii')
+
+def decode_answers(value):
+    """Unpacks ``encode_answers``' output into a list of answer ids, with
+    ``None`` for each 0."""
+    data = base64.b64decode(value)
+    return [pk or None for pk in
+            struct.unpack('>%dI' % (len(data) // WIDTH), data)]
+
+def get_answer_ids(results):
+    """Returns a dictionary mapping the id of each of ``results`` - a list of
+    ``(id, packed_answers)`` pairs - to the ids of its answers, in the order
+    they were given. The through table is only read, in one query, for the
+    results which haven't been packed."""
+    from quiz.models import QuizResult
+    answers, unpacked = {}, []
+    for pk, packed in results:
+        if packed is None:
+            unpacked.append(pk)
+        else:
+            answers[pk] = [answer_id for answer_id in decode_answers(packed)
+                           if answer_id is not None]
+    if unpacked:
+        field = QuizResult._meta.get_field('answers')
+        result_field = field.m2m_field_name()
+        for result_id, answer_id in field.rel.through.objects.filter(**{
+            '%s__in' % result_field: unpacked
+        }).order_by('id').values_list(result_field,
+                                      field.m2m_reverse_field_name()):
+            answers.setdefault(result_id, []).append(answer_id)
+    return answers
+
+def pack_batch(pks, delete_rows=False):
+    """Packs the answers of the results with the given ids which haven't
+    been packed yet, and with ``delete_rows`` deletes the through table rows
+    of all of them. Returns the number of results packed."""
+    from quiz.models import QuizResult
+    unpacked = list(QuizResult.objects.filter(pk__in=pks,
+        packed_answers__isnull=True).values_list('pk', flat=True))
+    answers = get_answer_ids([(pk, None) for pk in unpacked])
+    qn = connection.ops.quote_name
+    opts = QuizResult._meta
+    if unpacked:
+        connection.cursor().executemany('UPDATE %s SET %s = %%s WHERE %s = %%s'
+            % (qn(opts.db_table), qn(opts.get_field('packed_answers').column),
+               qn(opts.pk.column)),
+            [(encode_answers(answers.get(pk, [])), pk) for pk in unpacked])
+    if delete_rows:
+        field = opts.get_field('answers')
+        field.rel.through.objects.filter(**{
+            '%s__in' % field.m2m_field_name(): pks
+        }).delete()
+    transaction.set_dirty()
+    return len(unpacked)
+pack_batch = transaction.commit_on_success(use_primary(pack_batch))
+
+def pack_results(delete_rows=False, batch_size=BATCH_SIZE):
+    """Packs the answers of every result recorded before packing,
+    ``batch_size`` results at a time, each batch in its own transaction.
+    Returns the number of results packed."""
+    from quiz.models import QuizResult
+    results = QuizResult.objects.order_by('id').values_list('pk', flat=True)
+    if not delete_rows:
+        results = results.filter(packed_answers__isnull=True)
+    packed, last_pk = 0, 0
+    while True:
+        pks = list(results.filter(pk__gt=last_pk)[:batch_size])
+        if not pks:
+            return packed
+        last_pk = pks[-1]
+        packed += pack_batch(pks, delete_rows)
+pack_results = use_primary(pack_results)
@@ -0,0 +1,94 @@
+"""Keyset pagination.
+
+Paginating with ``OFFSET`` makes the database walk past every row before the
+requested page, so deep pages get slower the deeper they are. A
+``KeysetPage`` instead remembers where the previous page stopped - the
+``(datetime_created, id)`` of its last row - and asks for the rows beyond
+it, which an index on those columns finds directly. Pages are linked by
+opaque cursors rather than numbered, so every page costs the same as the
+first.
+"""
+from datetime import datetime
+
+from django.db.models import Q
+
+
+def encode_cursor(created, pk):
+    """Returns the cursor for a row, e.g. ``20100101120000000000-42``."""
+    return '%s%06d-%d' % (created.strftime('%Y%m%d%H%M%S'),
+                          created.microsecond, pk)
+
+def decode_cursor(cursor):
+    """Returns the ``(datetime_created, id)`` encoded in a cursor. Raises
+    ``ValueError`` for anything else."""
+    created, pk = str(cursor).split('-', 1)
+    if len(created) != 20 or not created.isdigit():
+        raise ValueError('Invalid cursor: %r' % cursor)
+    return datetime(*[int(created[start:end]) for start, end in (
+        (0, 4), (4, 6), (6, 8), (8, 10), (10, 12), (12, 14), (14, 20))]
+    ), int(pk)
+
+
+class KeysetPage(object):
+    """A page of ``queryset``, newest first, starting after or ending before
+    the row at a cursor. Nothing is fetched until the page is used."""
+
+    def __init__(self, queryset, per_page, after=None, before=None):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.after = after
+        self.before = before
+        self._object_list = None
+
+    def get_queryset(self):
+        """Returns the (unevaluated) query for the page, plus one row to
+        tell whether there are more."""
+        queryset = self.queryset
+        if self.before is not None:
+            created, pk = decode_cursor(self.before)
+            queryset = queryset.filter(
+                Q(datetime_created__gt=created) |
+                Q(datetime_created=created, pk__gt=pk)
+            ).order_by('datetime_created', 'id')
+        else:
+            if self.after is not None:
+                created, pk = decode_cursor(self.after)
+                queryset = queryset.filter(
+                    Q(datetime_created__lt=created) |
+                    Q(datetime_created=created, pk__lt=pk)
+                )
+            queryset = queryset.order_by('-datetime_created', '-id')
+        return queryset[:self.per_page + 1]
+
+    def _fetch(self):
+        rows = list(self.get_queryset())
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if self.before is not None:
+            rows.reverse()
+            self._has_previous, self._has_next = more, True
+        else:
+            self._has_previous, self._has_next = self.after is not None, more
+        self._object_list = rows
+
+    @property
+    def object_list(self):
+        if self._object_list is None:
+            self._fetch()
+        return self._object_list
+
+    def has_next(self):
+        return bool(self.object_list) and self._has_next
+
+    def has_previous(self):
+        return bool(self.object_list) and self._has_previous
+
+    def next_cursor(self):
+        if self.has_next():
+            last = self.object_list[-1]
+            return encode_cursor(last.datetime_created, last.pk)
+
+    def previous_cursor(self):
+        if self.has_previous():
+            first = self.object_list[0]
+            return encode_cursor(first.datetime_created, first.pk)
@@ -0,0 +1,187 @@
+"""Handing results taken under an email address to the user who registers
+with it.
+
+``quiz.listeners.update_quiz_results`` re-links a new user's results as the
+user is saved. Provisioning thousands of users at once (e.g. syncing them
+from a single sign-on directory) would then run an ``UPDATE`` per user, so:
+
+* with ``QUIZ_RELINK_BATCH_SIZE`` set, new users are queued, and their
+  results re-linked by ``relink_results`` with one set-based ``UPDATE`` per
+  batch, once the batch is full, at the end of the request and at exit;
+* bulk importers can wrap their work with ``without_relinking`` (or call
+  ``suspend_relinking`` and ``resume_relinking``) to skip the listener for
+  the current thread altogether, and then call ``relink_results()``, or run
+  the ``relink_quiz_results`` command, to reconcile every result at once.
+
+A result, live or archived, belongs to the earliest user registered with
+its email address, which is who the per-save listener would have given it
+to. Re-linking as a user is saved happens in the transaction saving them,
+so it is rolled back with it; the command and batches flushed at the end of
+a request commit on their own.
+"""
+import atexit
+import threading
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+
+from quiz.models import ArchivedResult, QuizResult
+from quiz.stats import chunked
+
+BATCH_SIZE = getattr(settings, 'QUIZ_RELINK_BATCH_SIZE', 0)
+
+_local = threading.local()
+
+
+def _relink(model, user_ids=None):
+    opts, user_opts = model._meta, User._meta
+    qn = connection.ops.quote_name
+    params = {
+        'result': qn(opts.db_table),
+        'result_user': qn(opts.get_field('user').column),
+        'result_email': qn(opts.get_field('email').column),
+        'result_quiz': qn(opts.get_field('quiz').column),
+        'user': qn(user_opts.db_table),
+        'user_id': qn(user_opts.pk.column),
+        'user_email': qn(user_opts.get_field('email').column),
+        'users': '',
+    }
+    args = []
+    if user_ids is not None:
+        params['users'] = ' AND u.%s IN (%s)' % (
+            params['user_id'], ', '.join(['%s'] * len(user_ids)))
+        args = list(user_ids)
+    cursor = connection.cursor()
+    # The quizzes whose counts of quizzes taken change, for quiz.taken:
+    cursor.execute(
+        'SELECT DISTINCT u.%(user_id)s, r.%(result_quiz)s '
+        'FROM %(result)s r INNER JOIN %(user)s u '
+        'ON u.%(user_email)s = r.%(result_email)s '
+        'WHERE r.%(result_user)s IS NULL '
+        "AND r.%(result_email)s <> ''%(users)s" % params, args)
+    taken = cursor.fetchall()
+    if not taken:
+        return 0, taken
+    # A correlated subquery rather than UPDATE ... FROM, which isn't
+    # portable; the (email, user_id) index finds the rows either way.
+    cursor.execute(
+        'UPDATE %(result)s SET %(result_user)s = ('
+        'SELECT MIN(u.%(user_id)s) FROM %(user)s u '
+        'WHERE u.%(user_email)s = %(result)s.%(result_email)s%(users)s) '
+        'WHERE %(result_user)s IS NULL '
+        'AND %(result_email)s IN ('
+        'SELECT u.%(user_email)s FROM %(user)s u '
+        "WHERE u.%(user_email)s <> ''%(users)s)" % params, args + args)
+    transaction.commit_unless_managed()
+    return cursor.rowcount, taken
+
+def relink(user_ids=None):
+    """Gives every anonymous result to the user registered with its email
+    address, or only to the users in ``user_ids``, using one ``UPDATE`` per
+    table and chunk of users. Returns the number of results re-linked.
+
+    The changes are left in the caller's transaction; ``relink_results``
+    commits them in its own."""
+    from quiz.taken import forget_taken_counts
+    if user_ids is None:
+        chunks = [None]
+    else:
+        chunks = chunked(set(user_ids))
+    relinked = 0
+    for chunk in chunks:
+        quiz_ids = {}
+        for model in (QuizResult, ArchivedResult):
+            count, taken = _relink(model, chunk)
+            relinked += count
+            for user_id, quiz_id in taken:
+                quiz_ids.setdefault(user_id, set()).add(quiz_id)
+        for user_id, ids in quiz_ids.items():
+            forget_taken_counts(user_id, ids)
+    return relinked
+
+def relink_results(user_ids=None):
+    """``relink``, committed on success, for the ``relink_quiz_results``
+    command and for batches flushed outside any request's transaction."""
+    return relink(user_ids)
+relink_results = transaction.commit_on_success(relink_results)
+
+
+class RelinkQueue(object):
+    """Collects the ids of new users and re-links their results in
+    batches."""
+
+    def __init__(self, size=BATCH_SIZE):
+        self.size = size
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, user_id):
+        """Queues a user, re-linking the batch in the transaction which
+        saved them once it is full."""
+        self._lock.acquire()
+        try:
+            self._pending.add(user_id)
+            due = len(self._pending) >= self.size
+        finally:
+            self._lock.release()
+        if due:
+            pending = self.take()
+            if pending:
+                relink(pending)
+
+    def take(self):
+        self._lock.acquire()
+        try:
+            pending, self._pending = self._pending, set()
+        finally:
+            self._lock.release()
+        return pending
+
+    def flush(self, **kwargs):
+        """Re-links the queued users in a transaction of its own. Connected
+        to ``request_finished``, and called at exit."""
+        pending = self.take()
+        if pending:
+            relink_results(pending)
+
+relink_queue = RelinkQueue()
+atexit.register(relink_queue.flush)
+
+
+def suspend_relinking():
+    """Stops re-linking the results of users saved by this thread, until
+    ``resume_relinking`` is called."""
+    _local.suspended = getattr(_local, 'suspended', 0) + 1
+
+def resume_relinking():
+    _local.suspended = max(getattr(_local, 'suspended', 0) - 1, 0)
+
+def is_relinking_suspended():
+    return bool(getattr(_local, 'suspended', 0))
+
+def without_relinking(func):
+    """Decorates a bulk import so that the users it saves don't have their
+    results re-linked one at a time."""
+    def wrapper(*args, **kwargs):
+        suspend_relinking()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            resume_relinking()
+    wrapper.__name__ = func.__name__
+    wrapper.__doc__ = func.__doc__
+    return wrapper
+
+def queue_relink(user_id):
+    """Re-links a new user's results now, in the transaction saving the
+    user, or with the next batch if ``QUIZ_RELINK_BATCH_SIZE`` is set."""
+    if is_relinking_suspended():
+        return
+    if relink_queue.size:
+        relink_queue.add(user_id)
+    else:
+        relink([user_id])
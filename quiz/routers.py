@@ -0,0 +1,127 @@
+"""Sending the quiz app's reads to read replicas.
+
+With::
+
+    DATABASE_ROUTERS = ['quiz.routers.QuizReplicaRouter']
+    QUIZ_REPLICA_DATABASES = ['replica']  # defaults to every other alias
+
+queries for the quiz app's models are read from a randomly chosen replica
+and written to ``QUIZ_PRIMARY_DATABASE`` (``'default'``). Other apps' models
+are left to the next router, or the default database.
+
+Replicas lag behind the primary, so a taker who has just submitted a quiz
+could be redirected to a results page which the replica can't find yet. Any
+write makes the rest of the request read from the primary, and with::
+
+    MIDDLEWARE_CLASSES += ['quiz.routers.ReplicaPinningMiddleware']
+
+(after the session middleware) a request which writes also pins the
+taker's session to the primary for ``QUIZ_REPLICA_PIN_SECONDS``. Work whose
+results are cached under a fresh revision - compiling quiz papers, say - is
+wrapped in ``use_primary``, so that a lagging replica can't be cached as the
+new revision.
+"""
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import request_started
+
+PRIMARY = getattr(settings, 'QUIZ_PRIMARY_DATABASE', 'default')
+REPLICAS = getattr(settings, 'QUIZ_REPLICA_DATABASES', None)
+if REPLICAS is None:
+    REPLICAS = [alias for alias in settings.DATABASES if alias != PRIMARY]
+PIN_SECONDS = getattr(settings, 'QUIZ_REPLICA_PIN_SECONDS', 10)
+SESSION_KEY = 'quiz:pinned_until'
+
+_local = threading.local()
+
+
+def pin_to_primary():
+    """Reads the rest of this thread's queries from the primary, until
+    ``unpin`` is called at the start of the next request."""
+    _local.pinned = True
+
+def unpin(**kwargs):
+    """Connected to ``request_started`` by the router, so that each request
+    starts unpinned."""
+    _local.pinned = _local.written = False
+
+def is_pinned():
+    return (getattr(_local, 'pinned', False) or
+            getattr(_local, 'primary', 0) > 0)
+
+def has_written():
+    """True if this thread has written to the quiz app's models since it was
+    last unpinned."""
+    return getattr(_local, 'written', False)
+
+def use_primary(func):
+    """Decorates a function so that the reads it makes go to the
+    primary."""
+    def wrapper(*args, **kwargs):
+        _local.primary = getattr(_local, 'primary', 0) + 1
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _local.primary -= 1
+    wrapper.__name__ = func.__name__
+    wrapper.__doc__ = func.__doc__
+    return wrapper
+
+
+class QuizReplicaRouter(object):
+    """Reads the quiz app's models from replicas and writes them to the
+    primary."""
+    app_label = 'quiz'
+
+    def __init__(self, primary=None, replicas=None):
+        self.primary = primary or PRIMARY
+        if replicas is None:
+            replicas = REPLICAS
+        self.replicas = list(replicas)
+        request_started.connect(unpin, dispatch_uid='quiz.routers.unpin')
+
+    def is_routed(self, model):
+        return model._meta.app_label == self.app_label
+
+    def db_for_read(self, model, **hints):
+        if not self.is_routed(model) or not self.replicas:
+            return None
+        if is_pinned():
+            return self.primary
+        return random.choice(self.replicas)
+
+    def db_for_write(self, model, **hints):
+        if not self.is_routed(model):
+            return None
+        # Whatever is read next may depend on this write.
+        _local.written = True
+        pin_to_primary()
+        return self.primary
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = [self.primary] + self.replicas
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_syncdb(self, db, model):
+        return None
+
+
+class ReplicaPinningMiddleware(object):
+    """Reads from the primary for ``QUIZ_REPLICA_PIN_SECONDS`` after a
+    request which wrote to the quiz app, for the same session."""
+
+    def process_request(self, request):
+        unpin()
+        if request.session.get(SESSION_KEY, 0) > time.time():
+            pin_to_primary()
+
+    def process_response(self, request, response):
+        if has_written() and hasattr(request, 'session'):
+            request.session[SESSION_KEY] = time.time() + PIN_SECONDS
+        unpin()
+        return response
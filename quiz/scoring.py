@@ -0,0 +1,120 @@
+"""Single-pass, in-memory quiz scoring.
+
+An ``AnswerKey`` maps every question to the best score it can earn and every
+answer to the question it belongs to and the score it is worth. Scoring a
+submission is then a dictionary lookup per submitted answer: no aggregate
+queries, and the resulting ``ScoreCard`` carries a per-question breakdown
+which can be reused for the completion page and for analytics.
+"""
+
+
+class QuestionScore(object):
+    """The outcome of a single question within a submission."""
+
+    def __init__(self, question_id, answer_id, score, maximum_score):
+        self.question_id = question_id
+        self.answer_id = answer_id
+        self.score = score
+        self.maximum_score = maximum_score
+
+    def __repr__(self):
+        return '<QuestionScore: question=%s answer=%s %s/%s>' % (
+            self.question_id, self.answer_id, self.score, self.maximum_score
+        )
+
+    @property
+    def is_answered(self):
+        return self.answer_id is not None
+
+    @property
+    def is_correct(self):
+        return self.maximum_score > 0 and self.score >= self.maximum_score
+
+
+class ScoreCard(object):
+    """The scored result of a submission against an ``AnswerKey``."""
+
+    def __init__(self, questions, unknown_answer_ids=()):
+        self.questions = list(questions)
+        self.unknown_answer_ids = list(unknown_answer_ids)
+        self.score = sum(q.score for q in self.questions)
+        self.maximum_score = sum(q.maximum_score for q in self.questions)
+
+    @property
+    def answer_ids(self):
+        """The known answer ids that were submitted, in question order."""
+        return [q.answer_id for q in self.questions if q.is_answered]
+
+    @property
+    def correct(self):
+        return [q for q in self.questions if q.is_correct]
+
+    @property
+    def incorrect(self):
+        return [q for q in self.questions if q.is_answered and not q.is_correct]
+
+    @property
+    def unanswered(self):
+        return [q for q in self.questions if not q.is_answered]
+
+
+class AnswerKey(object):
+    """Question -> maximum score and answer -> (question, score) mappings for
+    a set of questions, in question order."""
+
+    def __init__(self, rows=(), question_ids=()):
+        self.question_ids = []
+        self.maximum_scores = {}
+        self.answers = {}
+        for question_id in question_ids:
+            self.add_question(question_id)
+        for question_id, answer_id, score in rows:
+            self.add_answer(question_id, answer_id, score)
+
+    def __len__(self):
+        return len(self.question_ids)
+
+    def add_question(self, question_id):
+        if question_id not in self.maximum_scores:
+            self.question_ids.append(question_id)
+            self.maximum_scores[question_id] = 0
+
+    def add_answer(self, question_id, answer_id, score):
+        self.add_question(question_id)
+        self.answers[answer_id] = (question_id, score)
+        if score > self.maximum_scores[question_id]:
+            self.maximum_scores[question_id] = score
+
+    def update(self, other):
+        """Merges the questions and answers of another ``AnswerKey`` into this
+        one."""
+        for question_id in other.question_ids:
+            self.add_question(question_id)
+            if other.maximum_scores[question_id] > self.maximum_scores[question_id]:
+                self.maximum_scores[question_id] = other.maximum_scores[question_id]
+        self.answers.update(other.answers)
+
+    @property
+    def maximum_score(self):
+        return sum(self.maximum_scores.values())
+
+    def score(self, answer_ids):
+        """Scores the given answer ids in a single pass, returning a
+        ``ScoreCard``. Only the first answer given for a question counts, and
+        answers which aren't part of the key score nothing."""
+        chosen, unknown = {}, []
+        for answer_id in answer_ids:
+            try:
+                question_id, score = self.answers[answer_id]
+            except KeyError:
+                unknown.append(answer_id)
+                continue
+            if question_id not in chosen:
+                chosen[question_id] = (answer_id, score)
+        questions = []
+        for question_id in self.question_ids:
+            answer_id, score = chosen.get(question_id, (None, 0))
+            questions.append(QuestionScore(
+                question_id, answer_id, score, self.maximum_scores[question_id]
+            ))
+        return ScoreCard(questions, unknown)
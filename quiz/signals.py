@@ -0,0 +1,6 @@
+from django.dispatch import Signal
+
+# Sent once per batch by ``QuizResult.objects.record`` and ``record_many``,
+# after the results and their answers have been written. Each result carries
+# an ``answer_ids`` attribute listing the answers recorded against it.
+results_recorded = Signal(providing_args=['results'])
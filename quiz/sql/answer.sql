@@ -0,0 +1,2 @@
+-- Live answers for a set of questions: Answer.objects.live.filter(question__in=...)
+CREATE INDEX quiz_answer_live_idx ON quiz_answer (question_id, is_active);
@@ -0,0 +1,6 @@
+-- The quiz_taken template filter, alongside the live results: quiz.taken
+CREATE INDEX quiz_archivedresult_quiz_user_idx ON quiz_archivedresult (quiz_id, user_id);
+-- Re-linking results on registration: quiz.relinking.relink_results
+CREATE INDEX quiz_archivedresult_email_user_idx ON quiz_archivedresult (email, user_id);
+-- Leaderboard(quiz).top(n), alongside the live results
+CREATE INDEX quiz_archivedresult_quiz_score_idx ON quiz_archivedresult (quiz_id, score, datetime_created);
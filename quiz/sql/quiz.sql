@@ -0,0 +1,7 @@
+-- Indexes for the hot query paths. Django runs these when syncdb creates the
+-- table; on an existing database apply them with
+-- ``manage.py sqlcustom quiz | manage.py dbshell``.
+
+-- The quiz list, Quiz.objects.filter(status=Quiz.LIVE), and its keyset
+-- pagination, newest first; see quiz.pagination.
+CREATE INDEX quiz_quiz_list_idx ON quiz_quiz (status, datetime_created, id);
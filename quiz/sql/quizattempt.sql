@@ -0,0 +1,2 @@
+-- Resuming an attempt: filter(quiz=..., email=..., status=IN_PROGRESS)
+CREATE INDEX quiz_quizattempt_resume_idx ON quiz_quizattempt (quiz_id, email, status);
@@ -0,0 +1,8 @@
+-- The quiz_taken template filter: filter(user=..., quiz=...).count()
+CREATE INDEX quiz_quizresult_quiz_user_idx ON quiz_quizresult (quiz_id, user_id);
+-- An anonymous taker's results for a quiz: filter(quiz=..., email=...)
+CREATE INDEX quiz_quizresult_quiz_email_idx ON quiz_quizresult (quiz_id, email);
+-- Re-linking results on registration: quiz.relinking.relink_results
+CREATE INDEX quiz_quizresult_email_user_idx ON quiz_quizresult (email, user_id);
+-- Leaderboard(quiz).top(n): filter(quiz=...).order_by('-score', 'datetime_created')
+CREATE INDEX quiz_quizresult_quiz_score_idx ON quiz_quizresult (quiz_id, score, datetime_created);
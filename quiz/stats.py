@@ -0,0 +1,118 @@
+"""Incrementally maintained answer statistics.
+
+Working out how often an answer is chosen, or a question answered correctly,
+from the ``QuizResult.answers`` table means scanning every result ever
+recorded. Instead, ``QuestionStats`` and ``AnswerStats`` hold running
+counters which are bumped with ``F()`` expressions - one ``UPDATE`` per
+distinct increment rather than one per answer - each time a batch of results
+is recorded. ``rebuild_stats`` (and the ``rebuild_quiz_stats`` command)
+recomputes them from scratch, e.g. after results have been deleted.
+"""
+from django.db import connection, transaction, IntegrityError
+from django.db.models import Count, F
+
+from quiz.models import (
+    Answer, ArchivedResult, QuizResult, QuestionStats, AnswerStats
+)
+from quiz.packing import decode_answers
+
+# Keeps IN clauses below SQLite's limit on query parameters.
+CHUNK_SIZE = 500
+
+
+def chunked(items, size=CHUNK_SIZE):
+    items = list(items)
+    for i in xrange(0, len(items), size):
+        yield items[i:i + size]
+
+def _ensure_rows(model, pks):
+    existing = set()
+    for chunk in chunked(pks):
+        existing.update(
+            model.objects.filter(pk__in=chunk).values_list('pk', flat=True)
+        )
+    for pk in set(pks) - existing:
+        # Another process may have created the row in the meantime.
+        sid = transaction.savepoint()
+        try:
+            model(pk=pk).save(force_insert=True)
+            transaction.savepoint_commit(sid)
+        except IntegrityError:
+            transaction.savepoint_rollback(sid)
+
+def _increment(model, field, counts):
+    if not counts:
+        return
+    _ensure_rows(model, counts.keys())
+    by_amount = {}
+    for pk, amount in counts.items():
+        by_amount.setdefault(amount, []).append(pk)
+    for amount, pks in by_amount.items():
+        for chunk in chunked(pks):
+            model.objects.filter(pk__in=chunk).update(
+                **{field: F(field) + amount}
+            )
+
+def record_answer_counts(counts):
+    """Adds ``{answer id: times chosen}`` to the answer and question
+    counters, in the caller's transaction - the listeners call this as
+    results are recorded."""
+    answered, correct = {}, {}
+    chosen = {}
+    for chunk in chunked(counts.keys()):
+        rows = Answer.objects.filter(pk__in=chunk).values_list(
+            'pk', 'question', 'score'
+        )
+        for pk, question_id, score in rows:
+            amount = counts[pk]
+            chosen[pk] = amount
+            answered[question_id] = answered.get(question_id, 0) + amount
+            if score > Answer.INCORRECT:
+                correct[question_id] = correct.get(question_id, 0) + amount
+    _increment(AnswerStats, 'times_chosen', chosen)
+    _increment(QuestionStats, 'times_answered', answered)
+    _increment(QuestionStats, 'times_correct', correct)
+
+def record_answer_stats(answer_ids):
+    """Counts an iterable of chosen answer ids into the statistics."""
+    counts = {}
+    for pk in answer_ids:
+        counts[pk] = counts.get(pk, 0) + 1
+    record_answer_counts(counts)
+
+@transaction.commit_on_success
+def rebuild_stats():
+    """Recomputes every counter from the recorded results, live and
+    archived."""
+    AnswerStats.objects.all().delete()
+    QuestionStats.objects.all().delete()
+    field = QuizResult._meta.get_field('answers')
+    counts = dict(field.rel.through._default_manager.filter(**{
+        '%s__packed_answers__isnull' % field.m2m_field_name(): True
+    }).values_list('answer').annotate(Count('id')))
+    for packed in QuizResult.objects.filter(packed_answers__isnull=False
+            ).values_list('packed_answers', flat=True).iterator():
+        for pk in decode_answers(packed):
+            if pk is not None:
+                counts[pk] = counts.get(pk, 0) + 1
+    for answers in ArchivedResult.objects.values_list(
+            'answers', flat=True).iterator():
+        for pk in answers.split(','):
+            if pk:
+                counts[int(pk)] = counts.get(int(pk), 0) + 1
+    record_answer_counts(counts)
+
+def stats_select(model, stats_model, fields):
+    """Returns an ``extra(select=...)`` mapping which reads the given counter
+    fields of ``stats_model`` alongside ``model`` rows in the same query, for
+    use in changelists."""
+    qn = connection.ops.quote_name
+    stats_opts = stats_model._meta
+    select = {}
+    for field in fields:
+        select[field] = "SELECT %s FROM %s WHERE %s = %s.%s" % (
+            qn(stats_opts.get_field(field).column), qn(stats_opts.db_table),
+            qn(stats_opts.pk.column), qn(model._meta.db_table),
+            qn(model._meta.pk.column),
+        )
+    return select
@@ -0,0 +1,351 @@
+"""Queued quiz submissions.
+
+By default the final step of the quiz wizard scores the quiz and writes its
+``QuizResult`` during the request. When every candidate of a timed exam
+submits at once those writes pile up, so the wizard can instead hand the
+submission to a queue and redirect to a page which waits for the result::
+
+    QUIZ_SUBMISSION_QUEUE = 'quiz.submissions.DatabaseQueue'
+
+The ``process_quiz_submissions`` management command then drains the queue in
+batches, scoring each submission against its compiled quiz and recording the
+results with ``QuizResult.objects.record_batch``. ``LocalMemoryQueue`` keeps
+everything in-process, which is handy for tests.
+
+A submission which can't be scored is marked as failed. If recording a batch
+raises, its submissions are released back to the queue; and claims older than
+``QUIZ_SUBMISSION_CLAIM_TIMEOUT`` seconds - left by a worker which died
+mid-batch - are put back to be claimed again, so no taker waits forever.
+A batch's results are recorded and its submissions marked done in the same
+transaction, and only while the worker still holds their claim, so a
+submission whose claim timed out is recorded by one worker or the other but
+never both.
+"""
+import copy
+import itertools
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils.importlib import import_module
+
+from quiz.compiled import get_compiled_quiz_for
+from quiz.models import Quiz, QuizResult, QuizSubmission
+
+CLAIM_TIMEOUT = getattr(settings, 'QUIZ_SUBMISSION_CLAIM_TIMEOUT', 5 * 60)
+
+
+class Submission(object):
+    """A validated, unscored quiz submission."""
+
+    def __init__(self, quiz_id, answer_ids, user_id=None, email='', token=None,
+                 seed=None):
+        self.quiz_id = quiz_id
+        self.answer_ids = list(answer_ids)
+        self.user_id = user_id
+        self.email = email
+        self.token = token
+        # Picks the questions which were asked, when the quiz samples them.
+        self.seed = seed
+        # Identifies the worker's claim on the submission, once claimed.
+        self.claim = None
+
+    def __repr__(self):
+        return '<Submission: %s quiz=%s>' % (self.token, self.quiz_id)
+
+
+class BaseQueue(object):
+    """Interface for submission queue backends. Tokens are strings which
+    identify a submission from the moment it is queued."""
+
+    def put(self, submission):
+        """Queues a ``Submission``, returning its token."""
+        raise NotImplementedError
+
+    def get_batch(self, size):
+        """Claims and returns up to ``size`` pending submissions, first
+        returning any claims older than ``CLAIM_TIMEOUT`` to the queue."""
+        raise NotImplementedError
+
+    def release(self, submissions):
+        """Returns claimed submissions to the queue, to be claimed again."""
+        raise NotImplementedError
+
+    def complete(self, submission, result_id):
+        """Marks a claimed submission as recorded under ``result_id``.
+        Returns ``False``, changing nothing, if the claim has been lost."""
+        raise NotImplementedError
+
+    def complete_batch(self, pairs):
+        """Marks ``(submission, result_id)`` pairs as recorded, returning the
+        submissions whose claims have been lost. The caller must then roll
+        back, so the default implementation relies on the queue's writes
+        being transactional."""
+        return [submission for submission, result_id in pairs
+                if not self.complete(submission, result_id)]
+
+    def fail(self, submission):
+        """Marks a claimed submission as unprocessable, unless the claim has
+        been lost."""
+        raise NotImplementedError
+
+    def get_result_id(self, token):
+        """Returns the id of the ``QuizResult`` recorded for a token, or
+        ``None`` if it hasn't been processed yet. Raises ``KeyError`` for
+        unknown or failed submissions."""
+        raise NotImplementedError
+
+
+class DatabaseQueue(BaseQueue):
+    """Stores submissions in the ``QuizSubmission`` table."""
+
+    def put(self, submission):
+        queued = QuizSubmission(quiz_id=submission.quiz_id,
+            user_id=submission.user_id, email=submission.email,
+            seed=submission.seed
+        )
+        queued.set_answer_ids(submission.answer_ids)
+        queued.save()
+        submission.token = str(queued.pk)
+        return submission.token
+
+    def get_batch(self, size):
+        # update() leaves datetime_modified alone, so it's set by hand as the
+        # time of the claim.
+        now = datetime.now()
+        QuizSubmission.objects.filter(status=QuizSubmission.PROCESSING,
+            datetime_modified__lt=now - timedelta(seconds=CLAIM_TIMEOUT)
+        ).update(status=QuizSubmission.PENDING, claimed_by='')
+        # Claim with a conditional UPDATE, so concurrent workers never pick
+        # up the same submission.
+        claim = uuid.uuid4().hex
+        pks = list(QuizSubmission.objects.filter(
+            status=QuizSubmission.PENDING
+        ).order_by('id').values_list('pk', flat=True)[:size])
+        if not pks:
+            return []
+        QuizSubmission.objects.filter(
+            pk__in=pks, status=QuizSubmission.PENDING
+        ).update(status=QuizSubmission.PROCESSING, claimed_by=claim,
+                 datetime_modified=now)
+        batch = []
+        for q in QuizSubmission.objects.filter(claimed_by=claim).order_by('id'):
+            submission = Submission(q.quiz_id, q.get_answer_ids(), q.user_id,
+                                    q.email, str(q.pk), q.seed)
+            submission.claim = claim
+            batch.append(submission)
+        return batch
+
+    def _claimed_rows(self, submission):
+        return QuizSubmission.objects.filter(pk=submission.token,
+            status=QuizSubmission.PROCESSING, claimed_by=submission.claim)
+
+    def release(self, submissions):
+        claims = {}
+        for submission in submissions:
+            claims.setdefault(submission.claim, []).append(submission.token)
+        for claim, tokens in claims.items():
+            QuizSubmission.objects.filter(pk__in=tokens, claimed_by=claim,
+                status=QuizSubmission.PROCESSING
+            ).update(status=QuizSubmission.PENDING, claimed_by='')
+
+    def complete(self, submission, result_id):
+        return bool(self._claimed_rows(submission).update(
+            status=QuizSubmission.DONE, result=result_id
+        ))
+
+    def fail(self, submission):
+        return bool(self._claimed_rows(submission).update(
+            status=QuizSubmission.FAILED
+        ))
+
+    def get_result_id(self, token):
+        try:
+            status, result_id = QuizSubmission.objects.filter(
+                pk=int(token)).values_list('status', 'result')[0]
+        except (ValueError, IndexError):
+            raise KeyError(token)
+        if status == QuizSubmission.FAILED:
+            raise KeyError(token)
+        return result_id
+
+
+class LocalMemoryQueue(BaseQueue):
+    """Keeps submissions in the current process. Not shared between
+    processes, so only suitable for tests and development."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counter = itertools.count(1)
+        self._pending = []
+        self._claimed = {}
+        self._results = {}
+
+    def put(self, submission):
+        self._lock.acquire()
+        try:
+            submission.token = str(next(self._counter))
+            self._pending.append(submission)
+            self._results[submission.token] = None
+        finally:
+            self._lock.release()
+        return submission.token
+
+    def get_batch(self, size):
+        self._lock.acquire()
+        try:
+            now = time.time()
+            stale = [(claimed, submission) for claimed, submission
+                     in self._claimed.values()
+                     if claimed < now - CLAIM_TIMEOUT]
+            for claimed, submission in stale:
+                del self._claimed[submission.token]
+            self._pending[:0] = [submission for claimed, submission
+                                 in sorted(stale, key=lambda pair: pair[0])]
+            batch, self._pending = self._pending[:size], self._pending[size:]
+            # Copies, so that reclaiming a submission leaves the claim held
+            # by the worker it was taken from alone.
+            batch = [copy.copy(submission) for submission in batch]
+            claim = uuid.uuid4().hex
+            for submission in batch:
+                submission.claim = claim
+                self._claimed[submission.token] = (now, submission)
+        finally:
+            self._lock.release()
+        return batch
+
+    def _holds(self, submission):
+        claimed = self._claimed.get(submission.token)
+        return claimed is not None and claimed[1].claim == submission.claim
+
+    def release(self, submissions):
+        self._lock.acquire()
+        try:
+            submissions = [s for s in submissions if self._holds(s)]
+            for submission in submissions:
+                del self._claimed[submission.token]
+            self._pending[:0] = submissions
+        finally:
+            self._lock.release()
+
+    def complete(self, submission, result_id):
+        return not self.complete_batch([(submission, result_id)])
+
+    def complete_batch(self, pairs):
+        # Nothing here is rolled back, so it's all or nothing.
+        self._lock.acquire()
+        try:
+            lost = [s for s, result_id in pairs if not self._holds(s)]
+            if not lost:
+                for submission, result_id in pairs:
+                    del self._claimed[submission.token]
+                    self._results[submission.token] = result_id
+        finally:
+            self._lock.release()
+        return lost
+
+    def fail(self, submission):
+        self._lock.acquire()
+        try:
+            if not self._holds(submission):
+                return False
+            del self._claimed[submission.token]
+            self._results.pop(submission.token, None)
+            return True
+        finally:
+            self._lock.release()
+
+    def get_result_id(self, token):
+        return self._results[token]
+
+
+_queues = {}
+
+def get_submission_queue(path=None):
+    """Returns the queue backend named by ``QUIZ_SUBMISSION_QUEUE``, or
+    ``None`` if submissions are recorded synchronously (the default)."""
+    if path is None:
+        path = getattr(settings, 'QUIZ_SUBMISSION_QUEUE', None)
+    if not path:
+        return None
+    if path not in _queues:
+        module, attr = path.rsplit('.', 1)
+        try:
+            _queues[path] = getattr(import_module(module), attr)()
+        except (ImportError, AttributeError) as e:
+            raise ImproperlyConfigured(
+                'Error loading quiz submission queue %s: "%s"' % (path, e)
+            )
+    return _queues[path]
+
+class ClaimLost(Exception):
+    """Raised to roll back a batch which another worker has reclaimed
+    some of."""
+
+    def __init__(self, submissions):
+        Exception.__init__(self, submissions)
+        self.submissions = submissions
+
+def record_submissions(queue, submissions, results):
+    """Records the results of a batch and marks their submissions done in
+    one transaction, raising ``ClaimLost`` to roll it all back if any of the
+    claims have been lost."""
+    QuizResult.objects.record_batch(results)
+    lost = queue.complete_batch([(submission, result.pk) for submission, result
+                                 in zip(submissions, results)])
+    if lost:
+        raise ClaimLost(lost)
+record_submissions = transaction.commit_on_success(record_submissions)
+
+def process_submissions(queue, batch_size=100):
+    """Claims a batch of submissions from ``queue``, scores them and records
+    their results. Returns the number of submissions processed, which is
+    zero once the queue has been drained.
+
+    A submission which can't be scored is failed. If anything else raises,
+    the batch's other submissions are released back to the queue before the
+    exception propagates. A batch with submissions which have been reclaimed
+    by another worker is left unrecorded and its other submissions
+    released."""
+    submissions = queue.get_batch(batch_size)
+    if not submissions:
+        return 0
+    compiled, results, recorded, failed = {}, [], [], []
+    try:
+        quizzes = Quiz.objects.in_bulk(
+            list(set(s.quiz_id for s in submissions)))
+        for submission in submissions:
+            if submission.quiz_id not in quizzes:
+                queue.fail(submission)
+                failed.append(submission)
+                continue
+            if submission.quiz_id not in compiled:
+                compiled[submission.quiz_id] = get_compiled_quiz_for(
+                    quizzes[submission.quiz_id])
+            try:
+                score_card = compiled[submission.quiz_id].get_answer_key(
+                    seed=submission.seed).score(submission.answer_ids)
+            except Exception:
+                # It would fail the same way however often it was retried.
+                queue.fail(submission)
+                failed.append(submission)
+                continue
+            result = QuizResult(quiz_id=submission.quiz_id,
+                user_id=submission.user_id, email=submission.email,
+                score=score_card.score, maximum_score=score_card.maximum_score
+            )
+            result.answer_ids = score_card.answer_ids
+            results.append(result)
+            recorded.append(submission)
+        if results:
+            record_submissions(queue, recorded, results)
+    except ClaimLost:
+        queue.release([s for s in submissions if s not in failed])
+    except:
+        queue.release([s for s in submissions if s not in failed])
+        raise
+    return len(submissions)
@@ -0,0 +1,84 @@
+"""Denormalised quiz summaries.
+
+Each ``Quiz`` carries the maximum score possible over its live questions, in
+total and per difficulty level, and a digest of its answer key - the id and
+difficulty of each live question with the id and score of each of its live
+answers - so that they are attribute reads rather than a ``GROUP BY`` over
+every answer. ``update_quiz_summaries`` recomputes them with three queries
+per chunk of quizzes, and only writes the quizzes whose summary has changed.
+A quiz whose digest changes has its compiled paper, which carries the answer
+key used for scoring, rebuilt as well, so answers edited with raw SQL stop
+being scored by the old key once the summaries are rebuilt.
+
+``QuizBaseFormSet.maximum_score`` reads the maximum scores rather than
+building an answer key, unless the quiz samples its questions.
+
+The listeners in ``quiz.listeners`` call it whenever a quiz, its questions or
+their answers are saved or deleted, ``quiz.bank`` after an import, and the
+``rebuild_quiz_summaries`` command for everything. For a quiz with a
+``sample_size`` the summary covers the whole pool; what an attempt can score
+is ``CompiledQuiz.get_maximum_score(difficulty, seed)``.
+"""
+try:
+    from hashlib import sha1
+except ImportError:
+    from sha import new as sha1
+
+from quiz.compiled import invalidate_compiled_quiz
+from quiz.models import Answer, Quiz
+from quiz.routers import use_primary
+from quiz.stats import chunked
+
+
+def summarize(questions, answers):
+    """Returns ``(maximum_score, maximum_scores, answer_key_digest)`` for a
+    list of live ``(question id, difficulty)`` pairs and a dictionary of the
+    live ``(answer id, score)`` pairs of each question."""
+    totals, key = {}, []
+    for question_id, difficulty in sorted(questions):
+        choices = sorted(answers.get(question_id, []))
+        totals[difficulty] = totals.get(difficulty, 0) + max(
+            [score for pk, score in choices] or [0])
+        key.append('%s:%s:%s' % (question_id, difficulty, ','.join(
+            ['%s=%s' % choice for choice in choices])))
+    maximum_scores = ','.join(['%s:%s' % (difficulty, totals[difficulty])
+                               for difficulty in sorted(totals)])
+    return (sum(totals.values()), maximum_scores,
+            sha1(';'.join(key)).hexdigest())
+
+def update_quiz_summaries(pks=None):
+    """Recomputes the summaries of the quizzes with the given ids, or of
+    every quiz if ``pks`` is ``None``. Returns a dictionary of the
+    ``summarize`` tuple of each quiz found."""
+    if pks is None:
+        pks = Quiz.objects.values_list('pk', flat=True)
+    through = Quiz.questions.through
+    summaries = {}
+    for chunk in chunked(set(pks)):
+        questions = {}
+        for quiz_id, question_id, difficulty in through.objects.filter(
+                quiz__in=chunk, question__is_active=True).values_list(
+                'quiz', 'question', 'question__difficulty'):
+            questions.setdefault(quiz_id, []).append((question_id, difficulty))
+        answers = {}
+        question_ids = set([question_id for pairs in questions.values()
+                            for question_id, difficulty in pairs])
+        for question_chunk in chunked(question_ids):
+            for question_id, pk, score in Answer.objects.live.filter(
+                    question__in=question_chunk).values_list(
+                    'question', 'pk', 'score'):
+                answers.setdefault(question_id, []).append((pk, score))
+        for pk, maximum_score, maximum_scores, digest in Quiz.objects.filter(
+                pk__in=chunk).values_list('pk', 'maximum_score',
+                'maximum_scores', 'answer_key_digest'):
+            summary = summarize(questions.get(pk, []), answers)
+            summaries[pk] = summary
+            if summary != (maximum_score, maximum_scores, digest):
+                # update() rather than save(), so the quiz's own listeners
+                # and modification time are left alone.
+                Quiz.objects.filter(pk=pk).update(maximum_score=summary[0],
+                    maximum_scores=summary[1], answer_key_digest=summary[2])
+            if summary[2] != digest:
+                invalidate_compiled_quiz(pk)
+    return summaries
+update_quiz_summaries = use_primary(update_quiz_summaries)
@@ -0,0 +1,120 @@
+"""How many times users have taken quizzes, counted in batches.
+
+``get_taken_counts`` counts a user's results for any number of quizzes with
+a single grouped query (over the live and archived results alike), and
+remembers the counts for the rest of the request, so a page which shows
+"taken N times" against every quiz in a list costs one query rather than one
+per quiz. Load the counts up front with
+``preload_taken_counts`` (or the ``{% preload_quiz_taken %}`` tag) and the
+``quiz_taken`` filter will use them.
+
+With ``QUIZ_TAKEN_CACHE_TIMEOUT`` set to a number of seconds the counts are
+also kept as per-user counters in the cache, which the listeners in
+``quiz.listeners`` bump as results are recorded and deleted.
+"""
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, router
+
+from quiz.models import ArchivedResult, QuizResult
+
+CACHE_PREFIX = getattr(settings, 'QUIZ_TAKEN_CACHE_PREFIX', 'quiz:taken')
+CACHE_TIMEOUT = getattr(settings, 'QUIZ_TAKEN_CACHE_TIMEOUT', 0)
+
+_local = threading.local()
+
+
+def _get_memo():
+    if not hasattr(_local, 'counts'):
+        _local.counts = {}
+    return _local.counts
+
+def clear_memo(**kwargs):
+    """Forgets the counts remembered by this thread. Connected to
+    ``request_started``, so each request starts afresh."""
+    _local.counts = {}
+
+def _key(user_id, quiz_id):
+    return '%s:%s:%s' % (CACHE_PREFIX, user_id, quiz_id)
+
+
+def count_results(user_id, quiz_ids):
+    """Returns ``{quiz id: number of results}`` for a user's live and
+    archived results, leaving out quizzes without any."""
+    models = (QuizResult, ArchivedResult)
+    connection = connections[router.db_for_read(QuizResult)]
+    qn = connection.ops.quote_name
+    selects = []
+    for model in models:
+        opts = model._meta
+        quiz = qn(opts.get_field('quiz').column)
+        selects.append('SELECT %s AS quiz_id FROM %s WHERE %s = %%s '
+                       'AND %s IN (%s)' % (quiz, qn(opts.db_table),
+            qn(opts.get_field('user').column), quiz,
+            ', '.join(['%s'] * len(quiz_ids))))
+    cursor = connection.cursor()
+    cursor.execute('SELECT quiz_id, COUNT(*) FROM (%s) results '
+                   'GROUP BY quiz_id' % ' UNION ALL '.join(selects),
+                   ([user_id] + list(quiz_ids)) * len(models))
+    return dict(cursor.fetchall())
+
+def get_taken_counts(user_id, quiz_ids):
+    """Returns ``{quiz id: number of results}`` for a user, counting any not
+    already remembered or cached with a single query."""
+    memo = _get_memo()
+    missing = [pk for pk in quiz_ids if (user_id, pk) not in memo]
+    if missing and CACHE_TIMEOUT:
+        cached = cache.get_many([_key(user_id, pk) for pk in missing])
+        for pk in missing:
+            if _key(user_id, pk) in cached:
+                memo[(user_id, pk)] = cached[_key(user_id, pk)]
+        missing = [pk for pk in missing if (user_id, pk) not in memo]
+    if missing:
+        counts = count_results(user_id, missing)
+        for pk in missing:
+            memo[(user_id, pk)] = counts.get(pk, 0)
+        if CACHE_TIMEOUT:
+            cache.set_many(dict([(_key(user_id, pk), memo[(user_id, pk)])
+                                 for pk in missing]), CACHE_TIMEOUT)
+    return dict([(pk, memo[(user_id, pk)]) for pk in quiz_ids])
+
+def preload_taken_counts(user, quizzes):
+    """Counts a user's results for every quiz in ``quizzes`` (instances or
+    ids) in one go, so that ``quiz_taken`` needn't query for each."""
+    if user is None or not user.is_authenticated():
+        return {}
+    return get_taken_counts(user.pk,
+                            [getattr(quiz, 'pk', quiz) for quiz in quizzes])
+
+def get_taken_count(user_id, quiz_id):
+    return get_taken_counts(user_id, [quiz_id])[quiz_id]
+
+
+def add_taken_counts(counts):
+    """Adds ``{(user id, quiz id): number of results}`` to the counts,
+    remembered and cached. Amounts may be negative."""
+    memo = _get_memo()
+    for (user_id, quiz_id), amount in counts.items():
+        memo.pop((user_id, quiz_id), None)
+        if not CACHE_TIMEOUT or not amount:
+            continue
+        try:
+            if amount > 0:
+                cache.incr(_key(user_id, quiz_id), amount)
+            else:
+                cache.decr(_key(user_id, quiz_id), -amount)
+        except ValueError:
+            # Not cached, so it will be counted afresh.
+            pass
+
+def forget_taken_counts(user_id, quiz_ids):
+    """Drops remembered and cached counts, e.g. when results are moved to a
+    user."""
+    memo = _get_memo()
+    for pk in quiz_ids:
+        memo.pop((user_id, pk), None)
+    if CACHE_TIMEOUT:
+        for pk in quiz_ids:
+            cache.delete(_key(user_id, pk))
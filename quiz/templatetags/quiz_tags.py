@@ -1,7 +1,11 @@
 from django import template
+from django.core.cache import cache
 
 from django.contrib.auth.models import User
-from quiz.models import QuizResult, Quiz
+from quiz import caching
+from quiz.compiled import CompiledQuiz
+from quiz.models import Quiz
+from quiz.taken import get_taken_count, preload_taken_counts
 
 register = template.Library()
 
@@ -17,6 +21,54 @@ def quiz_taken(user, quiz):
     """Returns the amount of times the user has taken the specified quiz. Can
     also be used as a simple boolean."""
     if (not isinstance(user, User) or
-        not isinstance(quiz, Quiz)):
+        not isinstance(quiz, (Quiz, CompiledQuiz))):
         return ''
-    return QuizResult.objects.filter(user=user, quiz=quiz).count()
+    return get_taken_count(user.pk, quiz.pk)
+
+@register.simple_tag
+def preload_quiz_taken(user, quizzes):
+    """Counts how many times the user has taken each of ``quizzes`` with a
+    single query, so that ``quiz_taken`` needn't query for each of them::
+
+        {% preload_quiz_taken user page.object_list %}
+    """
+    if isinstance(user, User):
+        preload_taken_counts(user, quizzes)
+    return ''
+
+
+class QuizCacheNode(template.Node):
+    def __init__(self, nodelist, name, vary_on):
+        self.nodelist = nodelist
+        self.name = name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        if not caching.FRAGMENT_TIMEOUT:
+            return self.nodelist.render(context)
+        key = caching.get_fragment_key(self.name,
+            [var.resolve(context) for var in self.vary_on])
+        value = cache.get(key)
+        if value is None:
+            value = self.nodelist.render(context)
+            cache.set(key, value, caching.FRAGMENT_TIMEOUT)
+        return value
+
+@register.tag(name='quiz_cache')
+def do_quiz_cache(parser, token):
+    """Caches a template fragment for ``QUIZ_FRAGMENT_CACHE_TIMEOUT`` seconds,
+    or until the listeners in ``quiz.listeners`` mark it as changed::
+
+        {% quiz_cache quiz_list [var1] [var2] ... %}
+        ...
+        {% endquiz_cache %}
+
+    Does nothing unless ``QUIZ_FRAGMENT_CACHE_TIMEOUT`` is set."""
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(
+            "'%s' tag requires at least 1 argument." % bits[0])
+    nodelist = parser.parse(('endquiz_cache',))
+    parser.delete_first_token()
+    return QuizCacheNode(nodelist, bits[1],
+                         [parser.compile_filter(bit) for bit in bits[2:]])
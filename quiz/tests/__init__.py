@@ -1,5 +1,27 @@
 from quiz.tests.models import *
+from quiz.tests.api import *
+from quiz.tests.archive import *
+from quiz.tests.attempts import *
+from quiz.tests.bank import *
+from quiz.tests.benchmarks import *
+from quiz.tests.caching import *
+from quiz.tests.compiled import *
+from quiz.tests.export import *
+from quiz.tests.forms import *
+from quiz.tests.instrumentation import *
+from quiz.tests.leaderboard import *
 from quiz.tests.listeners import *
+from quiz.tests.packing import *
+from quiz.tests.pagination import *
+from quiz.tests.relinking import *
+from quiz.tests.routers import *
+from quiz.tests.sampling import *
+from quiz.tests.scoring import *
+from quiz.tests.stats import *
+from quiz.tests.submissions import *
+from quiz.tests.summaries import *
+from quiz.tests.taken import *
 from quiz.tests.templatetags import *
 from quiz.tests.utils import *
 from quiz.tests.views import *
+from quiz.tests.wizard import *
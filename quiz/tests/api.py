@@ -0,0 +1,154 @@
+from django.conf import settings
+from django.core.urlresolvers import resolve, reverse
+from django.utils import simplejson
+from nose.tools import *
+
+from quiz import views
+from quiz.models import Answer, Question, Quiz, QuizResult, QuizSubmission
+from quiz.tests.base import QueryCountTestCase
+
+
+class TestQuizPaper(QueryCountTestCase):
+    fixtures = ['python-zen.yaml']
+    # 1 quiz, 9 questions, 26 answers, 9 correct answers (one per question)
+
+    def setUp(self):
+        super(TestQuizPaper, self).setUp()
+        self.quiz = Quiz.objects.get(slug='python-zen')
+        self.url = reverse('quiz_api_paper', args=['python-zen'])
+
+    def test_paper(self):
+        response = self.client.get(self.url)
+        assert_equal(200, response.status_code)
+        assert_equal('application/json', response['Content-Type'])
+        paper = simplejson.loads(response.content)
+        assert_equal('python-zen', paper['slug'])
+        assert_equal(reverse('quiz_api_submit', args=['python-zen']),
+                     paper['submit_url'])
+        assert_equal([1, 10, 20], [l['difficulty'] for l in paper['levels']])
+        assert_equal([4, 3, 2], [len(l['questions']) for l in paper['levels']])
+        question = paper['levels'][1]['questions'][0]
+        assert_equal([13, 14, 15], [a['id'] for a in question['answers']])
+        # Nothing gives the correct answers away:
+        assert_false('score' in response.content)
+        assert_false('correct' in response.content)
+
+    def test_api_leaves_slugs_free(self):
+        for name, view in (('quiz_detail', views.quiz_detail),
+                           ('quiz_autosave', views.quiz_autosave)):
+            assert_equal(view, resolve(reverse(name, args=['api']))[0])
+
+    def test_repeat_fetches_are_not_modified(self):
+        response = self.client.get(self.url)
+        etag = response['ETag']
+        assert_true(response['Last-Modified'])
+        response = self.assertNumQueries(0, self.client.get, self.url,
+                                         HTTP_IF_NONE_MATCH=etag)
+        assert_equal(304, response.status_code)
+        response = self.client.get(self.url,
+            HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        assert_equal(304, response.status_code)
+
+    def test_changes_are_fetched_again(self):
+        etag = self.client.get(self.url)['ETag']
+        answer = Answer.objects.get(pk=13)
+        answer.answer = 'changed'
+        answer.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        assert_equal(200, response.status_code)
+        assert_not_equal(etag, response['ETag'])
+        self.assertContains(response, 'changed')
+
+    def test_missing_and_closed_quizzes(self):
+        assert_equal(404, self.client.get(
+            reverse('quiz_api_paper', args=['nope'])).status_code)
+        self.quiz.status = Quiz.CLOSED
+        self.quiz.save()
+        assert_equal(404, self.client.get(self.url).status_code)
+
+
+class TestQuizSubmit(QueryCountTestCase):
+    fixtures = ['python-zen.yaml', 'testuser.yaml']
+    # 1 quiz, 9 questions, 26 answers, 9 correct answers (one per question)
+    # A single test-user, TestyMcTesterson, with password 'password'
+
+    def setUp(self):
+        super(TestQuizSubmit, self).setUp()
+        self.quiz = Quiz.objects.get(slug='python-zen')
+        self.url = reverse('quiz_api_submit', args=['python-zen'])
+        self.correct = list(Answer.objects.correct.order_by('id').values_list(
+            'pk', flat=True))
+
+    def submit(self, data, content_type='application/json'):
+        return self.client.post(self.url, simplejson.dumps(data),
+                                content_type=content_type)
+
+    def test_anonymous_submission(self):
+        response = self.submit({'answers': self.correct,
+                                'email': 'foo@bar.com'})
+        assert_equal(201, response.status_code)
+        data = simplejson.loads(response.content)
+        result = QuizResult.objects.get(email='foo@bar.com')
+        assert_equal(result.pk, data['result'])
+        assert_equal((9, 9), (data['score'], data['maximum_score']))
+        assert_equal(result.get_absolute_url(), data['url'])
+        assert_equal(set(self.correct),
+                     set(result.answers.values_list('pk', flat=True)))
+
+    def test_authenticated_submission(self):
+        self.client.login(username='TestyMcTesterson', password='password')
+        answers = self.correct[:8] + [Answer.objects.filter(
+            question=Answer.objects.get(pk=self.correct[8]).question,
+            score=0)[0].pk]
+        response = self.submit({'answers': answers})
+        assert_equal(201, response.status_code)
+        result = QuizResult.objects.get(user__username='TestyMcTesterson')
+        assert_equal((8, 9), (result.score, result.maximum_score))
+
+    def test_invalid_submissions(self):
+        response = self.submit({'answers': self.correct, 'email': ''})
+        assert_equal(['email'],
+                     list(simplejson.loads(response.content)['errors']))
+        errors = simplejson.loads(self.submit({
+            'answers': self.correct[1:] + [self.correct[1], 1000],
+            'email': 'foo@bar.com',
+        }).content)['errors']
+        question_ids = list(Question.objects.order_by('id').values_list(
+            'pk', flat=True))
+        assert_equal([1000], errors['unknown'])
+        assert_equal([question_ids[1]], errors['duplicate'])
+        assert_equal([question_ids[0]], errors['unanswered'])
+        response = self.submit({'answers': 'all of them',
+                                'email': 'foo@bar.com'})
+        assert_equal(400, response.status_code)
+        assert_equal(0, QuizResult.objects.count())
+
+    def test_malformed_answer_ids(self):
+        malformed = [[self.correct[0]], {'id': 1}, str(self.correct[0]),
+                     True, None, 1.5]
+        response = self.submit({'answers': self.correct + malformed,
+                                'email': 'foo@bar.com'})
+        assert_equal(400, response.status_code)
+        assert_equal(malformed,
+                     simplejson.loads(response.content)['errors']['unknown'])
+        assert_equal(0, QuizResult.objects.count())
+
+    def test_submissions_must_be_json(self):
+        response = self.client.post(self.url, {'answers': self.correct})
+        assert_equal(415, response.status_code)
+        response = self.client.post(self.url, '{', content_type='application/json')
+        assert_equal(400, response.status_code)
+        assert_equal(405, self.client.get(self.url).status_code)
+
+    def test_queued_submission(self):
+        old_queue = getattr(settings, 'QUIZ_SUBMISSION_QUEUE', None)
+        settings.QUIZ_SUBMISSION_QUEUE = 'quiz.submissions.DatabaseQueue'
+        try:
+            response = self.submit({'answers': self.correct,
+                                    'email': 'foo@bar.com'})
+        finally:
+            settings.QUIZ_SUBMISSION_QUEUE = old_queue
+        assert_equal(202, response.status_code)
+        assert_equal('pending', simplejson.loads(response.content)['status'])
+        assert_equal(1, QuizSubmission.objects.count())
+        assert_equal(0, QuizResult.objects.count())
@@ -0,0 +1,136 @@
+from datetime import datetime, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from nose.tools import *
+
+from quiz import taken
+from quiz.archive import archive_results
+from quiz.leaderboard import Leaderboard, rebuild_leaderboards
+from quiz.listeners import start_listening, stop_listening
+from quiz.management.commands.archive_quiz_results import Command
+from quiz.models import (
+    Answer, AnswerStats, ArchivedResult, Quiz, QuizResult, QuizSubmission
+)
+from quiz.stats import rebuild_stats
+from quiz.tests.base import QueryCountTestCase
+
+
+class TestArchive(QueryCountTestCase):
+    fixtures = ['python-zen.yaml', 'testuser.yaml']
+    # 1 quiz, 9 questions, 26 answers, 9 correct answers (one per question)
+    # A single test-user, TestyMcTesterson, with password 'password'
+
+    def setUp(self):
+        super(TestArchive, self).setUp()
+        taken.clear_memo()
+        self.quiz = Quiz.objects.get(slug='python-zen')
+        self.user = User.objects.get(username='TestyMcTesterson')
+        self.correct = list(Answer.objects.correct.order_by('id')
+                            .values_list('pk', flat=True))
+        self.results = []
+        for i, score in enumerate((9, 3, 7, 5)):
+            self.results.append(QuizResult.objects.record(quiz=self.quiz,
+                user=i % 2 and self.user or None, email='taker%d@bar.com' % i,
+                score=score, maximum_score=9, answers=self.correct[:score]))
+        # Whole seconds, as the SQLite backend can misread microseconds.
+        self.cutoff = (datetime.now() - timedelta(days=30)).replace(
+            microsecond=0)
+        # The first three results are old:
+        QuizResult.objects.filter(pk__in=[r.pk for r in self.results[:3]]
+            ).update(datetime_created=self.cutoff - timedelta(days=1))
+
+    def tearDown(self):
+        taken.clear_memo()
+        super(TestArchive, self).tearDown()
+
+    def test_old_results_are_moved(self):
+        assert_equal(3, archive_results(self.cutoff, batch_size=2))
+        assert_equal([self.results[3].pk],
+                     list(QuizResult.objects.values_list('pk', flat=True)))
+        archived = ArchivedResult.objects.get(pk=self.results[0].pk)
+        assert_equal(self.correct, archived.get_answer_ids())
+        assert_equal((9, 9), (archived.score, archived.maximum_score))
+        assert_equal(self.cutoff - timedelta(days=1), archived.datetime_created)
+        assert_equal(self.user, ArchivedResult.objects.get(
+            pk=self.results[1].pk).user)
+        through = QuizResult.answers.through
+        assert_equal(5, through.objects.count())
+        assert_equal(0, archive_results(self.cutoff))
+
+    def test_the_latest_result_is_kept(self):
+        assert_equal(3, archive_results(datetime.now() + timedelta(days=1)))
+        assert_equal(1, QuizResult.objects.count())
+
+    def test_leaderboards_and_stats_are_unchanged(self):
+        leaderboard = Leaderboard(self.quiz)
+        distribution = leaderboard.get_distribution()
+        top = [r.pk for r in leaderboard.top(3)]
+        stats = list(AnswerStats.objects.order_by('pk').values_list(
+            'pk', 'times_chosen'))
+        archive_results(self.cutoff)
+        assert_equal(distribution, Leaderboard(self.quiz).get_distribution())
+        assert_equal(top, [r.pk for r in Leaderboard(self.quiz).top(3)])
+        rebuild_leaderboards()
+        assert_equal(distribution, Leaderboard(self.quiz).get_distribution())
+        rebuild_stats()
+        assert_equal(stats, list(AnswerStats.objects.order_by('pk')
+                                 .values_list('pk', 'times_chosen')))
+
+    def test_old_result_pages_still_work(self):
+        url = self.results[0].get_absolute_url()
+        QuizSubmission.objects.create(quiz=self.quiz, result=self.results[0])
+        archive_results(self.cutoff)
+        response = self.client.get(url)
+        assert_equal(200, response.status_code)
+        assert_equal(9, response.context['score'])
+        assert_equal(4, response.context['total_takers'])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        assert_equal(304, response.status_code)
+        assert_false(QuizSubmission.objects.filter(result=self.results[0].pk))
+
+    def test_taken_counts_include_the_archive(self):
+        QuizResult.objects.record(quiz=self.quiz, user=self.user, score=0,
+                                  maximum_score=9)
+        archive_results(self.cutoff)
+        taken.clear_memo()
+        counts = self.assertNumQueries(1, taken.get_taken_counts,
+                                       self.user.pk, [self.quiz.pk])
+        assert_equal({self.quiz.pk: 3}, counts)
+
+    def test_archived_results_are_relinked(self):
+        archive_results(self.cutoff)
+        start_listening()
+        try:
+            user = User.objects.create(username='new', email='taker2@bar.com')
+        finally:
+            stop_listening()
+        assert_equal(self.results[2].pk, ArchivedResult.objects.get(
+            user=user).pk)
+
+    def test_deleting_archived_results(self):
+        old_timeout, taken.CACHE_TIMEOUT = taken.CACHE_TIMEOUT, 60
+        try:
+            archive_results(self.cutoff)
+            assert_equal(2, taken.get_taken_count(self.user.pk, self.quiz.pk))
+            ArchivedResult.objects.get(pk=self.results[1].pk).delete()
+            assert_equal(0, dict(Leaderboard(self.quiz).get_distribution())
+                         .get(3, 0))
+            # The cached counter is taken down, not just forgotten:
+            taken.clear_memo()
+            assert_equal(1, self.assertNumQueries(0, taken.get_taken_count,
+                                                  self.user.pk, self.quiz.pk))
+        finally:
+            taken.CACHE_TIMEOUT = old_timeout
+            taken.forget_taken_counts(self.user.pk, [self.quiz.pk])
+
+    def test_command(self):
+        call_command('archive_quiz_results', days=30, verbosity=0)
+        assert_equal(3, ArchivedResult.objects.count())
+        command = Command()
+        options = {'before': None, 'days': None, 'quiz': None,
+                   'batch_size': 10, 'verbosity': 0}
+        assert_raises(CommandError, command.handle_noargs, **options)
+        options.update(days=1, quiz='nope')
+        assert_raises(CommandError, command.handle_noargs, **options)
@@ -0,0 +1,209 @@
+import re
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.db import DatabaseError
+from django.utils import simplejson
+from nose.tools import *
+
+from quiz import attempts
+from quiz.attempts import AttemptBuffer, AttemptWizardStorage, attempt_buffer
+from quiz.models import Quiz, QuizAttempt, QuizResult
+from quiz.tests.base import QueryCountTestCase
+from quiz.wizard import get_draft_initial, get_wizard_storage
+
+
+class TestAttempts(QueryCountTestCase):
+    fixtures = ['python-zen.yaml', 'testuser.yaml']
+    # 1 quiz, 9 questions, 26 answers, 9 correct answers (one per question)
+    # A single test-user, TestyMcTesterson, with password 'password'
+
+    attempt_re = re.compile('name="wizard_attempt" value="([0-9a-f]+)"')
+
+    def setUp(self):
+        super(TestAttempts, self).setUp()
+        self.old_storage = getattr(settings, 'QUIZ_WIZARD_STORAGE', None)
+        settings.QUIZ_WIZARD_STORAGE = 'attempt'
+        self.quiz = Quiz.objects.get(slug='python-zen')
+        self.user = User.objects.get(username='TestyMcTesterson')
+        self.client.login(username=self.user.username, password='password')
+        self.url = reverse('quiz_detail', args=['python-zen'])
+        self.autosave_url = reverse('quiz_autosave', args=['python-zen'])
+        self.steps = ({
+                '0-INITIAL_FORMS': 4, '0-TOTAL_FORMS': 4,
+                '0-0-answers': 3, '0-1-answers': 4, '0-2-answers': 9,
+                '0-3-answers': 11,
+            }, {
+                '1-INITIAL_FORMS': 3, '1-TOTAL_FORMS': 3,
+                '1-0-answers': 14, '1-1-answers': 16, '1-2-answers': 20
+            }, {
+                '2-INITIAL_FORMS': 2, '2-TOTAL_FORMS': 2,
+                '2-0-answers': 23, '2-1-answers': 26,
+            }
+        )
+
+    def tearDown(self):
+        settings.QUIZ_WIZARD_STORAGE = self.old_storage
+        attempt_buffer._pending = {}
+        super(TestAttempts, self).tearDown()
+
+    def post_step(self, step, attempt):
+        data = dict(self.steps[step], wizard_step=str(step),
+                    wizard_attempt=attempt)
+        return self.client.post(self.url, data)
+
+    def get_attempt(self, response):
+        return self.attempt_re.search(response.content).group(1)
+
+    def test_get_wizard_storage(self):
+        assert_true(isinstance(get_wizard_storage(None, 'attempt'),
+                               AttemptWizardStorage))
+
+    def test_starting_the_quiz_creates_an_attempt(self):
+        attempt = self.get_attempt(self.client.get(self.url))
+        row = QuizAttempt.objects.get(token=attempt)
+        assert_equal(self.quiz.pk, row.quiz_id)
+        assert_equal(self.user.pk, row.user_id)
+        assert_equal(QuizAttempt.IN_PROGRESS, row.status)
+        assert_equal(0, row.current_step)
+
+    def test_completed_attempt_is_linked_to_its_result(self):
+        attempt = self.get_attempt(self.client.get(self.url))
+        for step in range(3):
+            response = self.post_step(step, attempt)
+            if step < 2:
+                assert_equal(step + 1,
+                    QuizAttempt.objects.get(token=attempt).current_step)
+        result = QuizResult.objects.get(quiz=self.quiz, user=self.user)
+        self.assertRedirects(response, result.get_absolute_url())
+        row = QuizAttempt.objects.get(token=attempt)
+        assert_equal(QuizAttempt.COMPLETED, row.status)
+        assert_equal(result.pk, row.result_id)
+        # Taking the quiz again starts a new attempt:
+        assert_not_equal(attempt, self.get_attempt(self.client.get(self.url)))
+
+    def test_unfinished_attempt_is_resumed(self):
+        attempt = self.get_attempt(self.client.get(self.url))
+        self.post_step(0, attempt)
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Step 2 of 3')
+        assert_equal(attempt, self.get_attempt(response))
+        assert_equal(1, QuizAttempt.objects.count())
+        self.post_step(1, attempt)
+        response = self.post_step(2, attempt)
+        result = QuizResult.objects.get(quiz=self.quiz, user=self.user)
+        assert_equal(result.maximum_score, result.score)
+
+    def test_autosaved_answers_are_restored(self):
+        attempt = self.get_attempt(self.client.get(self.url))
+        self.post_step(0, attempt)
+        response = self.client.post(self.autosave_url, {
+            'wizard_attempt': attempt, 'wizard_step': '1', '1-0-answers': 14,
+        })
+        assert_equal(204, response.status_code)
+        attempt_buffer.flush()
+        draft = QuizAttempt.objects.get(token=attempt).draft
+        assert_equal({'step': 1, 'data': {'1-0-answers': ['14']}},
+                     simplejson.loads(draft))
+        content = self.client.get(self.url).content
+        checked = [tag for tag in re.findall(r'<input[^>]*>', content)
+                   if 'checked' in tag]
+        assert_equal(1, len(checked))
+        assert_true('value="14"' in checked[0])
+        # Completing the step clears the draft:
+        self.post_step(1, attempt)
+        assert_equal('', QuizAttempt.objects.get(token=attempt).draft)
+
+    def test_autosave_requires_post(self):
+        assert_equal(405, self.client.get(self.autosave_url).status_code)
+        response = self.client.post(self.autosave_url, {'wizard_step': '1'})
+        assert_equal(400, response.status_code)
+
+    def test_buffer_coalesces_and_batches_writes(self):
+        tokens = [self.get_attempt(self.client.get(self.url))]
+        self.client.logout()
+        for i in range(2):
+            self.client.post(reverse('quiz_capture_email'),
+                             {'email': 'taker%d@example.com' % i})
+            tokens.append(self.get_attempt(self.client.get(self.url)))
+        buffer = AttemptBuffer(size=3, interval=60)
+        buffer.add(tokens[0], self.user.email, {'step': 0, 'data': {'a': 1}})
+        buffer.add(tokens[0], self.user.email, {'step': 0, 'data': {'a': 2}})
+        buffer.add(tokens[1], 'taker0@example.com', {'step': 0, 'data': {}})
+        assert_equal(2, len(buffer))
+        assert_equal({'step': 0, 'data': {'a': 2}}, buffer.get(tokens[0]))
+        self.assertNumQueries(1, buffer.add, tokens[2], 'taker1@example.com',
+                              {'step': 0, 'data': {}})
+        assert_equal(0, len(buffer))
+        assert_equal('{"data": {"a": 2}, "step": 0}',
+                     QuizAttempt.objects.get(token=tokens[0]).draft)
+        assert_equal(3, QuizAttempt.objects.exclude(draft='').count())
+
+    def test_buffer_is_flushed_after_requests_once_due(self):
+        attempt = self.get_attempt(self.client.get(self.url))
+        old_interval = attempt_buffer.interval
+        attempt_buffer.interval = 60
+        try:
+            self.client.post(self.autosave_url, {'wizard_attempt': attempt,
+                                                 'wizard_step': '0'})
+            assert_equal(1, len(attempt_buffer))
+            attempt_buffer._started -= 60
+            self.client.get(self.url)
+            assert_equal(0, len(attempt_buffer))
+            assert_not_equal('', QuizAttempt.objects.get(token=attempt).draft)
+        finally:
+            attempt_buffer.interval = old_interval
+
+    def test_failed_writes_are_kept(self):
+        attempt = self.get_attempt(self.client.get(self.url))
+        buffer = AttemptBuffer(size=10, interval=60)
+        buffer.add(attempt, self.user.email, {'step': 0, 'data': {'a': 1}})
+        buffer.add('other', self.user.email, {'step': 0, 'data': {}})
+        old_write = attempts.write_drafts
+        def write_drafts(drafts):
+            # A newer draft arrives while the write is failing:
+            buffer._pending[attempt] = (self.user.email,
+                                        {'step': 0, 'data': {'a': 2}})
+            raise DatabaseError('down')
+        attempts.write_drafts = write_drafts
+        try:
+            assert_raises(DatabaseError, buffer.flush)
+        finally:
+            attempts.write_drafts = old_write
+        assert_equal(2, len(buffer))
+        assert_equal({'step': 0, 'data': {'a': 2}}, buffer.get(attempt))
+        buffer.flush()
+        assert_equal(0, len(buffer))
+        assert_equal('{"data": {"a": 2}, "step": 0}',
+                     QuizAttempt.objects.get(token=attempt).draft)
+
+    def test_failed_writes_after_requests_are_logged(self):
+        buffer = AttemptBuffer(size=1, interval=60)
+        buffer._pending['other'] = (self.user.email, {'step': 0, 'data': {}})
+        buffer._started = time.time()
+        old_write = attempts.write_drafts
+        def write_drafts(drafts):
+            raise DatabaseError('down')
+        attempts.write_drafts = write_drafts
+        try:
+            buffer.flush_if_due()
+        finally:
+            attempts.write_drafts = old_write
+        assert_equal(1, len(buffer))
+
+    def test_buffered_drafts_belong_to_their_taker(self):
+        attempt = self.get_attempt(self.client.get(self.url))
+        buffer = AttemptBuffer(size=1)
+        buffer.add(attempt, 'someone@else.com', {'step': 0, 'data': {}})
+        assert_equal('', QuizAttempt.objects.get(token=attempt).draft)
+
+    def test_get_draft_initial(self):
+        draft = {'step': 1, 'data': {
+            '1-2-answers': ['20'], '1-0-answers': ['14'], '0-0-answers': ['3'],
+            '1-TOTAL_FORMS': ['3'],
+        }}
+        assert_equal([{'answers': '14'}, {}, {'answers': '20'}],
+                     get_draft_initial(draft, '1'))
+        assert_equal(None, get_draft_initial(draft, '2'))
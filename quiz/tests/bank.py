@@ -0,0 +1,150 @@
+import os
+import tempfile
+from StringIO import StringIO
+
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from nose.tools import *
+
+from quiz.bank import clean_record, export_bank, import_bank, iter_bank
+from quiz.compiled import get_compiled_quiz
+from quiz.models import Quiz, Question, Answer
+from quiz.tests.base import QueryCountTestCase
+
+JSONL = """\
+{"question": "Is this new?", "difficulty": "hard", "quizzes": ["python-zen"], "answers": [{"answer": "Yes", "score": 1}, {"answer": "No"}]}
+
+{"question": "Missing answers?", "difficulty": 10}
+not json
+{"question": "Unknown quiz?", "quizzes": ["nope"]}
+{"question": "Bad difficulty?", "difficulty": 3}
+"""
+
+CSV = """\
+question,difficulty,is_active,quizzes,answer,score,answer_is_active
+First?,easy,true,python-zen other,One,1,
+First?,easy,true,python-zen other,Two,0,false
+Second?,medium,no,,,,
+"""
+
+
+class TestQuestionBank(QueryCountTestCase):
+    fixtures = ['python-zen.yaml']
+    # 1 quiz, 9 questions, 26 answers, 9 correct answers (one per question)
+
+    def setUp(self):
+        super(TestQuestionBank, self).setUp()
+        self.quiz = Quiz.objects.get(slug='python-zen')
+        self.other = Quiz.objects.create(name='Other', slug='other')
+
+    def test_clean_record(self):
+        record = clean_record({'question': ' Why? ', 'answers': [
+            {'answer': 'A'}, {'answer': 'B', 'score': '1'},
+            {'answer': 'A', 'score': 1, 'is_active': 'no'},
+        ]})
+        assert_equal(u'Why?', record['question'])
+        assert_equal(Question.EASY, record['difficulty'])
+        assert_true(record['is_active'])
+        assert_equal([('A', 1, False), ('B', 1, True)], [
+            (a['answer'], a['score'], a['is_active']) for a in record['answers']
+        ])
+        assert_raises(ValueError, clean_record, {'question': ''})
+        assert_raises(ValueError, clean_record, {'question': 'Q', 'score': 2,
+                                                 'answers': [{'score': 1}]})
+        assert_raises(ValueError, clean_record, '[1, 2]')
+
+    def test_import_jsonl(self):
+        get_compiled_quiz('python-zen')
+        report = import_bank(StringIO(JSONL))
+        assert_equal(2, report.records)
+        assert_equal([4, 5, 6], [number for number, error in report.errors])
+        question = Question.objects.get(question='Is this new?')
+        assert_equal(Question.HARD, question.difficulty)
+        assert_equal([('No', 0), ('Yes', 1)], list(question.answers.order_by(
+            'answer').values_list('answer', 'score')))
+        assert_equal([self.quiz], list(question.quizzes.all()))
+        assert_equal(Question.MEDIUM, Question.objects.get(
+            question='Missing answers?').difficulty)
+        # The compiled paper was refreshed, even though no signals were sent:
+        assert_equal(10, len(get_compiled_quiz('python-zen').questions))
+
+    def test_import_refreshes_the_quiz_list(self):
+        url = '%s?difficulty=%s' % (reverse('quiz_list'), Question.HARD)
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert_equal(304, response.status_code)
+        import_bank(StringIO(JSONL))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert_equal(200, response.status_code)
+        assert_not_equal(etag, response['ETag'])
+
+    def test_import_csv(self):
+        report = import_bank(StringIO(CSV), 'csv')
+        assert_equal((2, 2, 2), (report.questions_created,
+            report.answers_created, report.memberships_created))
+        first = Question.objects.get(question='First?')
+        assert_equal([self.other, self.quiz],
+                     list(first.quizzes.order_by('slug')))
+        assert_false(first.answers.get(answer='Two').is_active)
+        assert_false(Question.objects.get(question='Second?').is_active)
+
+    def test_import_upserts_by_natural_key(self):
+        question = Question.objects.order_by('id')[0]
+        answer = question.answers.order_by('id')[0]
+        bank = ('{"question": "%s", "difficulty": 20, "quizzes": '
+                '["python-zen", "other"], "answers": [{"answer": "%s", '
+                '"score": %d}, {"answer": "Brand new"}]}\n' % (
+                question.question, answer.answer, 1 - answer.score))
+        report = import_bank(StringIO(bank))
+        assert_equal((0, 1, 1, 1, 1), (report.questions_created,
+            report.questions_updated, report.answers_created,
+            report.answers_updated, report.memberships_created))
+        assert_equal(9, Question.objects.count())
+        assert_equal(Question.HARD, Question.objects.get(pk=question.pk).difficulty)
+        assert_equal(1 - answer.score, Answer.objects.get(pk=answer.pk).score)
+        # Importing the same bank again changes nothing:
+        report = import_bank(StringIO(bank))
+        assert_equal((0, 0, 0, 0, 0), (report.questions_created,
+            report.questions_updated, report.answers_created,
+            report.answers_updated, report.memberships_created))
+
+    def test_import_writes_in_chunks(self):
+        bank = ''.join([
+            '{"question": "Q%d", "quizzes": ["other"], "answers": '
+            '[{"answer": "A", "score": 1}, {"answer": "B"}]}\n' % i
+            for i in range(10)
+        ])
+        # Per chunk: find questions, insert, read back their ids, find
+        # answers, insert, find memberships, insert. Plus one quiz lookup,
+        # and three queries and an update for the changed quiz's summary.
+        self.assertNumQueries(1 + 7 * 2 + 4, import_bank, StringIO(bank),
+                              chunk_size=5)
+        assert_equal(10, self.other.questions.count())
+        assert_equal(20, Answer.objects.filter(question__quizzes=self.other).count())
+
+    def test_export_round_trips(self):
+        for format in ('jsonl', 'csv', 'yaml'):
+            exported = ''.join(export_bank(format=format, chunk_size=4))
+            report = import_bank(StringIO(exported), format)
+            assert_equal(9, report.records)
+            assert_equal([], report.errors)
+            assert_equal(0, report.questions_created + report.questions_updated
+                + report.answers_created + report.answers_updated
+                + report.memberships_created)
+
+    def test_iter_bank(self):
+        records = self.assertNumQueries(3 * 3, list, iter_bank(chunk_size=4))
+        assert_equal(9, len(records))
+        assert_equal(['python-zen'], records[0]['quizzes'])
+        assert_equal(26, sum([len(r['answers']) for r in records]))
+
+    def test_commands(self):
+        fd, path = tempfile.mkstemp(suffix='.jsonl')
+        os.close(fd)
+        try:
+            call_command('export_question_bank', output=path, verbosity=0)
+            Answer.objects.all().delete()
+            call_command('import_question_bank', path, verbosity=0)
+        finally:
+            os.remove(path)
+        assert_equal(26, Answer.objects.count())
@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.db import connection, transaction
+from django.test import TestCase
+
+
+class QueryCountTestCase(TestCase):
+    """Backports ``assertNumQueries`` from later versions of Django."""
+
+    def assertNumQueries(self, num, func, *args, **kwargs):
+        old_debug = settings.DEBUG
+        settings.DEBUG = True
+        connection.queries = []
+        try:
+            result = func(*args, **kwargs)
+            executed = len(connection.queries)
+        finally:
+            settings.DEBUG = old_debug
+        self.assertEqual(executed, num, "%d queries executed, %d expected:\n%s"
+            % (executed, num, "\n".join(q['sql'] for q in connection.queries))
+        )
+        return result
+
+
+def rolled_back(func, *args, **kwargs):
+    """Calls ``func`` in a managed transaction which is then rolled back, as
+    a view's would be if it raised. Only meaningful in a
+    ``TransactionTestCase``."""
+    transaction.enter_transaction_management()
+    transaction.managed(True)
+    try:
+        result = func(*args, **kwargs)
+        transaction.rollback()
+        return result
+    finally:
+        transaction.leave_transaction_management()
@@ -0,0 +1,85 @@
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase
+from nose.tools import *
+
+from quiz.benchmarks import data, flow, indexes
+from quiz.models import Quiz, Question, Answer, QuizResult
+
+
+class TestIndexBenchmark(TestCase):
+
+    def test_seed(self):
+        quizzes = data.seed(quizzes=2, questions=2, answers=3, results=20,
+                            users=5)
+        assert_equal(2, len(quizzes))
+        assert_equal(2 * 3 * 2, Question.objects.count())
+        assert_equal(2 * 3 * 2 * 3, Answer.objects.count())
+        assert_equal(20, QuizResult.objects.count())
+        assert_equal(3 * 2, quizzes[0].questions.count())
+
+    def test_index_statements(self):
+        names = [name for name, table, statement
+                 in indexes.get_index_statements()]
+        assert_true('quiz_quizresult_quiz_user_idx' in names)
+        assert_true('quiz_answer_live_idx' in names)
+
+
+
+class TestFlowBenchmark(TestCase):
+    fixtures = ['python-zen.yaml']
+    # 1 quiz, 9 questions, 26 answers, 9 correct answers (one per question)
+
+    def test_get_wizard_data(self):
+        content = """
+            <input type="hidden" name="wizard_step" value="1" />
+            <input name="hash_0" type="hidden" value="abc">
+            <input type="radio" id="id_1-0-answers_0" value="14" name="1-0-answers" />
+            <input type="radio" id="id_1-0-answers_1" value="15" name="1-0-answers" />
+            <input type="submit" value="Next">
+        """
+        assert_equal({'wizard_step': '1', 'hash_0': 'abc', '1-0-answers': '14'},
+                     flow.get_wizard_data(content))
+
+    def test_run(self):
+        steps = flow.run(Quiz.objects.all(), iterations=2)
+        assert_equal(['quiz_list', 'capture_email', 'quiz_detail',
+                      'wizard_step_1', 'wizard_step_2', 'done',
+                      'quiz_completed'], [s['step'] for s in steps])
+        assert_true(all([s['queries'] > 0 for s in steps]))
+        assert_equal(2, QuizResult.objects.count())
+
+    def test_compare(self):
+        baseline = flow.make_report([
+            {'step': 'quiz_list', 'queries': 1, 'time_ms': 10.0},
+            {'step': 'done', 'queries': 5, 'time_ms': 10.0},
+        ])
+        report = flow.make_report([
+            {'step': 'quiz_list', 'queries': 1, 'time_ms': 12.0},
+            {'step': 'done', 'queries': 6, 'time_ms': 20.0},
+            {'step': 'new', 'queries': 50, 'time_ms': 50.0},
+        ])
+        assert_equal(['done: 6 queries, up from 5.',
+                      'done: 20.0ms, up from 10.0ms.'],
+                     flow.compare(baseline, report))
+        assert_equal([], flow.compare(baseline, baseline))
+
+
+class TestIndexBenchmarkRun(TransactionTestCase):
+    # Dropping and creating indexes commits, so this can't run in a
+    # transaction which is rolled back.
+
+    def tearDown(self):
+        # Django only flushes before each TransactionTestCase, so clear up
+        # for the TestCases which follow.
+        call_command('flush', verbosity=0, interactive=False)
+
+    def test_run_restores_indexes(self):
+        quizzes = data.seed(quizzes=1, questions=2, answers=2, results=30,
+                            users=5)
+        measurements = indexes.run(quizzes[0], repeat=1)
+        assert_equal(len(indexes.get_queries(quizzes[0])), len(measurements))
+        for name, (before, before_plan), (after, after_plan) in measurements:
+            assert_true(after_plan)
+        # Recreating an index which is still there would fail:
+        assert_raises(Exception, indexes.create_indexes,
+                      indexes.get_index_statements()[:1])
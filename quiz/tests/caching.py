@@ -0,0 +1,103 @@
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from nose.tools import *
+
+from quiz import caching
+from quiz.models import Answer, Question, Quiz, QuizResult
+from quiz.tests.base import QueryCountTestCase
+
+
+class TestQuizListCaching(QueryCountTestCase):
+    fixtures = ['python-zen.yaml']
+    # 1 quiz, 9 questions, 26 answers, 9 correct answers (one per question)
+
+    def setUp(self):
+        super(TestQuizListCaching, self).setUp()
+        self.quiz = Quiz.objects.get(slug='python-zen')
+        self.url = reverse('quiz_list')
+        self.old_timeout = caching.FRAGMENT_TIMEOUT
+
+    def tearDown(self):
+        caching.FRAGMENT_TIMEOUT = self.old_timeout
+        super(TestQuizListCaching, self).tearDown()
+
+    def test_conditional_get(self):
+        response = self.client.get(self.url)
+        etag, modified = response['ETag'], response['Last-Modified']
+        response = self.assertNumQueries(0, self.client.get, self.url,
+                                         HTTP_IF_NONE_MATCH=etag)
+        assert_equal(304, response.status_code)
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=modified)
+        assert_equal(304, response.status_code)
+
+    def test_quiz_changes_are_fetched_again(self):
+        etag = self.client.get(self.url)['ETag']
+        self.quiz.status = Quiz.CLOSED
+        self.quiz.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        assert_equal(200, response.status_code)
+        self.assertNotContains(response, self.quiz.name)
+        assert_not_equal(etag, response['ETag'])
+
+    def test_question_changes_are_fetched_again(self):
+        url = '%s?difficulty=%s' % (self.url, Question.EASY)
+        etag = self.client.get(url)['ETag']
+        questions = self.quiz.questions.filter(difficulty=Question.EASY)
+        for question in questions:
+            question.is_active = False
+            question.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert_equal(200, response.status_code)
+        self.assertNotContains(response, self.quiz.name)
+        etag = response['ETag']
+        self.quiz.questions.add(Question.objects.create(question='New?',
+            difficulty=Question.EASY))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert_equal(200, response.status_code)
+        self.assertContains(response, self.quiz.name)
+
+    def test_fragment_is_cached_until_a_quiz_changes(self):
+        caching.FRAGMENT_TIMEOUT = 60
+        self.assertContains(self.client.get(self.url), self.quiz.name)
+        # Served from the cache, without querying the quizzes:
+        response = self.assertNumQueries(0, self.client.get, self.url)
+        self.assertContains(response, self.quiz.name)
+        self.quiz.name = 'Renamed'
+        self.quiz.save()
+        self.assertContains(self.client.get(self.url), 'Renamed')
+
+
+class TestQuizCompletedCaching(QueryCountTestCase):
+    fixtures = ['python-zen.yaml', 'testuser.yaml']
+    # 1 quiz, 9 questions, 26 answers, 9 correct answers (one per question)
+    # A single test-user, TestyMcTesterson, with password 'password'
+
+    def setUp(self):
+        super(TestQuizCompletedCaching, self).setUp()
+        self.quiz = Quiz.objects.get(slug='python-zen')
+        correct = Answer.objects.correct.values_list('pk', flat=True)
+        self.result = QuizResult.objects.record(quiz_id=self.quiz.pk,
+            email='foo@bar.com', score=9, maximum_score=9, answers=correct)
+        self.url = self.result.get_absolute_url()
+
+    def test_conditional_get(self):
+        response = self.client.get(self.url)
+        assert_true('private' in response['Cache-Control'])
+        etag, modified = response['ETag'], response['Last-Modified']
+        response = self.assertNumQueries(1, self.client.get, self.url,
+                                         HTTP_IF_NONE_MATCH=etag)
+        assert_equal(304, response.status_code)
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=modified)
+        assert_equal(304, response.status_code)
+
+    def test_new_results_change_the_page(self):
+        etag = self.client.get(self.url)['ETag']
+        QuizResult.objects.record(quiz_id=self.quiz.pk, email='bar@bar.com',
+                                  score=0, maximum_score=9)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        assert_equal(200, response.status_code)
+        self.assertContains(response, 'number 1 out of 2')
+
+    def test_missing_result(self):
+        url = reverse('quiz_completed', args=['python-zen', self.result.pk + 1])
+        assert_equal(404, self.client.get(url).status_code)
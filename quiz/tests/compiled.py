@@ -0,0 +1,155 @@
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.signals import request_finished
+from django.db import transaction
+from django.test import TransactionTestCase
+from nose.tools import *
+
+from quiz.compiled import (
+    CompiledQuiz, compile_quiz, get_compiled_quiz, get_version, local_cache
+)
+from quiz.models import Quiz, Question, Answer
+from quiz.tests.base import QueryCountTestCase
+
+
+class TestCompileQuiz(QueryCountTestCase):
+    fixtures = ['python-zen.yaml']
+    # 1 quiz, 9 questions, 26 answers, 9 correct answers (one per question)
+
+    def setUp(self):
+        super(TestCompileQuiz, self).setUp()
+        self.quiz = Quiz.objects.get(slug='python-zen')
+
+    def test_compile_quiz_contents(self):
+        compiled = self.assertNumQueries(2, compile_quiz, self.quiz)
+        assert_equal(self.quiz.pk, compiled.pk)
+        assert_equal(self.quiz.name, compiled.name)
+        assert_equal(
+            list(self.quiz.questions.order_by('id').values_list('id', flat=True)),
+            [q.pk for q in compiled.questions]
+        )
+        assert_equal((Question.EASY, Question.MEDIUM, Question.HARD),
+                     compiled.difficulty_levels)
+        assert_equal(4, len(compiled.get_questions(Question.EASY)))
+        assert_equal(3, len(compiled.get_questions(Question.MEDIUM)))
+        assert_equal(2, len(compiled.get_questions(Question.HARD)))
+        assert_equal(9, compiled.maximum_score)
+        assert_equal(2, compiled.get_maximum_score(Question.HARD))
+        for question in compiled.questions:
+            assert_equal(
+                list(Answer.objects.filter(question=question.pk).order_by(
+                    'id').values_list('pk', 'answer')),
+                list(question.choices)
+            )
+
+    def test_compile_quiz_excludes_inactive(self):
+        question = self.quiz.questions.filter(difficulty=Question.HARD)[0]
+        question.is_active = False
+        question.save()
+        answer = Answer.objects.filter(question__difficulty=Question.EASY)[0]
+        answer.is_active = False
+        answer.save()
+        compiled = compile_quiz(self.quiz)
+        assert_equal(8, len(compiled.questions))
+        assert question.pk not in [q.pk for q in compiled.questions]
+        choices = [c[0] for q in compiled.questions for c in q.choices]
+        assert answer.pk not in choices
+
+
+class TestGetCompiledQuiz(QueryCountTestCase):
+    fixtures = ['python-zen.yaml']
+    # 1 quiz, 9 questions, 26 answers, 9 correct answers (one per question)
+
+    def setUp(self):
+        super(TestGetCompiledQuiz, self).setUp()
+        self.quiz = Quiz.objects.get(slug='python-zen')
+        cache.clear()
+        local_cache.clear()
+
+    def test_cached_lookup_is_free(self):
+        compiled = self.assertNumQueries(3, get_compiled_quiz, self.quiz.slug)
+        assert isinstance(compiled, CompiledQuiz)
+        assert_equal(compiled.version,
+            self.assertNumQueries(0, get_compiled_quiz, self.quiz.slug).version
+        )
+        # Falls back to the cache backend when the process cache is cold:
+        local_cache.clear()
+        self.assertNumQueries(0, get_compiled_quiz, self.quiz.slug)
+
+    def test_unknown_slug(self):
+        assert_raises(Quiz.DoesNotExist, get_compiled_quiz, 'does-not-exist')
+
+    def test_quiz_save_invalidates(self):
+        old = get_compiled_quiz(self.quiz.slug)
+        self.quiz.name = 'Renamed'
+        self.quiz.save()
+        new = get_compiled_quiz(self.quiz.slug)
+        assert_not_equal(old.version, new.version)
+        assert_equal('Renamed', new.name)
+
+    def test_slug_change_invalidates(self):
+        old_slug = self.quiz.slug
+        get_compiled_quiz(old_slug)
+        self.quiz.slug = 'new-slug'
+        self.quiz.save()
+        assert_raises(Quiz.DoesNotExist, get_compiled_quiz, old_slug)
+        assert_equal(self.quiz.pk, get_compiled_quiz('new-slug').pk)
+
+    def test_question_save_invalidates(self):
+        old = get_compiled_quiz(self.quiz.slug)
+        question = self.quiz.questions.all()[0]
+        question.question = 'Changed?'
+        question.save()
+        new = get_compiled_quiz(self.quiz.slug)
+        assert_not_equal(old.version, new.version)
+        assert 'Changed?' in [q.question for q in new.questions]
+
+    def test_answer_save_invalidates(self):
+        old = get_compiled_quiz(self.quiz.slug)
+        answer = Answer.objects.all()[0]
+        answer.answer = 'Changed!'
+        answer.save()
+        new = get_compiled_quiz(self.quiz.slug)
+        assert_not_equal(old.version, new.version)
+        choices = [c[1] for q in new.questions for c in q.choices]
+        assert 'Changed!' in choices
+
+    def test_question_membership_invalidates(self):
+        old = get_compiled_quiz(self.quiz.slug)
+        question = Question.objects.create(question='New?')
+        self.quiz.questions.add(question)
+        new = get_compiled_quiz(self.quiz.slug)
+        assert_equal(len(old.questions) + 1, len(new.questions))
+
+        question.quizzes.clear()
+        assert_equal(len(old.questions),
+                     len(get_compiled_quiz(self.quiz.slug).questions))
+
+
+class TestInvalidationTransactions(TransactionTestCase):
+    fixtures = ['python-zen.yaml']
+
+    def setUp(self):
+        self.quiz = Quiz.objects.get(slug='python-zen')
+        cache.clear()
+        local_cache.clear()
+
+    def tearDown(self):
+        # Django only flushes before each TransactionTestCase, so clear up
+        # for the TestCases which follow.
+        call_command('flush', verbosity=0, interactive=False)
+
+    def test_invalidation_is_repeated_after_commit(self):
+        def rename():
+            self.quiz.name = 'Renamed'
+            self.quiz.save()
+            # Another process can't see the new name yet, and might compile
+            # the old one under the new revision.
+            version = get_version(self.quiz.pk)
+            request_finished.send(sender=None)
+            assert_equal(version, get_version(self.quiz.pk))
+            return version
+        version = transaction.commit_on_success(rename)()
+        request_finished.send(sender=None)
+        assert_not_equal(version, get_version(self.quiz.pk))
+        assert_equal('Renamed', get_compiled_quiz(self.quiz.slug).name)
@@ -0,0 +1,134 @@
+import csv
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.utils import simplejson
+from nose.tools import *
+
+from quiz.archive import archive_batch
+from quiz.export import (
+    CHUNK_SIZE, FIELDS, export_results, get_export_queryset,
+    get_export_querysets, iter_results, parse_date
+)
+from quiz.models import Quiz, QuizResult, Answer
+from quiz.tests.base import QueryCountTestCase
+
+
+class TestExport(QueryCountTestCase):
+    fixtures = ['python-zen.yaml', 'testuser.yaml']
+    # 1 quiz, 9 questions, 26 answers, 9 correct answers (one per question)
+    # A single test-user, TestyMcTesterson, with password 'password'
+
+    def setUp(self):
+        super(TestExport, self).setUp()
+        self.quiz = Quiz.objects.get(slug='python-zen')
+        self.other = Quiz.objects.create(name='Other', slug='other')
+        self.user = User.objects.get(username='TestyMcTesterson')
+        self.answers = list(Answer.objects.correct.order_by('id'))
+        self.results = [
+            QuizResult.objects.record(quiz=self.quiz, email='u%d@bar.com' % i,
+                score=i, maximum_score=9, answers=self.answers[:i])
+            for i in range(5)
+        ]
+        self.results.append(QuizResult.objects.record(quiz=self.other,
+            user=self.user, email=self.user.email, score=1, maximum_score=1))
+
+    def test_iter_results_reads_in_chunks(self):
+        results = get_export_queryset(self.quiz)
+        # Two queries per chunk of (at most) 2; the short chunk ends it:
+        exported = self.assertNumQueries(6, list, iter_results(results, 2))
+        assert_equal([r.pk for r in self.results[:5]],
+                     [r['id'] for r in exported])
+        assert_equal([a.pk for a in self.answers[:3]], exported[3]['answers'])
+        assert_equal([], exported[0]['answers'])
+        assert_equal('python-zen', exported[0]['quiz'])
+
+    def test_get_export_queryset_filters_by_date(self):
+        QuizResult.objects.filter(pk=self.results[0].pk).update(
+            datetime_created=datetime(2010, 1, 1, 12))
+        QuizResult.objects.filter(pk=self.results[1].pk).update(
+            datetime_created=datetime(2010, 1, 2, 12))
+        assert_equal([self.results[0].pk], list(get_export_queryset(
+            until=parse_date('2010-01-01')).values_list('pk', flat=True)))
+        assert_equal([], list(get_export_queryset(
+            until=parse_date('2010-01-01 11:00:00')).values_list('pk', flat=True)))
+        assert_equal(5, get_export_queryset(
+            since=parse_date('2010-01-02')).count())
+        assert_raises(ValueError, parse_date, 'yesterday')
+
+    def test_export_csv(self):
+        lines = list(export_results(get_export_queryset(), 'csv', 4))
+        rows = list(csv.reader(lines))
+        assert_equal(list(FIELDS), rows[0])
+        assert_equal(7, len(rows))
+        assert_equal(['other', str(self.user.pk), 'TestyMcTesterson',
+                      'testy@test.com', '1', '1'], rows[-1][1:7])
+        assert_equal(['', ''], [rows[1][2], rows[1][3]])
+        assert_equal(' '.join([str(a.pk) for a in self.answers[:2]]),
+                     rows[3][-1])
+
+    def test_export_jsonl(self):
+        lines = list(export_results(get_export_queryset(self.other), 'jsonl'))
+        assert_equal(1, len(lines))
+        result = simplejson.loads(lines[0])
+        assert_equal(self.results[-1].pk, result['id'])
+        assert_equal('TestyMcTesterson', result['username'])
+        assert_equal([], result['answers'])
+        assert_raises(ValueError, export_results, get_export_queryset(), 'xml')
+
+    def test_chunks_fit_sqlites_parameter_limit(self):
+        assert_true(CHUNK_SIZE <= 999)
+
+    def test_archived_results_are_exported(self):
+        archive_batch([self.results[1].pk, self.results[3].pk])
+        exported = list(export_results(get_export_querysets(self.quiz),
+                                       'jsonl', 2))
+        results = [simplejson.loads(line) for line in exported]
+        assert_equal([r.pk for r in self.results[:5]],
+                     [r['id'] for r in results])
+        assert_equal([a.pk for a in self.answers[:3]], results[3]['answers'])
+        assert_equal('u3@bar.com', results[3]['email'])
+        assert_equal(0, get_export_querysets(self.other)[1].count())
+
+    def test_export_command(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            call_command('export_quiz_results', quiz='python-zen',
+                         format='jsonl', output=path, chunk_size=2)
+            lines = open(path).readlines()
+        finally:
+            os.remove(path)
+        assert_equal([r.pk for r in self.results[:5]],
+                     [simplejson.loads(line)['id'] for line in lines])
+
+    def test_export_view_is_staff_only(self):
+        url = reverse('quiz_export_results', args=['python-zen'])
+        response = self.client.get(url)
+        assert_equal(200, response.status_code)
+        assert_false('Content-Disposition' in response)
+        self.client.login(username='TestyMcTesterson', password='password')
+        assert_false('Content-Disposition' in self.client.get(url))
+
+    def test_export_view(self):
+        self.user.is_staff = True
+        self.user.save()
+        self.client.login(username='TestyMcTesterson', password='password')
+        url = reverse('quiz_export_results', args=['python-zen'])
+        response = self.client.get(url)
+        assert_equal(200, response.status_code)
+        assert_true(response['Content-Type'].startswith('text/csv'))
+        assert_equal('attachment; filename=python-zen-results.csv',
+                     response['Content-Disposition'])
+        assert_equal(6, len(response.content.splitlines()))
+        response = self.client.get(url, {'format': 'jsonl', 'since': '2000-01-01'})
+        assert_equal(5, len(response.content.splitlines()))
+        assert_equal(400, self.client.get(url, {'format': 'xml'}).status_code)
+        assert_equal(400, self.client.get(url, {'since': 'now'}).status_code)
+        assert_equal(404, self.client.get(reverse('quiz_export_results',
+                                                  args=['missing'])).status_code)
@@ -0,0 +1,122 @@
+from nose.tools import *
+
+from quiz.compiled import get_compiled_quiz
+from quiz.forms import (
+    QuestionForm, QuizBoundFormWizard, quiz_formset_factory
+)
+from quiz.models import Quiz, Question, Answer
+from quiz.tests.base import QueryCountTestCase
+
+
+class TestQuestionForm(QueryCountTestCase):
+    fixtures = ['python-zen.yaml']
+    # 1 quiz, 9 questions, 26 answers, 9 correct answers (one per question)
+
+    def test_choices_exclude_inactive_answers(self):
+        question = Question.objects.get(pk=1)
+        inactive = question.answers.all()[0]
+        inactive.is_active = False
+        inactive.save()
+        form = QuestionForm(question)
+        choices = [pk for pk, answer in form.fields['answers'].choices]
+        assert_equal(
+            sorted(question.answers.live.values_list('pk', flat=True)),
+            sorted(choices)
+        )
+        assert inactive.pk not in choices
+
+    def test_given_choices_cost_no_queries(self):
+        question = Question.objects.get(pk=1)
+        form = self.assertNumQueries(
+            0, QuestionForm, question, choices=[(1, 'Super')]
+        )
+        assert_equal([(1, 'Super')], list(form.fields['answers'].choices))
+
+
+class TestQuizBaseFormSetConstruction(QueryCountTestCase):
+    fixtures = ['python-zen.yaml']
+    # 1 quiz, 9 questions, 26 answers, 9 correct answers (one per question)
+
+    def setUp(self):
+        super(TestQuizBaseFormSetConstruction, self).setUp()
+        self.quiz = Quiz.objects.get(slug='python-zen')
+
+    def add_questions(self, count):
+        for i in range(count):
+            question = Question.objects.create(question='Extra %d' % i)
+            Answer.objects.create(
+                question=question, answer='Yes', score=Answer.CORRECT
+            )
+            Answer.objects.create(question=question, answer='No')
+            self.quiz.questions.add(question)
+
+    def test_query_count_is_independent_of_question_count(self):
+        FormSet = quiz_formset_factory(self.quiz)
+        formset = self.assertNumQueries(2, FormSet, difficulty=Question.EASY)
+        assert_equal(4, len(formset.forms))
+        self.assertNumQueries(0, formset.as_table)
+
+        self.add_questions(60)
+        formset = self.assertNumQueries(2, FormSet, difficulty=Question.EASY)
+        assert_equal(64, len(formset.forms))
+        self.assertNumQueries(0, formset.as_table)
+
+    def test_forms_match_questions(self):
+        FormSet = quiz_formset_factory(self.quiz)
+        formset = FormSet(difficulty=Question.MEDIUM)
+        questions = self.quiz.questions.filter(
+            difficulty=Question.MEDIUM).order_by('id')
+        assert_equal([q.question for q in questions],
+                     [f.question for f in formset.forms])
+        for form, question in zip(formset.forms, questions):
+            assert_equal(
+                list(question.answers.order_by('id').values_list('pk', 'answer')),
+                list(form.fields['answers'].choices)
+            )
+
+    def test_compiled_construction_costs_no_queries(self):
+        FormSet = quiz_formset_factory(get_compiled_quiz(self.quiz.slug))
+        formset = self.assertNumQueries(0, FormSet, difficulty=Question.EASY)
+        assert_equal(4, len(formset.forms))
+
+
+class TestQuizBaseFormSetScoring(QueryCountTestCase):
+    fixtures = ['python-zen.yaml']
+    # 1 quiz, 9 questions, 26 answers, 9 correct answers (one per question)
+
+    def setUp(self):
+        super(TestQuizBaseFormSetScoring, self).setUp()
+        self.quiz = Quiz.objects.get(slug='python-zen')
+        self.data = {
+            '0-INITIAL_FORMS': 2,
+            '0-TOTAL_FORMS': 2,
+            '0-0-answers': 23,
+            '0-1-answers': 25,
+        }
+
+    def test_scoring_costs_no_further_queries(self):
+        FormSet = quiz_formset_factory(self.quiz)
+        formset = FormSet(self.data, difficulty=Question.HARD, prefix='0')
+        card = self.assertNumQueries(0, formset.get_score_card)
+        assert_equal(1, card.score)
+        assert_equal(2, card.maximum_score)
+        assert_equal(1, self.assertNumQueries(0, formset.calculate_score))
+        assert_equal(2, formset.maximum_score)
+        assert_equal([23, 25], formset.get_answer_ids())
+
+    def test_compiled_scoring_matches(self):
+        FormSet = quiz_formset_factory(get_compiled_quiz(self.quiz.slug))
+        formset = FormSet(self.data, difficulty=Question.HARD, prefix='0')
+        assert_equal(1, self.assertNumQueries(0, formset.calculate_score))
+        assert_equal(2, formset.maximum_score)
+
+    def test_wizard_scores_the_steps_once(self):
+        FormSet = quiz_formset_factory(get_compiled_quiz(self.quiz.slug))
+        formset = FormSet(self.data, difficulty=Question.HARD, prefix='0')
+        scored = []
+        get_answer_key = formset.get_answer_key
+        formset.get_answer_key = lambda: scored.append(1) or get_answer_key()
+        wizard, formset_list = QuizBoundFormWizard([FormSet]), [formset]
+        assert_equal(1, wizard.get_total_score(formset_list))
+        assert_equal(2, wizard.get_maximum_score(formset_list))
+        assert_equal(1, len(scored))
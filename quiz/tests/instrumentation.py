@@ -0,0 +1,158 @@
+import logging
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.urlresolvers import resolve, reverse
+from django.test import TestCase
+from nose.tools import *
+
+from quiz import instrumentation, views
+from quiz.instrumentation import (
+    Recorder, RingBufferSink, LocalStatsdSink, StatsdSink,
+    instrument, phase, tag,
+    get_recorder, get_sinks
+)
+from quiz.models import Quiz, QuizResult
+
+SINKS = [
+    ('quiz.instrumentation.RingBufferSink', {'size': 3}),
+    'quiz.instrumentation.LocalStatsdSink',
+]
+
+
+class InstrumentationTestCase(TestCase):
+
+    def setUp(self):
+        super(InstrumentationTestCase, self).setUp()
+        self.old_sinks = getattr(settings, 'QUIZ_INSTRUMENTATION_SINKS', ())
+        settings.QUIZ_INSTRUMENTATION_SINKS = SINKS
+        self.ring_buffer, self.statsd = get_sinks()
+        del self.ring_buffer.measurements[:]
+        del self.statsd.packets[:]
+
+    def tearDown(self):
+        settings.QUIZ_INSTRUMENTATION_SINKS = self.old_sinks
+        super(InstrumentationTestCase, self).tearDown()
+
+
+class TestInstrumentation(InstrumentationTestCase):
+
+    def test_disabled(self):
+        settings.QUIZ_INSTRUMENTATION_SINKS = ()
+        calls = []
+        @instrument('view')
+        def view():
+            calls.append(get_recorder())
+            return Quiz.objects.count()
+        assert_equal(0, view())
+        assert_equal([None], calls)
+        assert_equal([], self.ring_buffer.measurements)
+
+    def test_instrument_records_queries_and_phases(self):
+        @phase('inner')
+        def inner():
+            tag('step', 2)
+            return list(Quiz.objects.all())
+
+        @instrument('view')
+        def view():
+            Quiz.objects.count()
+            inner()
+            inner()
+            return 'response'
+
+        assert_equal('response', view())
+        assert_equal(None, get_recorder())
+        measurement = self.ring_buffer.latest()[0]
+        assert_equal('view', measurement['name'])
+        assert_equal({'step': 2}, measurement['tags'])
+        assert_equal(3, measurement['queries'])
+        assert_equal(['inner'], measurement['phases'].keys())
+        assert_true(measurement['time_ms'] >= measurement['phases']['inner'])
+        # Queries made outside instrumented views aren't counted:
+        Quiz.objects.count()
+        assert_equal(3, self.ring_buffer.latest()[0]['queries'])
+
+        packet = self.statsd.packets[-1].split('\n')
+        assert_true('quiz.view.step2.queries:3|ms' in packet)
+        assert_true([line for line in packet
+                     if line.startswith('quiz.view.step2.phase.inner:')])
+
+    def test_statsd_names_are_sanitised(self):
+        stats = StatsdSink().get_stats({'name': 'view', 'time_ms': 1.0,
+            'queries': 1, 'db_time_ms': 0.5, 'phases': {},
+            'tags': {'step': '0.time:1|ms\nevil'}})
+        assert_equal(['quiz.view.step0_time_1_ms_evil.time:1.000|ms'],
+                     stats[:1])
+
+    def test_ring_buffer_keeps_the_latest(self):
+        sink = RingBufferSink(size=2)
+        for i in range(3):
+            sink.emit(i)
+        assert_equal([2, 1], sink.latest())
+
+    def test_log_sink(self):
+        records = []
+        class Handler(logging.Handler):
+            def emit(self, record):
+                records.append(record.getMessage())
+        handler, level = Handler(), instrumentation.logger.level
+        instrumentation.logger.addHandler(handler)
+        instrumentation.logger.setLevel(logging.INFO)
+        try:
+            recorder = Recorder('view')
+            recorder.add_query(0.002)
+            instrumentation.LogSink().emit(recorder.finish())
+        finally:
+            instrumentation.logger.removeHandler(handler)
+            instrumentation.logger.setLevel(level)
+        assert_true(records[0].startswith('view'))
+        assert_true('queries=1 db=2.0ms' in records[0])
+
+
+class TestInstrumentedViews(InstrumentationTestCase):
+    fixtures = ['python-zen.yaml', 'testuser.yaml']
+    # 1 quiz, 9 questions, 26 answers, 9 correct answers (one per question)
+    # A single test-user, TestyMcTesterson, with password 'password'
+
+    def setUp(self):
+        super(TestInstrumentedViews, self).setUp()
+        self.user = User.objects.get(username='TestyMcTesterson')
+        self.client.login(username=self.user.username, password='password')
+
+    def test_quiz_views_are_measured(self):
+        self.client.get(reverse('quiz_detail', args=['python-zen']))
+        result = QuizResult.objects.record(quiz=Quiz.objects.get(pk=1),
+            user=self.user, score=1, maximum_score=9)
+        self.client.get(result.get_absolute_url())
+        completed, detail = self.ring_buffer.latest()
+        assert_equal('quiz_detail', detail['name'])
+        assert_equal({'step': 'start'}, detail['tags'])
+        for name in ('compiled', 'formsets', 'render'):
+            assert_true(name in detail['phases'], name)
+        assert_equal('quiz_completed', completed['name'])
+        assert_true('leaderboard' in completed['phases'])
+
+    def test_posted_steps_are_checked(self):
+        url = reverse('quiz_detail', args=['python-zen'])
+        for step, expected in (('0', 0), ('7', 'start'),
+                               ('0.time:1|ms\nevil', 'start')):
+            self.client.post(url, {'wizard_step': step,
+                '0-INITIAL_FORMS': 4, '0-TOTAL_FORMS': 4})
+            assert_equal({'step': expected},
+                         self.ring_buffer.latest()[0]['tags'])
+
+    def test_instrumentation_leaves_slugs_free(self):
+        assert_equal(views.quiz_detail,
+                     resolve(reverse('quiz_detail',
+                                     args=['instrumentation']))[0])
+
+    def test_instrumentation_view_is_staff_only(self):
+        url = reverse('quiz_instrumentation')
+        self.client.get(reverse('quiz_detail', args=['python-zen']))
+        self.assertNotContains(self.client.get(url), 'quiz_detail')
+        self.user.is_staff = True
+        self.user.save()
+        self.assertContains(self.client.get(url), 'quiz_detail')
+        settings.QUIZ_INSTRUMENTATION_SINKS = ()
+        assert_equal(404, self.client.get(url).status_code)
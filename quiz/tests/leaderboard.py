@@ -0,0 +1,109 @@
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase
+from nose.tools import *
+
+from quiz.leaderboard import Leaderboard, add_scores, rebuild_leaderboards
+from quiz.models import Quiz, QuizResult, ScoreBucket
+from quiz.tests.base import QueryCountTestCase, rolled_back
+
+
+class TestLeaderboard(QueryCountTestCase):
+    fixtures = ['python-zen.yaml']
+    # 1 quiz, 9 questions, 26 answers, 9 correct answers (one per question)
+
+    def setUp(self):
+        super(TestLeaderboard, self).setUp()
+        self.quiz = Quiz.objects.get(slug='python-zen')
+        self.other = Quiz.objects.create(name='Other', slug='other')
+        self.scores = [9, 7, 7, 5, 3, 3, 3, 0]
+        QuizResult.objects.record_many(({
+            'quiz': self.quiz, 'email': 'taker%d@bar.com' % i,
+            'score': score, 'maximum_score': 9,
+        } for i, score in enumerate(self.scores)), batch_size=3)
+        QuizResult.objects.record(quiz=self.other, email='foo@bar.com',
+                                  score=1, maximum_score=9)
+
+    def assert_buckets_match_results(self):
+        for quiz in (self.quiz, self.other):
+            distribution = Leaderboard(quiz).get_distribution()
+            expected = {}
+            for score in quiz.results.values_list('score', flat=True):
+                expected[score] = expected.get(score, 0) + 1
+            assert_equal(sorted(expected.items()), distribution)
+
+    def test_distribution(self):
+        leaderboard = Leaderboard(self.quiz)
+        assert_equal([(0, 1), (3, 3), (5, 1), (7, 2), (9, 1)],
+                     self.assertNumQueries(1, leaderboard.get_distribution))
+        assert_equal(8, leaderboard.total)
+        assert_equal(1, Leaderboard(self.other).total)
+
+    def test_rank_and_percentile(self):
+        leaderboard = Leaderboard(self.quiz)
+        assert_equal(1, leaderboard.rank(9))
+        assert_equal(2, leaderboard.rank(7))
+        assert_equal(5, leaderboard.rank(3))
+        assert_equal(8, leaderboard.rank(0))
+        assert_equal(87.5, leaderboard.percentile(9))
+        assert_equal(50.0, leaderboard.percentile(5))
+        assert_equal(0.0, leaderboard.percentile(0))
+        assert_equal(None, Leaderboard(Quiz.objects.create(
+            name='Empty', slug='empty')).percentile(5))
+
+    def test_top(self):
+        leaderboard = Leaderboard(self.quiz)
+        assert_equal([9, 7, 7], [r.score for r in leaderboard.top(3)])
+        assert_equal([9, 7, 7, 5, 3], [r.score for r in leaderboard.top(5)])
+        assert_equal(sorted(self.scores, reverse=True),
+                     [r.score for r in leaderboard.top(20)])
+
+    def test_created_and_deleted_results_are_counted(self):
+        result = QuizResult.objects.create(quiz=self.quiz, email='foo@bar.com',
+                                           score=4, maximum_score=9)
+        self.assert_buckets_match_results()
+        result.delete()
+        QuizResult.objects.filter(score=3)[0].delete()
+        self.assert_buckets_match_results()
+
+    def test_edited_results_move_buckets(self):
+        result = QuizResult.objects.filter(score=9)[0]
+        result.score = 4
+        result.save()
+        self.assert_buckets_match_results()
+        result.quiz = self.other
+        result.save()
+        self.assert_buckets_match_results()
+
+    def test_deleting_a_quiz_leaves_no_buckets(self):
+        self.quiz.delete()
+        assert_false(ScoreBucket.objects.filter(quiz=self.quiz.pk))
+        # Decrements never bring a bucket into being:
+        QuizResult.objects.get(quiz=self.other).delete()
+        add_scores({(self.other.pk, 8): -1})
+        assert_false(ScoreBucket.objects.filter(quiz=self.other, count__gt=0))
+        assert_false(ScoreBucket.objects.filter(quiz=self.other, score=8))
+
+    def test_rebuild_leaderboards(self):
+        ScoreBucket.objects.update(count=100)
+        rebuild_leaderboards()
+        self.assert_buckets_match_results()
+
+
+class TestLeaderboardTransactions(TransactionTestCase):
+    fixtures = ['python-zen.yaml']
+
+    def tearDown(self):
+        # Django only flushes before each TransactionTestCase, so clear up
+        # for the TestCases which follow.
+        call_command('flush', verbosity=0, interactive=False)
+
+    def test_saves_leave_the_callers_transaction_open(self):
+        quiz = Quiz.objects.get(slug='python-zen')
+        rolled_back(QuizResult.objects.create, quiz=quiz, email='foo@bar.com',
+                    score=3, maximum_score=9)
+        assert_false(QuizResult.objects.exists())
+        assert_false(ScoreBucket.objects.exists())
+        result = QuizResult.objects.create(quiz=quiz, email='foo@bar.com',
+                                           score=3, maximum_score=9)
+        rolled_back(result.delete)
+        assert_equal([(3, 1)], Leaderboard(quiz).get_distribution())
@@ -1,5 +1,10 @@
-from django.test import TestCase
-from quiz.models import Question, Answer
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase
+from quiz.models import Question, Answer, Quiz, QuizResult
+from quiz.listeners import start_counting, stop_counting
+from quiz.signals import results_recorded
+from quiz.tests.base import QueryCountTestCase, rolled_back
 from nose.tools import *
 
 
@@ -112,3 +117,90 @@ class TestQuestionQueryset(TestCase):
         questions = Question.objects.all()
         assert_equal(questions.answers.count(), questions.total_answers)
         assert_equal(0, Question.objects.filter(id=None).total_answers)
+
+
+class TestQuizResultManager(QueryCountTestCase):
+    fixtures = ['python-zen.yaml']
+    # 1 quiz, 9 questions, 26 answers, 9 correct answers (one per question)
+
+    def setUp(self):
+        super(TestQuizResultManager, self).setUp()
+        self.quiz = Quiz.objects.get(slug='python-zen')
+        self.answers = list(Answer.objects.correct.order_by('id'))
+        self.recorded = []
+        results_recorded.connect(self.on_results_recorded, sender=QuizResult)
+        # Measure the cost of recording alone, without the statistics.
+        stop_counting()
+
+    def tearDown(self):
+        super(TestQuizResultManager, self).tearDown()
+        results_recorded.disconnect(self.on_results_recorded, sender=QuizResult)
+        start_counting()
+
+    def on_results_recorded(self, sender, results, **kwargs):
+        self.recorded.append(results)
+
+    def test_record(self):
+        # one INSERT for the result, one (executemany) for its answers:
+        result = self.assertNumQueries(2, QuizResult.objects.record,
+            quiz=self.quiz, email='foo@bar.com', score=9, maximum_score=9,
+            answers=self.answers + [self.answers[0].pk]
+        )
+        assert result.pk
+        assert_equal(set(self.answers), set(result.answers.all()))
+        assert_equal([a.pk for a in self.answers], result.answer_ids)
+        assert_equal([[result]], self.recorded)
+
+    def test_record_without_answers(self):
+        result = self.assertNumQueries(1, QuizResult.objects.record,
+            quiz=self.quiz, email='foo@bar.com', score=0, maximum_score=9
+        )
+        assert_equal(0, result.answers.count())
+
+    def test_record_many(self):
+        answer_ids = [a.pk for a in self.answers]
+        results = ({
+            'quiz_id': self.quiz.pk,
+            'email': 'taker%d@bar.com' % i,
+            'score': i,
+            'maximum_score': 9,
+            'answers': answer_ids[:i],
+        } for i in range(10))
+        assert_equal(10, QuizResult.objects.record_many(results, batch_size=4))
+        assert_equal(10, QuizResult.objects.count())
+        assert_equal([4, 4, 2], [len(batch) for batch in self.recorded])
+        for result in QuizResult.objects.all():
+            assert_equal(result.score, result.answers.count())
+            assert_equal(
+                sorted(answer_ids[:result.score]),
+                sorted(result.answers.values_list('pk', flat=True))
+            )
+
+
+class TestRecordTransactions(TransactionTestCase):
+    fixtures = ['python-zen.yaml']
+
+    def setUp(self):
+        self.quiz = Quiz.objects.get(slug='python-zen')
+        self.answers = list(Answer.objects.correct.order_by('id'))
+        stop_counting()
+
+    def tearDown(self):
+        start_counting()
+        # Django only flushes before each TransactionTestCase, so clear up
+        # for the TestCases which follow.
+        call_command('flush', verbosity=0, interactive=False)
+
+    def test_record_leaves_the_callers_transaction_open(self):
+        rolled_back(QuizResult.objects.record, quiz=self.quiz,
+                    email='foo@bar.com', score=9, maximum_score=9,
+                    answers=self.answers)
+        assert_false(QuizResult.objects.exists())
+        assert_false(QuizResult.answers.through.objects.exists())
+
+    def test_record_commits_outside_a_transaction(self):
+        QuizResult.objects.record(quiz=self.quiz, email='foo@bar.com',
+                                  score=9, maximum_score=9,
+                                  answers=self.answers)
+        transaction.rollback()
+        assert_equal(9, QuizResult.objects.get().answers.count())
@@ -0,0 +1,124 @@
+from django.conf import settings
+from django.contrib import admin
+from django.core.management import call_command
+from django.db import connection
+from nose.tools import *
+
+from quiz import packing
+from quiz.admin import QuizResultAdmin
+from quiz.export import get_export_queryset, iter_results
+from quiz.models import Answer, AnswerStats, Quiz, QuizResult
+from quiz.packing import decode_answers, encode_answers, pack_results
+from quiz.stats import rebuild_stats
+from quiz.tests.base import QueryCountTestCase
+
+
+class TestEncoding(object):
+
+    def test_round_trip(self):
+        packed = encode_answers([3, None, 70000, 1])
+        assert_equal([3, None, 70000, 1], decode_answers(packed))
+
+    def test_fixed_width(self):
+        assert_equal(len(encode_answers([1, 2, 3])),
+                     len(encode_answers([4000000000, None, 65536])))
+        assert_equal([], decode_answers(encode_answers([])))
+
+
+class TestPackedStorage(QueryCountTestCase):
+    fixtures = ['python-zen.yaml']
+    # 1 quiz, 9 questions, 26 answers, 9 correct answers (one per question)
+
+    def setUp(self):
+        super(TestPackedStorage, self).setUp()
+        self.old_storage = packing.STORAGE
+        self.quiz = Quiz.objects.get(slug='python-zen')
+        self.correct = list(Answer.objects.correct.order_by('-id')
+                            .values_list('pk', flat=True))
+        self.through = QuizResult.answers.through
+
+    def tearDown(self):
+        packing.STORAGE = self.old_storage
+        super(TestPackedStorage, self).tearDown()
+
+    def record(self, answers):
+        return QuizResult.objects.record(quiz=self.quiz, score=len(answers),
+            maximum_score=9, answers=answers)
+
+    def count_inserts(self, func, *args):
+        # Only into the results and answers tables, not the statistics.
+        tables = [QuizResult._meta.db_table, self.through._meta.db_table]
+        old_debug = settings.DEBUG
+        settings.DEBUG = True
+        connection.queries = []
+        try:
+            result = func(*args)
+        finally:
+            settings.DEBUG = old_debug
+        return result, len([q for q in connection.queries
+                            if q['sql'].split()[:3] in
+                            [['INSERT', 'INTO', '"%s"' % t] for t in tables]])
+
+    def test_a_result_is_one_row(self):
+        packing.STORAGE = 'packed'
+        result, inserts = self.count_inserts(self.record, self.correct)
+        assert_equal(1, inserts)
+        assert_equal(0, self.through.objects.count())
+        result = QuizResult.objects.get(pk=result.pk)
+        # In the order given, with no second query:
+        assert_equal(self.correct,
+                     self.assertNumQueries(0, result.get_answer_ids))
+
+    def test_both(self):
+        packing.STORAGE = 'both'
+        result = self.record(self.correct[:4])
+        assert_equal(4, self.through.objects.count())
+        assert_equal(self.correct[:4], decode_answers(
+            QuizResult.objects.get(pk=result.pk).packed_answers))
+
+    def test_unpacked_results_read_the_answers_table(self):
+        result = QuizResult.objects.get(pk=self.record(self.correct[:2]).pk)
+        assert_equal(None, result.packed_answers)
+        assert_equal(self.correct[:2],
+                     self.assertNumQueries(1, result.get_answer_ids))
+
+    def test_pack_results(self):
+        results = [self.record(self.correct[:i]) for i in range(4)]
+        packing.STORAGE = 'packed'
+        results.append(self.record(self.correct))
+        assert_equal(4, pack_results(batch_size=3))
+        assert_equal(0, pack_results())
+        assert_equal(6, self.through.objects.count())
+        assert_equal(0, pack_results(delete_rows=True))
+        assert_equal(0, self.through.objects.count())
+        for i, result in enumerate(results[:4]):
+            assert_equal(self.correct[:i], QuizResult.objects.get(
+                pk=result.pk).get_answer_ids())
+        assert_false(QuizResult.objects.filter(packed_answers=None))
+
+    def test_readers_see_packed_results(self):
+        self.record(self.correct[:3])
+        packing.STORAGE = 'packed'
+        self.record(self.correct[:5])
+        assert_equal([self.correct[:3], self.correct[:5]],
+            [r['answers'] for r in iter_results(get_export_queryset())])
+        stats = list(AnswerStats.objects.order_by('pk').values_list(
+            'pk', 'times_chosen'))
+        rebuild_stats()
+        assert_equal(stats, list(AnswerStats.objects.order_by('pk')
+                                 .values_list('pk', 'times_chosen')))
+
+    def test_command(self):
+        self.record(self.correct)
+        call_command('pack_quiz_results', delete_rows=True, verbosity=0)
+        assert_equal(0, self.through.objects.count())
+        assert_equal(self.correct, QuizResult.objects.get().get_answer_ids())
+
+    def test_admin_leaves_packed_answers_alone(self):
+        model_admin = QuizResultAdmin(QuizResult, admin.site)
+        result = self.record(self.correct[:2])
+        assert_false('answers' in model_admin.get_readonly_fields(None, result))
+        packing.STORAGE = 'packed'
+        result = self.record(self.correct[:2])
+        assert_true('answers' in model_admin.get_readonly_fields(None, result))
+        assert_false('answers' in model_admin.get_readonly_fields(None))
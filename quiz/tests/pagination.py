@@ -0,0 +1,132 @@
+from datetime import datetime, timedelta
+
+from django.core.urlresolvers import reverse
+from nose.tools import *
+
+from quiz.forms import QuizListForm
+from quiz.models import Question, Quiz
+from quiz.pagination import KeysetPage, decode_cursor, encode_cursor
+from quiz.tests.base import QueryCountTestCase
+
+
+class TestCursors(QueryCountTestCase):
+
+    def test_round_trip(self):
+        created = datetime(2010, 3, 4, 5, 6, 7, 89)
+        cursor = encode_cursor(created, 42)
+        assert_equal('20100304050607000089-42', cursor)
+        assert_equal((created, 42), decode_cursor(cursor))
+
+    def test_invalid_cursors(self):
+        for cursor in ('', '42', '2010-42', 'abcdefghijklmnopqrst-1',
+                       '20100304050607000089-x', '20101304050607000089-1'):
+            assert_raises(ValueError, decode_cursor, cursor)
+
+
+class TestKeysetPage(QueryCountTestCase):
+    fixtures = ['python-zen.yaml']
+    # 1 quiz, 9 questions, 26 answers, 9 correct answers (one per question)
+
+    def setUp(self):
+        super(TestKeysetPage, self).setUp()
+        Quiz.objects.all().delete()
+        created = datetime(2010, 1, 1)
+        for i in range(7):
+            quiz = Quiz.objects.create(name='Quiz %d' % i, slug='quiz-%d' % i,
+                                       status=Quiz.LIVE)
+            # Two quizzes share each creation time, to exercise the id
+            # tie-break.
+            Quiz.objects.filter(pk=quiz.pk).update(
+                datetime_created=created + timedelta(hours=i // 2))
+        self.live = Quiz.objects.filter(status=Quiz.LIVE)
+        self.newest_first = list(self.live.order_by('-datetime_created', '-id'))
+
+    def walk(self, per_page):
+        pages, page = [], KeysetPage(self.live, per_page)
+        while True:
+            pages.append(page.object_list)
+            if not page.has_next():
+                return pages, page
+            page = KeysetPage(self.live, per_page, after=page.next_cursor())
+
+    def test_walks_every_quiz_once_in_order(self):
+        pages, last = self.walk(3)
+        assert_equal([3, 3, 1], [len(p) for p in pages])
+        assert_equal(self.newest_first, sum(pages, []))
+        assert_true(last.has_previous())
+
+    def test_first_page(self):
+        page = KeysetPage(self.live, 3)
+        assert_false(page.has_previous())
+        assert_true(page.has_next())
+        assert_equal(None, page.previous_cursor())
+
+    def test_walks_back(self):
+        pages, page = self.walk(3)
+        page = KeysetPage(self.live, 3, before=page.previous_cursor())
+        assert_equal(pages[1], page.object_list)
+        page = KeysetPage(self.live, 3, before=page.previous_cursor())
+        assert_equal(pages[0], page.object_list)
+        assert_false(page.has_previous())
+        assert_true(page.has_next())
+
+    def test_each_page_is_one_query(self):
+        pages, page = self.walk(2)
+        page = KeysetPage(self.live, 2, after=encode_cursor(
+            self.newest_first[4].datetime_created, self.newest_first[4].pk))
+        self.assertNumQueries(1, lambda: page.object_list)
+        assert_equal(self.newest_first[5:7], page.object_list)
+        sql = str(page.get_queryset().query)
+        assert_false('OFFSET' in sql.upper())
+
+
+class TestQuizListPagination(QueryCountTestCase):
+    fixtures = ['python-zen.yaml']
+    # 1 quiz, 9 questions, 26 answers, 9 correct answers (one per question)
+
+    def setUp(self):
+        super(TestQuizListPagination, self).setUp()
+        self.quiz = Quiz.objects.get(slug='python-zen')
+        self.other = Quiz.objects.create(name='Other', slug='other',
+            description='Something else', status=Quiz.LIVE)
+        self.other.questions = Question.objects.filter(
+            difficulty=Question.EASY)
+
+    def get(self, **data):
+        return self.client.get(reverse('quiz_list'), data)
+
+    def test_search(self):
+        response = self.get(q='else')
+        self.assertContains(response, 'Other')
+        self.assertNotContains(response, self.quiz.name)
+
+    def test_difficulty_mix(self):
+        response = self.get(difficulty=[Question.EASY, Question.HARD])
+        self.assertContains(response, self.quiz.name)
+        self.assertNotContains(response, 'Something else')
+        response = self.get(difficulty=[Question.EASY])
+        self.assertContains(response, 'Something else')
+
+    def test_form_filter(self):
+        form = QuizListForm({'difficulty': [str(Question.HARD)]})
+        assert_equal([self.quiz], list(form.filter(Quiz.objects.all())))
+        form = QuizListForm({'difficulty': ['12345']})
+        assert_equal(2, form.filter(Quiz.objects.all()).count())
+
+    def test_pages_link_to_each_other(self):
+        from quiz import views
+        old_size, views.LIST_PAGE_SIZE = views.LIST_PAGE_SIZE, 1
+        try:
+            response = self.get(q='e')
+            assert_equal(1, len(response.context['page'].object_list))
+            self.assertContains(response, 'q=e&amp;after=')
+            self.assertNotContains(response, 'before=')
+            cursor = response.context['page'].next_cursor()
+            response = self.get(q='e', after=cursor)
+            self.assertContains(response, 'q=e&amp;before=')
+            self.assertNotContains(response, 'after=')
+        finally:
+            views.LIST_PAGE_SIZE = old_size
+
+    def test_invalid_cursor(self):
+        assert_equal(404, self.get(after='nonsense').status_code)
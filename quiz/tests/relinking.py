@@ -0,0 +1,123 @@
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TransactionTestCase
+from nose.tools import *
+
+from quiz import relinking
+from quiz.listeners import start_listening, stop_listening
+from quiz.models import Quiz, QuizResult
+from quiz.tests.base import QueryCountTestCase
+
+
+class TestRelinking(QueryCountTestCase):
+    fixtures = ['python-zen.yaml']
+    # 1 quiz, 9 questions, 26 answers, 9 correct answers (one per question)
+
+    def setUp(self):
+        super(TestRelinking, self).setUp()
+        self.quiz = Quiz.objects.get(slug='python-zen')
+        self.emails = ['user%d@bar.com' % i for i in range(3)]
+        for email in self.emails + self.emails + ['', 'nobody@bar.com']:
+            QuizResult.objects.create(quiz=self.quiz, email=email, score=9,
+                                      maximum_score=9)
+        start_listening()
+
+    def tearDown(self):
+        stop_listening()
+        relinking.relink_queue.size = relinking.BATCH_SIZE
+        relinking.relink_queue.flush()
+        super(TestRelinking, self).tearDown()
+
+    def create_users(self, emails=None, prefix='user'):
+        return [User.objects.create(username='%s%d' % (prefix, i), email=email)
+                for i, email in enumerate(emails or self.emails)]
+
+    def linked(self):
+        return dict([(user.email, QuizResult.objects.filter(user=user).count())
+                     for user in User.objects.all()])
+
+    def test_users_are_linked_as_they_are_saved(self):
+        self.create_users()
+        self.create_users(prefix='again')
+        # Only the first user with an email address gets its results:
+        assert_equal([2, 2, 2, 0, 0, 0],
+            [QuizResult.objects.filter(user=user).count()
+             for user in User.objects.order_by('id')])
+
+    def test_batches(self):
+        relinking.relink_queue.size = 3
+        self.create_users(self.emails[:2])
+        assert_equal(2, len(relinking.relink_queue))
+        assert_equal(8, QuizResult.objects.filter(user=None).count())
+        self.create_users([self.emails[2]], prefix='third')
+        assert_equal(0, len(relinking.relink_queue))
+        assert_equal(2, QuizResult.objects.filter(user=None).count())
+
+    def test_one_update_per_batch(self):
+        relinking.relink_queue.size = 100
+        self.create_users()
+        # One query to find the quizzes taken, and one to re-link, plus one
+        # to find that there are no archived results to re-link:
+        self.assertNumQueries(3, relinking.relink_queue.flush)
+        assert_equal(dict([(email, 2) for email in self.emails]),
+                     self.linked())
+
+    def test_suspended_imports_are_reconciled(self):
+        relinking.without_relinking(self.create_users)()
+        assert_equal(8, QuizResult.objects.filter(user=None).count())
+        call_command('relink_quiz_results', verbosity=0)
+        assert_equal(2, QuizResult.objects.filter(user=None).count())
+        assert_equal(0, relinking.relink_results())
+
+    def test_blank_emails_are_left_alone(self):
+        user = User.objects.create(username='blank', email='')
+        assert_equal(0, QuizResult.objects.filter(user=user).count())
+        assert_equal(0, relinking.relink_results())
+
+
+class TestRelinkingTransactions(TransactionTestCase):
+    fixtures = ['python-zen.yaml']
+
+    def setUp(self):
+        quiz = Quiz.objects.get(slug='python-zen')
+        QuizResult.objects.create(quiz=quiz, email='user@bar.com', score=9,
+                                  maximum_score=9)
+        start_listening()
+
+    def tearDown(self):
+        stop_listening()
+        relinking.relink_queue.size = relinking.BATCH_SIZE
+        relinking.relink_queue.take()
+        # Django only flushes before each TransactionTestCase, so clear up
+        # for the TestCases which follow.
+        call_command('flush', verbosity=0, interactive=False)
+
+    def create_users(self, count):
+        transaction.enter_transaction_management()
+        transaction.managed(True)
+        try:
+            for i in range(count):
+                User.objects.create(username='user%d' % i,
+                                    email='user@bar.com')
+            transaction.rollback()
+        finally:
+            transaction.leave_transaction_management()
+
+    def test_relinking_leaves_the_saving_transaction_open(self):
+        self.create_users(1)
+        assert_false(User.objects.exists())
+        assert_equal(1, QuizResult.objects.filter(user=None).count())
+
+    def test_full_batches_leave_the_saving_transaction_open(self):
+        relinking.relink_queue.size = 2
+        self.create_users(2)
+        assert_equal(0, len(relinking.relink_queue))
+        assert_false(User.objects.exists())
+        assert_equal(1, QuizResult.objects.filter(user=None).count())
+
+    def test_full_batches_outside_a_transaction_are_committed(self):
+        relinking.relink_queue.size = 1
+        user = User.objects.create(username='user', email='user@bar.com')
+        transaction.rollback()
+        assert_equal(user.pk, QuizResult.objects.get().user_id)
@@ -0,0 +1,83 @@
+from django.conf import settings
+from django.core.urlresolvers import reverse
+from django.db import router
+from django.test import TestCase
+from django.utils import simplejson
+from nose.tools import *
+
+from quiz import routers
+from quiz.compiled import compile_quiz
+from quiz.models import Answer, Question, Quiz, QuizResult
+
+
+class TestQuizReplicaRouter(TestCase):
+    """Runs against two SQLite databases: 'default' is the primary and
+    'replica' a replica which never catches up."""
+    multi_db = True
+    fixtures = ['python-zen.yaml']
+    # 1 quiz, 9 questions, 26 answers, 9 correct answers (one per question)
+
+    def setUp(self):
+        super(TestQuizReplicaRouter, self).setUp()
+        self.old_routers = router.routers
+        self.old_middleware = settings.MIDDLEWARE_CLASSES
+        self.old_pin_seconds = routers.PIN_SECONDS
+        router.routers = [routers.QuizReplicaRouter('default', ['replica'])]
+        settings.MIDDLEWARE_CLASSES = list(self.old_middleware) + [
+            'quiz.routers.ReplicaPinningMiddleware']
+        routers.unpin()
+
+    def tearDown(self):
+        router.routers = self.old_routers
+        settings.MIDDLEWARE_CLASSES = self.old_middleware
+        routers.PIN_SECONDS = self.old_pin_seconds
+        routers.unpin()
+        super(TestQuizReplicaRouter, self).tearDown()
+
+    def test_reads_go_to_the_replica(self):
+        assert_equal('replica', Quiz.objects.all().db)
+        assert_equal('replica', QuizResult.objects.all().db)
+        Quiz.objects.using('default').filter(slug='python-zen').update(
+            name='Changed')
+        assert_equal('Zen of Python',
+                     Quiz.objects.get(slug='python-zen').name)
+
+    def test_writes_go_to_the_primary_and_pin(self):
+        quiz = Quiz.objects.create(name='New', slug='new', status=Quiz.LIVE)
+        assert_equal('default', quiz._state.db)
+        assert_false(Quiz.objects.using('replica').filter(slug='new'))
+        # Reads after a write see it:
+        assert_equal(quiz, Quiz.objects.get(slug='new'))
+        routers.unpin()
+        assert_false(Quiz.objects.filter(slug='new'))
+
+    def test_other_apps_are_not_routed(self):
+        from django.contrib.auth.models import User
+        assert_equal('default', User.objects.all().db)
+
+    def test_compiling_reads_the_primary(self):
+        Answer.objects.using('default').filter(pk=13).update(answer='Fresh')
+        quiz = Quiz.objects.get(slug='python-zen')
+        compiled = compile_quiz(quiz)
+        assert_equal('Fresh', dict(compiled.get_questions(Question.MEDIUM)[0]
+                                   .choices)[13])
+
+    def submit(self):
+        answers = list(Answer.objects.correct.order_by('id').values_list(
+            'pk', flat=True))
+        response = self.client.post(
+            reverse('quiz_api_submit', args=['python-zen']),
+            simplejson.dumps({'answers': answers, 'email': 'foo@bar.com'}),
+            content_type='application/json')
+        assert_equal(201, response.status_code)
+        return simplejson.loads(response.content)['url']
+
+    def test_sessions_are_pinned_after_submitting(self):
+        url = self.submit()
+        assert_equal(200, self.client.get(url).status_code)
+
+    def test_lag_without_pinning(self):
+        routers.PIN_SECONDS = -1
+        url = self.submit()
+        # The replica hasn't seen the result yet:
+        assert_equal(404, self.client.get(url).status_code)
@@ -0,0 +1,205 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.utils import simplejson
+from nose.tools import *
+
+from quiz.compiled import (
+    get_compiled_quiz, sample_questions, shuffle_choices
+)
+from quiz.forms import quiz_formset_factory
+from quiz.models import Quiz, QuizResult
+from quiz.submissions import DatabaseQueue, Submission, process_submissions
+from quiz.tests.base import QueryCountTestCase
+
+
+def get_correct_answers(quiz, seed, difficulty=None):
+    """The best answer to each question the seed picks."""
+    return [max(question.answers, key=lambda a: a.score).pk
+            for question in quiz.get_questions(difficulty, seed)]
+
+
+class TestSampleQuestions(QueryCountTestCase):
+
+    def test_samples_are_deterministic_and_ordered(self):
+        pool = range(1000)
+        sample = sample_questions(pool, 10, 42)
+        assert_equal(10, len(sample))
+        assert_equal(sorted(sample), list(sample))
+        assert_equal(sample, sample_questions(pool, 10, 42))
+        assert_not_equal(sample, sample_questions(pool, 10, 43))
+        # Each difficulty level gets its own draw:
+        assert_not_equal(sample, sample_questions(pool, 10, 42, 10))
+
+    def test_small_pools_are_asked_in_full(self):
+        assert_equal((1, 2, 3), sample_questions([1, 2, 3], 5, 42))
+        assert_equal((1, 2, 3), sample_questions([1, 2, 3], None, 42))
+
+
+class SampledQuizTestCase(QueryCountTestCase):
+    fixtures = ['python-zen.yaml', 'testuser.yaml']
+    # 1 quiz, 9 questions, 26 answers, 9 correct answers (one per question)
+    # A single test-user, TestyMcTesterson, with password 'password'
+
+    def setUp(self):
+        super(SampledQuizTestCase, self).setUp()
+        self.quiz = Quiz.objects.get(slug='python-zen')
+        self.quiz.sample_size = 2
+        self.quiz.save()
+        self.compiled = get_compiled_quiz('python-zen')
+        self.user = User.objects.get(username='TestyMcTesterson')
+
+
+class TestCompiledSampling(SampledQuizTestCase):
+
+    def test_questions_per_level(self):
+        # The levels hold 4, 3 and 2 questions:
+        assert_equal([2, 2, 2], [len(self.compiled.get_questions(d, 7))
+                                 for d in self.compiled.difficulty_levels])
+        assert_equal(6, len(self.compiled.get_questions(seed=7)))
+        assert_equal(9, len(self.compiled.get_questions()))
+        assert_equal(6, self.compiled.get_maximum_score(seed=7))
+        key = self.compiled.get_answer_key(seed=7)
+        assert_equal([q.pk for q in self.compiled.get_questions(seed=7)],
+                     key.question_ids)
+        assert_equal(9, len(self.compiled.answer_key))
+
+    def test_formsets_sample_like_the_compiled_quiz(self):
+        difficulty = self.compiled.difficulty_levels[0]
+        for quiz in (self.quiz, self.compiled):
+            formset = quiz_formset_factory(quiz)(difficulty=difficulty,
+                                                 seed=11)
+            assert_equal([q.pk for q in self.compiled.get_questions(
+                difficulty, 11)], [q.pk for q in formset.get_questions()])
+            assert_equal(2, formset.maximum_score)
+
+    def test_queued_submissions_are_scored_against_their_sample(self):
+        queue = DatabaseQueue()
+        queue.put(Submission(self.quiz.pk,
+            get_correct_answers(self.compiled, 5), email='foo@bar.com',
+            seed=5
+        ))
+        assert_equal(1, process_submissions(queue))
+        result = QuizResult.objects.get()
+        assert_equal((6, 6), (result.score, result.maximum_score))
+
+
+class TestWizardSampling(SampledQuizTestCase):
+
+    def setUp(self):
+        super(TestWizardSampling, self).setUp()
+        self.old_storage = getattr(settings, 'QUIZ_WIZARD_STORAGE', None)
+        settings.QUIZ_WIZARD_STORAGE = 'session'
+        self.client.login(username=self.user.username, password='password')
+        self.url = reverse('quiz_detail', args=['python-zen'])
+
+    def tearDown(self):
+        settings.QUIZ_WIZARD_STORAGE = self.old_storage
+        super(TestWizardSampling, self).tearDown()
+
+    def test_attempt_keeps_its_sample(self):
+        response = self.client.get(self.url)
+        attempt = response.context['attempt']
+        value = self.client.session['quiz:wizard:%s' % attempt][0]
+        seed = simplejson.loads(value)['seed']
+        for step, difficulty in enumerate(self.compiled.difficulty_levels):
+            answers = get_correct_answers(self.compiled, seed, difficulty)
+            data = {
+                'wizard_step': str(step), 'wizard_attempt': attempt,
+                '%s-INITIAL_FORMS' % step: 2, '%s-TOTAL_FORMS' % step: 2,
+            }
+            for i, answer in enumerate(answers):
+                data['%s-%s-answers' % (step, i)] = answer
+            response = self.client.post(self.url, data)
+        result = QuizResult.objects.get(user=self.user)
+        assert_equal((6, 6), (result.score, result.maximum_score))
+
+    def test_hidden_field_wizard_keeps_its_sample_in_the_session(self):
+        settings.QUIZ_WIZARD_STORAGE = None
+        response = self.client.get(self.url)
+        assert_equal(2, len(response.context['form'].forms))
+        seed = self.client.session['quiz:seed:%s' % self.quiz.pk]
+        self.client.get(self.url)
+        assert_equal(seed, self.client.session['quiz:seed:%s' % self.quiz.pk])
+
+
+class TestApiSampling(SampledQuizTestCase):
+
+    def setUp(self):
+        super(TestApiSampling, self).setUp()
+        self.paper_url = reverse('quiz_api_paper', args=['python-zen'])
+        self.submit_url = reverse('quiz_api_submit', args=['python-zen'])
+
+    def submit(self, data):
+        return self.client.post(self.submit_url, simplejson.dumps(data),
+                                content_type='application/json')
+
+    def test_papers_can_be_fetched_again(self):
+        paper = simplejson.loads(self.client.get(self.paper_url).content)
+        assert_equal([2, 2, 2], [len(l['questions']) for l in paper['levels']])
+        response = self.client.get(self.paper_url, {'paper': paper['paper']})
+        assert_equal(paper, simplejson.loads(response.content))
+        response = self.client.get(self.paper_url, {'paper': paper['paper']},
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        assert_equal(304, response.status_code)
+        response = self.client.get(self.paper_url, {'paper': 'forged'})
+        assert_equal(404, response.status_code)
+
+    def test_submissions_need_their_paper(self):
+        paper = simplejson.loads(self.client.get(self.paper_url).content)
+        seed = int(paper['paper'].split('-')[0])
+        answers = get_correct_answers(self.compiled, seed)
+        response = self.submit({'answers': answers, 'email': 'foo@bar.com'})
+        assert_equal(400, response.status_code)
+        assert_true('paper' in simplejson.loads(response.content)['errors'])
+        response = self.submit({'answers': answers, 'email': 'foo@bar.com',
+                                'paper': paper['paper']})
+        assert_equal(201, response.status_code)
+        assert_equal(6, simplejson.loads(response.content)['maximum_score'])
+
+
+class TestAnswerShuffling(QueryCountTestCase):
+    fixtures = ['python-zen.yaml']
+    # 1 quiz, 9 questions, 26 answers, 9 correct answers (one per question)
+
+    def setUp(self):
+        super(TestAnswerShuffling, self).setUp()
+        self.quiz = Quiz.objects.get(slug='python-zen')
+        self.quiz.shuffle_answers = True
+        self.quiz.save()
+        self.compiled = get_compiled_quiz('python-zen')
+
+    def test_shuffles_are_deterministic(self):
+        choices = [(i, 'Answer %d' % i) for i in range(10)]
+        shuffled = shuffle_choices(choices, 42, 1)
+        assert_equal(sorted(choices), sorted(shuffled))
+        assert_equal(shuffled, shuffle_choices(choices, 42, 1))
+        assert_not_equal(shuffled, shuffle_choices(choices, 43, 1))
+        assert_not_equal(shuffled, shuffle_choices(choices, 42, 2))
+
+    def get_choices(self, quiz, seed, data=None):
+        formset = quiz_formset_factory(quiz)(data, seed=seed,
+            difficulty=self.compiled.difficulty_levels[0], prefix='0')
+        return [list(form.fields['answers'].choices)
+                for form in formset.forms]
+
+    def test_formsets_shuffle_without_queries(self):
+        choices = self.assertNumQueries(0, self.get_choices, self.compiled, 3)
+        assert_equal(choices, self.get_choices(self.quiz, 3))
+        # The same seed gives the same order when the step is revalidated:
+        data = {'0-INITIAL_FORMS': 4, '0-TOTAL_FORMS': 4}
+        assert_equal(choices, self.get_choices(self.compiled, 3, data))
+        unshuffled = self.get_choices(self.compiled, None)
+        assert_equal([sorted(c) for c in unshuffled],
+                     [sorted(c) for c in choices])
+        assert_true([seed for seed in range(5)
+                     if self.get_choices(self.compiled, seed) != unshuffled])
+
+    def test_papers_are_shuffled(self):
+        url = reverse('quiz_api_paper', args=['python-zen'])
+        paper = simplejson.loads(self.client.get(url).content)
+        seed = int(paper['paper'].split('-')[0])
+        question = self.compiled.get_questions()[0]
+        assert_equal([pk for pk, answer in shuffle_choices(
+            question.choices, seed, question.pk)],
+            [a['id'] for a in paper['levels'][0]['questions'][0]['answers']])
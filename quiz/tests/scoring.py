@@ -0,0 +1,62 @@
+from unittest import TestCase as UnitTestCase
+from nose.tools import *
+
+from quiz.compiled import compile_quiz
+from quiz.models import Quiz, Question
+from quiz.scoring import AnswerKey
+from quiz.tests.base import QueryCountTestCase
+
+
+class TestAnswerKey(UnitTestCase):
+
+    def setUp(self):
+        # question 1: answers 1 (wrong), 2 (right)
+        # question 2: answers 3 (right), 4 (wrong)
+        # question 3: no answers at all
+        self.key = AnswerKey(
+            rows=((1, 1, 0), (1, 2, 1), (2, 3, 1), (2, 4, 0)),
+            question_ids=(1, 2, 3),
+        )
+
+    def test_maximum_score(self):
+        assert_equal(3, len(self.key))
+        assert_equal({1: 1, 2: 1, 3: 0}, self.key.maximum_scores)
+        assert_equal(2, self.key.maximum_score)
+
+    def test_score(self):
+        card = self.key.score([2, 4])
+        assert_equal(1, card.score)
+        assert_equal(2, card.maximum_score)
+        assert_equal([2, 4], card.answer_ids)
+        assert_equal([1], [q.question_id for q in card.correct])
+        assert_equal([2], [q.question_id for q in card.incorrect])
+        assert_equal([3], [q.question_id for q in card.unanswered])
+
+    def test_score_ignores_unknown_and_repeated_answers(self):
+        card = self.key.score([2, 1, 99])
+        assert_equal(1, card.score)
+        assert_equal([2], card.answer_ids)
+        assert_equal([99], card.unknown_answer_ids)
+
+    def test_update(self):
+        other = AnswerKey(rows=((3, 5, 1), (4, 6, 1)))
+        self.key.update(other)
+        assert_equal([1, 2, 3, 4], self.key.question_ids)
+        assert_equal(4, self.key.maximum_score)
+        assert_equal(4, self.key.score([2, 3, 5, 6]).score)
+
+
+class TestGetAnswerKey(QueryCountTestCase):
+    fixtures = ['python-zen.yaml']
+    # 1 quiz, 9 questions, 26 answers, 9 correct answers (one per question)
+
+    def test_compiled_answer_key(self):
+        compiled = compile_quiz(Quiz.objects.get(slug='python-zen'))
+        assert_equal(9, compiled.answer_key.maximum_score)
+        hard = compiled.get_answer_key(Question.HARD)
+        assert_equal(2, hard.maximum_score)
+        assert_equal(
+            sorted(Question.objects.filter(
+                difficulty=Question.HARD).values_list('pk', flat=True)),
+            sorted(hard.question_ids)
+        )
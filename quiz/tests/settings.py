@@ -8,6 +8,11 @@ DATABASES = {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': 'tests.db',
     },
+    # Used by quiz.tests.routers:
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': 'tests-replica.db',
+    },
 }
 MIDDLEWARE_CLASSES = [
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -0,0 +1,118 @@
+from django.contrib.admin import site
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase
+from nose.tools import *
+
+from quiz.admin import QuestionAdmin
+from quiz.models import (
+    Quiz, Question, Answer, QuizResult, QuestionStats, AnswerStats
+)
+from quiz.stats import record_answer_stats, rebuild_stats, stats_select
+from quiz.tests.base import rolled_back
+
+
+class TestAnswerStats(TestCase):
+    fixtures = ['python-zen.yaml']
+    # 1 quiz, 9 questions, 26 answers, 9 correct answers (one per question)
+
+    def setUp(self):
+        super(TestAnswerStats, self).setUp()
+        self.quiz = Quiz.objects.get(slug='python-zen')
+        self.correct = list(Answer.objects.correct.order_by('id'))
+        # One incorrect answer per question, in question order:
+        incorrect = {}
+        for answer in Answer.objects.incorrect.order_by('-id'):
+            incorrect[answer.question_id] = answer
+        self.incorrect = [incorrect[pk] for pk in sorted(incorrect)]
+
+    def record(self, answers):
+        return QuizResult.objects.record(quiz=self.quiz, email='foo@bar.com',
+            score=0, maximum_score=9, answers=answers
+        )
+
+    def assert_stats_match_results(self):
+        for answer in Answer.objects.all():
+            chosen = answer.used.count()
+            try:
+                assert_equal(chosen, answer.stats.times_chosen)
+            except AnswerStats.DoesNotExist:
+                assert_equal(0, chosen)
+        for question in Question.objects.all():
+            answered = QuizResult.objects.filter(
+                answers__question=question).count()
+            correct = QuizResult.objects.filter(answers__question=question,
+                answers__score=Answer.CORRECT).count()
+            try:
+                stats = question.stats
+            except QuestionStats.DoesNotExist:
+                assert_equal(0, answered)
+            else:
+                assert_equal(answered, stats.times_answered)
+                assert_equal(correct, stats.times_correct)
+
+    def test_recording_results_updates_stats(self):
+        self.record(self.correct)
+        self.record(self.correct[:3] + self.incorrect[3:5])
+        self.record(self.incorrect[:1])
+        self.assert_stats_match_results()
+
+        question = self.correct[0].question
+        assert_equal(3, question.stats.times_answered)
+        assert_equal(2, question.stats.times_correct)
+        assert_equal(2, AnswerStats.objects.get(pk=self.correct[0].pk).times_chosen)
+
+    def test_record_many_updates_stats(self):
+        QuizResult.objects.record_many(({
+            'quiz': self.quiz, 'email': 'foo@bar.com',
+            'score': 0, 'maximum_score': 9,
+            'answers': self.correct[:i] + self.incorrect[i:i + 1],
+        } for i in range(9)), batch_size=4)
+        self.assert_stats_match_results()
+
+    def test_record_answer_stats_ignores_unknown_answers(self):
+        record_answer_stats([self.correct[0].pk, 12345])
+        assert_equal(1, AnswerStats.objects.count())
+
+    def test_rebuild_stats(self):
+        self.record(self.correct)
+        self.record(self.correct[:3] + self.incorrect[3:5])
+        result = self.record(self.incorrect[:4])
+        result.delete()
+        rebuild_stats()
+        self.assert_stats_match_results()
+        AnswerStats.objects.update(times_chosen=100)
+        call_command('rebuild_quiz_stats', verbosity=0)
+        self.assert_stats_match_results()
+
+    def test_stats_select(self):
+        self.record(self.correct[:2])
+        questions = Question.objects.extra(select=stats_select(
+            Question, QuestionStats, ['times_answered', 'times_correct']
+        )).order_by('id')
+        assert_equal([1, 1, None], [q.times_answered for q in questions[:3]])
+
+    def test_admin_percent_correct(self):
+        self.record(self.correct[:1] + self.incorrect[1:2])
+        question_admin = QuestionAdmin(Question, site)
+        questions = question_admin.queryset(None).order_by('id')[:3]
+        assert_equal(['100%', '0%', ''], [question_admin.percent_correct(q)
+                                          for q in questions])
+
+
+class TestStatsTransactions(TransactionTestCase):
+    fixtures = ['python-zen.yaml']
+
+    def tearDown(self):
+        # Django only flushes before each TransactionTestCase, so clear up
+        # for the TestCases which follow.
+        call_command('flush', verbosity=0, interactive=False)
+
+    def test_counts_leave_the_callers_transaction_open(self):
+        rolled_back(QuizResult.objects.record,
+                    quiz=Quiz.objects.get(slug='python-zen'),
+                    email='foo@bar.com', score=9, maximum_score=9,
+                    answers=list(Answer.objects.correct))
+        assert_false(QuizResult.objects.exists())
+        assert_false(AnswerStats.objects.filter(times_chosen__gt=0).exists())
+        assert_false(QuestionStats.objects.filter(
+            times_answered__gt=0).exists())
@@ -0,0 +1,186 @@
+from django.core.management import call_command
+from django.db import IntegrityError
+from django.test import TestCase, TransactionTestCase
+from nose.tools import *
+
+from quiz import submissions
+from quiz.models import Quiz, QuizResult, QuizSubmission, Answer
+from quiz.submissions import (
+    DatabaseQueue, LocalMemoryQueue, Submission, get_submission_queue,
+    process_submissions
+)
+from quiz.scoring import AnswerKey
+
+
+class QueueTestsMixin(object):
+    fixtures = ['python-zen.yaml']
+    # 1 quiz, 9 questions, 26 answers, 9 correct answers (one per question)
+
+    def setUp(self):
+        super(QueueTestsMixin, self).setUp()
+        self.quiz = Quiz.objects.get(slug='python-zen')
+        self.correct = list(Answer.objects.correct.values_list('pk', flat=True))
+        self.incorrect = list(
+            Answer.objects.incorrect.values_list('pk', flat=True))
+
+    def test_put_and_process(self):
+        first = self.queue.put(Submission(self.quiz.pk, self.correct,
+                                          email='foo@bar.com'))
+        second = self.queue.put(Submission(self.quiz.pk, self.correct[:3],
+                                           email='bar@bar.com'))
+        assert_equal(None, self.queue.get_result_id(first))
+        assert_equal(0, QuizResult.objects.count())
+
+        assert_equal(1, process_submissions(self.queue, batch_size=1))
+        result = QuizResult.objects.get(pk=self.queue.get_result_id(first))
+        assert_equal((9, 9), (result.score, result.maximum_score))
+        assert_equal(set(self.correct),
+                     set(result.answers.values_list('pk', flat=True)))
+        assert_equal(None, self.queue.get_result_id(second))
+
+        assert_equal(1, process_submissions(self.queue, batch_size=10))
+        result = QuizResult.objects.get(pk=self.queue.get_result_id(second))
+        assert_equal((3, 9), (result.score, result.maximum_score))
+        assert_equal(0, process_submissions(self.queue))
+
+    def test_unknown_quiz_fails(self):
+        token = self.queue.put(Submission(self.quiz.pk + 100, self.correct))
+        assert_equal(1, process_submissions(self.queue))
+        assert_equal(0, QuizResult.objects.count())
+        assert_raises(KeyError, self.queue.get_result_id, token)
+
+    def test_unknown_token(self):
+        assert_raises(KeyError, self.queue.get_result_id, '12345')
+
+    def test_failed_recording_releases_the_batch(self):
+        token = self.queue.put(Submission(self.quiz.pk, self.correct))
+        def record_batch(results):
+            raise IntegrityError('boom')
+        QuizResult.objects.record_batch = record_batch
+        try:
+            assert_raises(IntegrityError, process_submissions, self.queue)
+        finally:
+            del QuizResult.objects.record_batch
+        assert_equal(1, process_submissions(self.queue))
+        assert_not_equal(None, self.queue.get_result_id(token))
+
+    def test_unscorable_submissions_fail(self):
+        bad = self.queue.put(Submission(self.quiz.pk, self.correct[:1]))
+        good = self.queue.put(Submission(self.quiz.pk, self.correct))
+        old_score = AnswerKey.score
+        def score(key, answer_ids):
+            if len(answer_ids) == 1:
+                raise ValueError(answer_ids)
+            return old_score(key, answer_ids)
+        AnswerKey.score = score
+        try:
+            assert_equal(2, process_submissions(self.queue))
+        finally:
+            AnswerKey.score = old_score
+        assert_raises(KeyError, self.queue.get_result_id, bad)
+        assert_not_equal(None, self.queue.get_result_id(good))
+
+    def test_stale_claims_are_reclaimed(self):
+        self.queue.put(Submission(self.quiz.pk, self.correct))
+        assert_equal(1, len(self.queue.get_batch(10)))
+        # The worker dies:
+        assert_equal([], self.queue.get_batch(10))
+        old_timeout = submissions.CLAIM_TIMEOUT
+        submissions.CLAIM_TIMEOUT = -1
+        try:
+            assert_equal(1, len(self.queue.get_batch(10)))
+        finally:
+            submissions.CLAIM_TIMEOUT = old_timeout
+
+    def test_lost_claims_are_left_alone(self):
+        token = self.queue.put(Submission(self.quiz.pk, self.correct))
+        slow = self.queue.get_batch(10)
+        old_timeout = submissions.CLAIM_TIMEOUT
+        submissions.CLAIM_TIMEOUT = -1
+        try:
+            assert_equal(1, process_submissions(self.queue))
+        finally:
+            submissions.CLAIM_TIMEOUT = old_timeout
+        result_id = self.queue.get_result_id(token)
+        # The slow worker finishes, too late:
+        assert_equal(slow, self.queue.complete_batch([(slow[0], 1000)]))
+        assert_false(self.queue.complete(slow[0], 1000))
+        assert_false(self.queue.fail(slow[0]))
+        self.queue.release(slow)
+        assert_equal(result_id, self.queue.get_result_id(token))
+        assert_equal([], self.queue.get_batch(10))
+        assert_equal(1, QuizResult.objects.count())
+
+
+class TestDatabaseQueue(QueueTestsMixin, TestCase):
+
+    def setUp(self):
+        super(TestDatabaseQueue, self).setUp()
+        self.queue = DatabaseQueue()
+
+    def test_batches_are_claimed(self):
+        for i in range(3):
+            self.queue.put(Submission(self.quiz.pk, self.correct))
+        batch = self.queue.get_batch(2)
+        assert_equal(2, len(batch))
+        assert_equal(2, QuizSubmission.objects.filter(
+            status=QuizSubmission.PROCESSING).count())
+        assert_equal(1, len(self.queue.get_batch(2)))
+        assert_equal([], self.queue.get_batch(2))
+
+
+class TestLocalMemoryQueue(QueueTestsMixin, TestCase):
+
+    def setUp(self):
+        super(TestLocalMemoryQueue, self).setUp()
+        self.queue = LocalMemoryQueue()
+
+
+class StolenClaimQueue(DatabaseQueue):
+    """Loses the first submission of each batch to another worker."""
+
+    def get_batch(self, size):
+        batch = DatabaseQueue.get_batch(self, size)
+        if batch:
+            QuizSubmission.objects.filter(pk=batch[0].token).update(
+                claimed_by='another worker')
+        return batch
+
+
+class TestDatabaseQueueTransactions(TransactionTestCase):
+    fixtures = ['python-zen.yaml']
+
+    def tearDown(self):
+        # Django only flushes before each TransactionTestCase, so clear up
+        # for the TestCases which follow.
+        call_command('flush', verbosity=0, interactive=False)
+
+    def test_batches_with_lost_claims_are_rolled_back(self):
+        queue = StolenClaimQueue()
+        quiz = Quiz.objects.get(slug='python-zen')
+        answers = Answer.objects.correct.values_list('pk', flat=True)
+        stolen = queue.put(Submission(quiz.pk, answers))
+        kept = queue.put(Submission(quiz.pk, answers))
+        assert_equal(2, process_submissions(queue))
+        assert_equal(0, QuizResult.objects.count())
+        assert_equal([QuizSubmission.PROCESSING, QuizSubmission.PENDING],
+            [QuizSubmission.objects.get(pk=token).status
+             for token in (stolen, kept)])
+
+
+class TestProcessQuizSubmissionsCommand(TestCase):
+    fixtures = ['python-zen.yaml']
+    # 1 quiz, 9 questions, 26 answers, 9 correct answers (one per question)
+
+    def test_command_drains_queue(self):
+        path = 'quiz.submissions.DatabaseQueue'
+        queue = get_submission_queue(path)
+        quiz = Quiz.objects.get(slug='python-zen')
+        answers = Answer.objects.correct.values_list('pk', flat=True)
+        for i in range(5):
+            queue.put(Submission(quiz.pk, answers, email='foo@bar.com'))
+        call_command('process_quiz_submissions', queue=path, batch_size=2,
+                     verbosity=0)
+        assert_equal(5, QuizResult.objects.count())
+        assert_equal(5, QuizSubmission.objects.filter(
+            status=QuizSubmission.DONE).count())
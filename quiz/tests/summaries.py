@@ -0,0 +1,111 @@
+from django.core.cache import cache
+from django.core.management import call_command
+from nose.tools import *
+
+from quiz.compiled import compile_quiz, get_compiled_quiz, local_cache
+from quiz.forms import quiz_formset_factory
+from quiz.models import Answer, Question, Quiz
+from quiz.summaries import update_quiz_summaries
+from quiz.tests.base import QueryCountTestCase
+
+
+class TestQuizSummaries(QueryCountTestCase):
+    fixtures = ['python-zen.yaml']
+    # 1 quiz, 9 questions, 26 answers, 9 correct answers (one per question)
+
+    def setUp(self):
+        super(TestQuizSummaries, self).setUp()
+        self.quiz = self.get_quiz()
+
+    def get_quiz(self):
+        return Quiz.objects.get(slug='python-zen')
+
+    def summary(self):
+        quiz = self.get_quiz()
+        return (quiz.maximum_score, quiz.get_maximum_scores(),
+                quiz.answer_key_digest)
+
+    def test_summaries_match_the_compiled_quiz(self):
+        compiled = compile_quiz(self.quiz)
+        assert_equal(9, self.quiz.maximum_score)
+        for difficulty in compiled.difficulty_levels:
+            assert_equal(compiled.get_maximum_score(difficulty),
+                         self.assertNumQueries(0, self.quiz.get_maximum_score,
+                                               difficulty))
+        assert_equal(0, self.quiz.get_maximum_score(99))
+        assert_equal(40, len(self.quiz.answer_key_digest))
+
+    def test_answers(self):
+        maximum_score, scores, digest = self.summary()
+        answer = Answer.objects.correct.order_by('id')[0]
+        difficulty = answer.question.difficulty
+        answer.score = 3
+        answer.save()
+        assert_equal(maximum_score + 2, self.summary()[0])
+        assert_equal(scores[difficulty] + 2, self.summary()[1][difficulty])
+        assert_not_equal(digest, self.summary()[2])
+        answer.delete()
+        assert_equal(maximum_score - 1, self.summary()[0])
+
+    def test_answer_text_leaves_the_digest(self):
+        digest = self.summary()[2]
+        answer = Answer.objects.all()[0]
+        answer.answer = 'Changed'
+        answer.save()
+        assert_equal(digest, self.summary()[2])
+
+    def test_questions(self):
+        question = self.quiz.questions.order_by('id')[0]
+        question.is_active = False
+        question.save()
+        assert_equal(8, self.summary()[0])
+        question.is_active = True
+        question.save()
+        assert_equal(9, self.summary()[0])
+        question.delete()
+        assert_equal(8, self.summary()[0])
+
+    def test_quiz_questions(self):
+        first, second = self.quiz.questions.order_by('id')[:2]
+        self.quiz.questions.remove(first)
+        assert_equal(8, self.quiz.maximum_score)
+        second.quizzes.clear()
+        assert_equal(7, self.summary()[0])
+        second.quizzes.add(self.quiz)
+        assert_equal(8, self.summary()[0])
+
+    def test_saving_a_stale_quiz(self):
+        stale = self.get_quiz()
+        self.quiz.questions.clear()
+        stale.name = 'Renamed'
+        stale.save()
+        assert_equal(0, stale.maximum_score)
+        assert_equal((0, {}), self.summary()[:2])
+
+    def test_rebuild(self):
+        summary = self.summary()
+        Quiz.objects.update(maximum_score=0, maximum_scores='',
+                            answer_key_digest='')
+        call_command('rebuild_quiz_summaries', verbosity=0)
+        assert_equal(summary, self.summary())
+        # Nothing has changed, so nothing is written:
+        self.assertNumQueries(3, update_quiz_summaries, [self.quiz.pk])
+
+    def test_formset_maximum_score(self):
+        formset = quiz_formset_factory(self.quiz)(difficulty=Question.HARD)
+        assert_equal(2, self.assertNumQueries(0, lambda: formset.maximum_score))
+        assert_equal(2, formset.get_answer_key().maximum_score)
+
+    def test_rebuild_recompiles_changed_answer_keys(self):
+        cache.clear()
+        local_cache.clear()
+        old = get_compiled_quiz(self.quiz.slug)
+        answer = Answer.objects.correct.order_by('id')[0]
+        Answer.objects.filter(pk=answer.pk).update(score=3)
+        assert_equal(old.version, get_compiled_quiz(self.quiz.slug).version)
+        call_command('rebuild_quiz_summaries', verbosity=0)
+        assert_equal(11, get_compiled_quiz(self.quiz.slug).maximum_score)
+        # Rebuilding again changes nothing, so keeps the paper:
+        version = get_compiled_quiz(self.quiz.slug).version
+        call_command('rebuild_quiz_summaries', verbosity=0)
+        assert_equal(version, get_compiled_quiz(self.quiz.slug).version)
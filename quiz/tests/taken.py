@@ -0,0 +1,96 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.template import Context, Template
+from nose.tools import *
+
+from quiz import taken
+from quiz.listeners import start_listening, stop_listening
+from quiz.models import Quiz, QuizResult
+from quiz.tests.base import QueryCountTestCase
+
+
+class TestTakenCounts(QueryCountTestCase):
+    fixtures = ['python-zen.yaml', 'testuser.yaml']
+    # 1 quiz, 9 questions, 26 answers, 9 correct answers (one per question)
+    # A single test-user, TestyMcTesterson, with password 'password'
+
+    def setUp(self):
+        super(TestTakenCounts, self).setUp()
+        taken.clear_memo()
+        self.old_timeout = taken.CACHE_TIMEOUT
+        self.user = User.objects.get(username='TestyMcTesterson')
+        self.quizzes = [Quiz.objects.get(slug='python-zen')]
+        for i in range(3):
+            self.quizzes.append(Quiz.objects.create(
+                name='Quiz %d' % i, slug='quiz-%d' % i, status=Quiz.LIVE))
+        for quiz, times in zip(self.quizzes, (2, 0, 1, 0)):
+            for i in range(times):
+                self.record(quiz)
+        self.ids = [quiz.pk for quiz in self.quizzes]
+        taken.clear_memo()
+
+    def tearDown(self):
+        taken.CACHE_TIMEOUT = self.old_timeout
+        taken.clear_memo()
+        cache.clear()
+        super(TestTakenCounts, self).tearDown()
+
+    def record(self, quiz, user=None):
+        return QuizResult.objects.record(quiz_id=quiz.pk,
+            user=user or self.user, email='foo@bar.com', score=1,
+            maximum_score=9)
+
+    def test_counts_in_one_query(self):
+        counts = self.assertNumQueries(1, taken.get_taken_counts,
+                                       self.user.pk, self.ids)
+        assert_equal(dict(zip(self.ids, (2, 0, 1, 0))), counts)
+        # Remembered for the rest of the request:
+        self.assertNumQueries(0, taken.get_taken_counts, self.user.pk,
+                              self.ids[:2])
+        taken.clear_memo()
+        self.assertNumQueries(1, taken.get_taken_counts, self.user.pk,
+                              self.ids[:2])
+
+    def test_recording_results_updates_counts(self):
+        taken.get_taken_counts(self.user.pk, self.ids)
+        self.record(self.quizzes[1])
+        result = self.record(self.quizzes[1])
+        assert_equal(2, taken.get_taken_count(self.user.pk, self.ids[1]))
+        result.delete()
+        assert_equal(1, taken.get_taken_count(self.user.pk, self.ids[1]))
+
+    def test_cached_counters(self):
+        taken.CACHE_TIMEOUT = 60
+        taken.get_taken_counts(self.user.pk, self.ids)
+        taken.clear_memo()
+        self.assertNumQueries(0, taken.get_taken_counts, self.user.pk,
+                              self.ids)
+        self.record(self.quizzes[0])
+        QuizResult.objects.create(quiz=self.quizzes[2], user=self.user,
+                                  score=1, maximum_score=9)
+        QuizResult.objects.filter(quiz=self.quizzes[0])[0].delete()
+        taken.clear_memo()
+        counts = self.assertNumQueries(0, taken.get_taken_counts,
+                                       self.user.pk, self.ids)
+        assert_equal(dict(zip(self.ids, (2, 0, 2, 0))), counts)
+
+    def test_registering_moves_results_to_the_user(self):
+        taken.CACHE_TIMEOUT = 60
+        QuizResult.objects.record(quiz_id=self.ids[0], email='new@bar.com',
+                                  score=1, maximum_score=9)
+        start_listening()
+        try:
+            user = User.objects.create_user('new', 'new@bar.com', 'password')
+        finally:
+            stop_listening()
+        assert_equal(1, taken.get_taken_count(user.pk, self.ids[0]))
+
+    def test_preload_tag(self):
+        template = Template('{% load quiz_tags %}'
+            '{% preload_quiz_taken user quizzes %}'
+            '{% for quiz in quizzes %}{{ user|quiz_taken:quiz }},{% endfor %}')
+        context = Context({'user': self.user, 'quizzes': self.quizzes})
+        output = self.assertNumQueries(1, template.render, context)
+        assert_equal('2,0,1,0,', output)
+        context = Context({'user': 'nobody', 'quizzes': self.quizzes})
+        assert_equal(',,,,', template.render(context))
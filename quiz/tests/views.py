@@ -7,6 +7,7 @@ from django.test import TestCase
 
 from quiz.forms import EmailForm
 from quiz.models import Quiz, QuizResult, Question
+from quiz.tests.base import QueryCountTestCase
 from quiz.views import redirect_to_quiz_list
 
 
@@ -51,7 +52,7 @@ class TestQuizListView(TestCase):
         self.assertContains(response, q2.description, count=1)
 
 
-class TestQuizDetailView(TestCase):
+class TestQuizDetailView(QueryCountTestCase):
     fixtures = ['python-zen.yaml', 'testuser.yaml']
     # 1 quiz, 9 questions, 26 answers, 9 correct answers (one per question)
     # A single test-user, TestyMcTesterson, with password 'password'
@@ -106,6 +107,23 @@ class TestQuizDetailView(TestCase):
         self.input_re.sub(grab, previous_fields)
         return fields
 
+    def set_session_email(self, email):
+        # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        # Waiting for this to land... http://code.djangoproject.com/ticket/10899
+        # What SHOULD be as simple as this:
+        # >>> self.client.session['email'] = 'foo@bar.com'
+        # is currently this madness...
+        from django.conf import settings
+        from django.utils.importlib import import_module
+        engine = import_module(settings.SESSION_ENGINE)
+        store = engine.SessionStore()
+        store.save()  # we need to make load() work, or the cookie is worthless
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = store.session_key
+        session = self.client.session
+        session['email'] = email
+        session.save()
+        # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
     def complete_quiz(self, slug):
         response = self.client.post(
             reverse('quiz_detail', args=[slug]), data=self.data[0]
@@ -164,21 +182,7 @@ class TestQuizDetailView(TestCase):
     def test_quiz_detail_view_with_good_inputs_unauthenticated(self):
         assert_false(QuizResult.objects.count())
 
-        # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-        # Waiting for this to land... http://code.djangoproject.com/ticket/10899
-        # What SHOULD be as simple as this:
-        # >>> self.client.session['email'] = 'foo@bar.com'
-        # is currently this madness...
-        from django.conf import settings
-        from django.utils.importlib import import_module
-        engine = import_module(settings.SESSION_ENGINE)
-        store = engine.SessionStore()
-        store.save()  # we need to make load() work, or the cookie is worthless
-        self.client.cookies[settings.SESSION_COOKIE_NAME] = store.session_key
-        session = self.client.session
-        session['email'] = 'foo@bar.com'
-        session.save()
-        # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        self.set_session_email('foo@bar.com')
 
         response = self.complete_quiz(self.quiz.slug)
         quiz_result = QuizResult.objects.get(
@@ -197,6 +201,50 @@ class TestQuizDetailView(TestCase):
             set(quiz_result.answers.all()), set(self.quiz.questions.answers.correct)
         )
 
+    def test_quiz_detail_with_queued_submissions(self):
+        from django.conf import settings
+        from quiz.submissions import get_submission_queue, process_submissions
+        path = 'quiz.submissions.LocalMemoryQueue'
+        old_queue = getattr(settings, 'QUIZ_SUBMISSION_QUEUE', None)
+        settings.QUIZ_SUBMISSION_QUEUE = path
+        try:
+            self.client.login(username=self.user.username, password='password')
+            response = self.complete_quiz(self.quiz.slug)
+            assert_false(QuizResult.objects.count())
+            pending_url = response['Location']
+            assert '/pending/' in pending_url
+            response = self.client.get(pending_url)
+            self.assertContains(response, 'being marked')
+
+            process_submissions(get_submission_queue(path))
+            quiz_result = QuizResult.objects.get(quiz=self.quiz, user=self.user)
+            assert_equal(quiz_result.score, quiz_result.maximum_score)
+            response = self.client.get(pending_url)
+            self.assertRedirects(response,
+                reverse('quiz_completed', args=(self.quiz.slug, quiz_result.pk))
+            )
+        finally:
+            settings.QUIZ_SUBMISSION_QUEUE = old_queue
+
+    def test_quiz_detail_served_from_compiled_quiz(self):
+        self.set_session_email('foo@bar.com')
+        url = reverse('quiz_detail', args=[self.quiz.slug])
+        response = self.client.get(url)
+        assert_equal(200, response.status_code)
+        # Once compiled, only the session is loaded from the database:
+        response = self.assertNumQueries(1, self.client.get, url)
+        self.assertContains(response, self.quiz.name)
+        self.assertContains(response, 'name="0-0-answers"')
+
+    def test_quiz_completed_shows_percentile(self):
+        for score in (1, 2, 9):
+            result = QuizResult.objects.record(quiz=self.quiz, score=score,
+                maximum_score=9, email='foo@bar.com'
+            )
+        response = self.client.get(result.get_absolute_url())
+        self.assertContains(response, 'You beat 67% of quiz takers')
+        self.assertContains(response, 'number 1 out of 3')
+
     def test_quiz_detail_for_draft_quiz_displays(self):
         self.quiz.status = Quiz.DRAFT
         self.quiz.save()
@@ -0,0 +1,141 @@
+import re
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from nose.tools import *
+
+from quiz.models import Quiz, QuizResult
+from quiz.wizard import (
+    SessionWizardStorage, CacheWizardStorage, get_wizard_storage
+)
+
+
+class TestWizardStorage(TestCase):
+    fixtures = ['python-zen.yaml', 'testuser.yaml']
+    # 1 quiz, 9 questions, 26 answers, 9 correct answers (one per question)
+    # A single test-user, TestyMcTesterson, with password 'password'
+
+    attempt_re = re.compile('name="wizard_attempt" value="([0-9a-f]+)"')
+    storage = 'session'
+
+    def setUp(self):
+        super(TestWizardStorage, self).setUp()
+        self.old_storage = getattr(settings, 'QUIZ_WIZARD_STORAGE', None)
+        settings.QUIZ_WIZARD_STORAGE = self.storage
+        self.quiz = Quiz.objects.get(slug='python-zen')
+        self.user = User.objects.get(username='TestyMcTesterson')
+        self.client.login(username=self.user.username, password='password')
+        self.url = reverse('quiz_detail', args=['python-zen'])
+        # The correct answers for each step, and nothing else:
+        self.steps = ({
+                '0-INITIAL_FORMS': 4, '0-TOTAL_FORMS': 4,
+                '0-0-answers': 3, '0-1-answers': 4, '0-2-answers': 9,
+                '0-3-answers': 11,
+            }, {
+                '1-INITIAL_FORMS': 3, '1-TOTAL_FORMS': 3,
+                '1-0-answers': 14, '1-1-answers': 16, '1-2-answers': 20
+            }, {
+                '2-INITIAL_FORMS': 2, '2-TOTAL_FORMS': 2,
+                '2-0-answers': 23, '2-1-answers': 26,
+            }
+        )
+
+    def tearDown(self):
+        settings.QUIZ_WIZARD_STORAGE = self.old_storage
+        super(TestWizardStorage, self).tearDown()
+
+    def post_step(self, step, attempt=None, **extra):
+        data = dict(self.steps[step], wizard_step=str(step), **extra)
+        if attempt:
+            data['wizard_attempt'] = attempt
+        return self.client.post(self.url, data)
+
+    def get_attempt(self, response):
+        return self.attempt_re.search(response.content).group(1)
+
+    def test_get_wizard_storage(self):
+        assert_true(isinstance(get_wizard_storage(None, 'session'),
+                               SessionWizardStorage))
+        assert_true(isinstance(get_wizard_storage(None, 'cache'),
+                               CacheWizardStorage))
+        assert_equal(None, get_wizard_storage(None, ''))
+
+    def test_each_post_carries_only_its_own_step(self):
+        response = self.client.get(self.url)
+        attempt = self.get_attempt(response)
+        response = self.post_step(0, attempt)
+        self.assertContains(response, 'Step 2 of 3')
+        assert_false('name="0-0-answers" type="hidden"' in response.content)
+        assert_false('hash_0' in response.content)
+        assert_equal(attempt, self.get_attempt(response))
+        response = self.post_step(1, attempt)
+        self.assertContains(response, 'Step 3 of 3')
+        response = self.post_step(2, attempt)
+        result = QuizResult.objects.get(quiz=self.quiz, user=self.user)
+        self.assertRedirects(response, result.get_absolute_url())
+        assert_equal(result.maximum_score, result.score)
+        assert_equal(9, result.answers.count())
+        # The attempt is finished with, so it can't be submitted again:
+        self.assertContains(self.post_step(2, attempt), 'Step 1 of 3')
+
+    def test_first_post_starts_an_attempt(self):
+        response = self.post_step(0)
+        self.assertContains(response, 'Step 2 of 3')
+        self.get_attempt(response)
+
+    def test_reloading_keeps_one_attempt(self):
+        attempt = self.get_attempt(self.client.get(self.url))
+        if self.storage == 'session':
+            keys = len(self.client.session.keys())
+        for i in range(3):
+            assert_equal(attempt, self.get_attempt(self.client.get(self.url)))
+        if self.storage == 'session':
+            assert_equal(keys, len(self.client.session.keys()))
+        for step in range(3):
+            self.post_step(step, attempt)
+        # Once it's done, the next attempt is a new one:
+        assert_not_equal(attempt, self.get_attempt(self.client.get(self.url)))
+
+    def test_unknown_attempt_restarts(self):
+        response = self.post_step(1, 'f' * 32)
+        self.assertContains(response, 'Step 1 of 3')
+        self.assertContains(response, 'expired')
+
+    def test_steps_cannot_be_skipped(self):
+        attempt = self.get_attempt(self.post_step(0))
+        response = self.post_step(2, attempt)
+        self.assertContains(response, 'Step 2 of 3')
+        assert_false(QuizResult.objects.count())
+
+    def test_tampered_state_is_ignored(self):
+        attempt = self.get_attempt(self.post_step(0))
+        storage = get_wizard_storage(None, self.storage)
+        key = storage.get_key(attempt)
+        if self.storage == 'session':
+            session = self.client.session
+            value, signature = session[key]
+            session[key] = (value.replace('"3"', '"1"'), signature)
+            session.save()
+        else:
+            value, signature = storage.get(key)
+            storage.set(key, (value.replace('"3"', '"1"'), signature))
+        self.assertContains(self.post_step(1, attempt), 'Step 1 of 3')
+
+    def test_invalid_step_is_redisplayed(self):
+        attempt = self.get_attempt(self.post_step(0))
+        response = self.post_step(1, attempt, **{'1-0-answers': 1})
+        self.assertContains(response, 'Step 2 of 3')
+        assert_equal(attempt, self.get_attempt(response))
+
+
+class TestCacheWizardStorage(TestWizardStorage):
+    storage = 'cache'
+
+    def test_attempts_belong_to_their_taker(self):
+        attempt = self.get_attempt(self.post_step(0))
+        self.client.logout()
+        other = User.objects.create_user('other', 'other@bar.com', 'password')
+        self.client.login(username='other', password='password')
+        self.assertContains(self.post_step(1, attempt), 'Step 1 of 3')
@@ -1,17 +1,24 @@
 from django.conf.urls.defaults import *
-from quiz.models import Quiz
-from quiz import views
-from django.views.generic import list_detail
-
-data = {
-    'queryset': Quiz.objects.filter(status=Quiz.LIVE),
-}
+from quiz import api, views
 
 urlpatterns = patterns('',
     url(r'^capture-email/$', views.capture_email, name='quiz_capture_email'),
-    url(r'^$', list_detail.object_list, data, name='quiz_list'),
+    url(r'^$', views.quiz_list, name='quiz_list'),
+    # These are under _/, which a quiz's own URLs can't clash with, so that
+    # any slug is free to use.
+    url(r'^_/instrumentation/$', views.quiz_instrumentation,
+        name='quiz_instrumentation'),
+    url(r'^_/api/(?P<slug>[^/]+)/$', api.quiz_paper, name='quiz_api_paper'),
+    url(r'^_/api/(?P<slug>[^/]+)/submit/$', api.quiz_submit,
+        name='quiz_api_submit'),
     url(r'^(?P<slug>[^/]+)/$', views.quiz_detail, name='quiz_detail'),
+    url(r'^(?P<slug>[^/]+)/autosave/$', views.quiz_autosave,
+        name='quiz_autosave'),
     url(r'^(?P<slug>[^/]+)/complete/$', views.redirect_to_quiz_list),
     url(r'^(?P<slug>[^/]+)/complete/(?P<pk>\d+)/$',
         views.quiz_completed, name='quiz_completed'),
+    url(r'^(?P<slug>[^/]+)/pending/(?P<token>[\w-]+)/$',
+        views.quiz_pending, name='quiz_pending'),
+    url(r'^(?P<slug>[^/]+)/export/$',
+        views.export_quiz_results, name='quiz_export_results'),
 )
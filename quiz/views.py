@@ -1,21 +1,74 @@
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.core.urlresolvers import reverse
-from django.http import HttpResponseRedirect
+from django.http import (
+    HttpResponse, HttpResponseBadRequest, HttpResponseNotAllowed,
+    HttpResponseRedirect, Http404
+)
 from django.shortcuts import get_object_or_404, render_to_response
 from django.template import RequestContext
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 from django.views.generic import simple
 from django.template.defaultfilters import slugify
 
-from quiz.models import Quiz, QuizResult
-from quiz.forms import quiz_formset_factory, QuizBoundFormWizard, EmailForm
+from quiz.caching import (
+    quiz_list_etag, quiz_list_last_modified, result_etag, result_last_modified
+)
+from quiz.compiled import get_compiled_quiz
+from quiz.export import (
+    CONTENT_TYPES, export_results, get_export_querysets, parse_date
+)
+from quiz.leaderboard import Leaderboard
+from quiz.models import ArchivedResult, Quiz, QuizResult
+from quiz.forms import (
+    quiz_formset_factory, QuizBoundFormWizard, QuizListForm, EmailForm
+)
+from quiz.instrumentation import get_ring_buffer, instrument, phase, tag
+from quiz.pagination import KeysetPage, decode_cursor
+from quiz.submissions import get_submission_queue
 from quiz.utils import get_display_name
+from quiz.wizard import get_wizard_storage
 try:
     from functools import partial
 except ImportError: # Python 2.3, 2.4 fallback.
     from django.utils.functional import curry as partial
 
+LIST_PAGE_SIZE = getattr(settings, 'QUIZ_LIST_PAGE_SIZE', 20)
+
 def redirect_to_quiz_list(request, *args, **kwargs):
     return simple.redirect_to(request, url=reverse('quiz_list'))
 
+def quiz_list(request, *args, **kwargs):
+    """Lists the live quizzes, newest first, a page at a time. The pages are
+    linked by ``after`` and ``before`` cursors (see ``quiz.pagination``), so
+    deep pages cost no more than the first, and can be filtered with
+    ``QuizListForm``. Conditional GETs are answered from the cache; see
+    ``quiz.caching``."""
+    form = QuizListForm(request.GET)
+    page = KeysetPage(form.filter(Quiz.objects.filter(status=Quiz.LIVE)),
+        LIST_PAGE_SIZE,
+        after=request.GET.get('after'), before=request.GET.get('before')
+    )
+    for cursor in (page.after, page.before):
+        if cursor is not None:
+            try:
+                decode_cursor(cursor)
+            except ValueError:
+                raise Http404
+    query = request.GET.copy()
+    for name in ('after', 'before'):
+        query.pop(name, None)
+    data = {
+        'form': form,
+        'page': page,
+        'query': query.urlencode(),
+    }
+    return render_to_response("quiz/quiz_list.html", data,
+                        context_instance=RequestContext(request))
+quiz_list = condition(etag_func=quiz_list_etag,
+                      last_modified_func=quiz_list_last_modified)(quiz_list)
+
 def capture_email(request, FormClass=EmailForm, *args, **kwargs):
     """Unauthenticated users are redirected to this view from the quiz_detail
     url, in order to provide an email address to associate their quiz results
@@ -37,11 +90,28 @@ def capture_email(request, FormClass=EmailForm, *args, **kwargs):
     return render_to_response("quiz/capture_email.html", data,
                             context_instance=RequestContext(request))
 
+@instrument('quiz_detail')
 def quiz_detail(request, slug, *args, **kwargs):
     """This view displays a ``FormWizard`` with the questions grouped by
     difficulty. There is a page for each level of difficulty, and each page
-    is progressively more difficult."""
-    quiz = get_object_or_404(Quiz.objects.exclude(status=Quiz.CLOSED), slug=slug)
+    is progressively more difficult.
+
+    The quiz is served from its cached ``CompiledQuiz``, so rendering and
+    re-validating the wizard's steps needs no queries against the quiz."""
+    try:
+        quiz = phase('compiled')(get_compiled_quiz)(slug)
+    except Quiz.DoesNotExist:
+        raise Http404
+    if quiz.status == Quiz.CLOSED:
+        raise Http404
+    # Only the quiz's own steps, so that a client can't invent metric names.
+    try:
+        step = int(request.POST.get('wizard_step', ''))
+    except ValueError:
+        step = None
+    if step not in range(len(quiz.difficulty_levels)):
+        step = 'start'
+    tag('step', step)
     if not request.user.is_authenticated() and not request.session.get('email'):
         redirect_url = "%s?next=%s" % (
             reverse('quiz_capture_email'), request.path
@@ -50,10 +120,7 @@ def quiz_detail(request, slug, *args, **kwargs):
     FormSet = quiz_formset_factory(quiz)
 
     formset_list = []
-    difficulty_levels = sorted(list(set(
-        quiz.questions.values_list('difficulty', flat=True)
-    )))
-    for diff in difficulty_levels:
+    for diff in quiz.difficulty_levels:
         prefix = slugify(get_display_name(diff))
         formset_list.append(partial(FormSet, difficulty=diff, prefix=prefix))
 
@@ -62,17 +129,108 @@ def quiz_detail(request, slug, *args, **kwargs):
         request, extra_context=extra_context, *args, **kwargs
     )
 
+def quiz_autosave(request, slug, *args, **kwargs):
+    """Takes the answers given so far to the current step of the quiz wizard,
+    posted by the wizard page as they change, so that the step can be
+    resumed. Only wizard storages with an ``autosave`` method (see
+    ``quiz.attempts``) keep them."""
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    storage = get_wizard_storage(request)
+    if storage is None or not hasattr(storage, 'autosave'):
+        raise Http404
+    attempt = request.POST.get(QuizBoundFormWizard.attempt_field_name)
+    try:
+        step = int(request.POST.get('wizard_step', ''))
+    except ValueError:
+        return HttpResponseBadRequest('Invalid step.')
+    if not attempt:
+        return HttpResponseBadRequest('No attempt given.')
+    prefix = '%s-' % step
+    data = dict([(key, request.POST.getlist(key))
+                 for key in request.POST if key.startswith(prefix)])
+    storage.autosave(attempt, {'step': step, 'data': data})
+    return HttpResponse(status=204)
+
+def quiz_pending(request, slug, token, *args, **kwargs):
+    """Waits for a queued submission to be recorded. Redirects to the quiz
+    results once they are ready, and otherwise renders a page which polls
+    this view again."""
+    queue = get_submission_queue()
+    if queue is None:
+        raise Http404
+    try:
+        result_id = queue.get_result_id(token)
+    except KeyError:
+        raise Http404
+    if result_id is not None:
+        return HttpResponseRedirect(
+            reverse('quiz_completed', kwargs={'slug': slug, 'pk': result_id})
+        )
+    data = {'quiz_slug': slug, 'token': token}
+    return render_to_response("quiz/quiz_pending.html", data,
+                        context_instance=RequestContext(request))
+
+@cache_control(private=True, must_revalidate=True)
+@condition(etag_func=result_etag, last_modified_func=result_last_modified)
+@instrument('quiz_completed')
 def quiz_completed(request, slug, pk, *args, **kwargs):
-    results = get_object_or_404(QuizResult.objects.select_related(
-        'quiz', 'user').filter(quiz__slug=slug), pk=pk
-    )
+    """Shows a result, whether it is live or has been archived (see
+    ``quiz.archive``)."""
+    try:
+        results = QuizResult.objects.select_related('quiz', 'user').get(
+            quiz__slug=slug, pk=pk)
+    except QuizResult.DoesNotExist:
+        results = get_object_or_404(ArchivedResult.objects.select_related(
+            'quiz', 'user').filter(quiz__slug=slug), pk=pk
+        )
+    leaderboard = Leaderboard(results.quiz)
     data = {
          'results':        results,
          'quiz':           results.quiz,
          'test_taker':     results.user,
          'score':          results.score,
          'maximum_score':  results.maximum_score,
-         'datetime_taken': results.datetime_created
+         'datetime_taken': results.datetime_created,
+         'leaderboard':    leaderboard,
+         'rank':           leaderboard.rank(results.score),
+         'percentile':     leaderboard.percentile(results.score),
+         'total_takers':   leaderboard.total,
     }
     return render_to_response("quiz/quiz_complete.html", data,
                         context_instance=RequestContext(request))
+
+def export_quiz_results(request, slug, *args, **kwargs):
+    """Streams the results of a quiz to staff as CSV, or as JSON Lines with
+    ``?format=jsonl``. ``since`` and ``until`` restrict the export to a date
+    range. The response is generated a chunk at a time, so exporting every
+    result of a popular quiz doesn't hold them all in memory."""
+    quiz = get_object_or_404(Quiz, slug=slug)
+    format = request.GET.get('format', 'csv')
+    if format not in CONTENT_TYPES:
+        return HttpResponseBadRequest("Unknown export format.")
+    try:
+        since = parse_date(request.GET.get('since'))
+        until = parse_date(request.GET.get('until'))
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    response = HttpResponse(
+        export_results(get_export_querysets(quiz, since, until), format),
+        mimetype=CONTENT_TYPES[format]
+    )
+    response['Content-Disposition'] = 'attachment; filename=%s-results.%s' % (
+        quiz.slug, format
+    )
+    return response
+export_quiz_results = staff_member_required(export_quiz_results)
+
+def quiz_instrumentation(request, *args, **kwargs):
+    """Shows staff the latest measurements kept by the instrumentation ring
+    buffer. See ``quiz.instrumentation``."""
+    ring_buffer = get_ring_buffer()
+    if ring_buffer is None:
+        raise Http404
+    data = {'measurements': ring_buffer.latest()}
+    return render_to_response("quiz/instrumentation.html", data,
+                        context_instance=RequestContext(request))
+quiz_instrumentation = staff_member_required(quiz_instrumentation)
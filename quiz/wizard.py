@@ -0,0 +1,187 @@
+"""Server-side storage for the quiz wizard's state.
+
+By default the quiz wizard works like Django's ``FormWizard``: every page
+re-emits the answers of the pages before it as hidden fields, and every POST
+re-validates all of them, so both the payload and the work grow with the
+square of the number of pages. Setting::
+
+    QUIZ_WIZARD_STORAGE = 'session'  # or 'cache', 'attempt' or a dotted path
+
+makes the wizard keep each attempt's validated answers on the server
+instead, keyed by a random attempt id and signed with ``SECRET_KEY`` and
+the taker's identity, so that each POST only validates its own page. The
+``'attempt'`` storage keeps it in the database instead, so that unfinished
+attempts can be resumed; see ``quiz.attempts``.
+"""
+import hmac
+import re
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import simplejson
+from django.utils.hashcompat import sha_constructor
+from django.utils.importlib import import_module
+
+from quiz.compiled import new_seed
+
+CACHE_TIMEOUT = getattr(settings, 'QUIZ_WIZARD_CACHE_TIMEOUT', 60 * 60 * 2)
+
+FIELD_RE = re.compile(r'^(?P<prefix>[^-]+)-(?P<index>\d+)-(?P<field>.+)$')
+
+
+def _constant_time_compare(a, b):
+    if len(a) != len(b):
+        return False
+    result = 0
+    for x, y in zip(a, b):
+        result |= ord(x) ^ ord(y)
+    return result == 0
+
+def new_state():
+    """Returns the state of a new attempt."""
+    return {'steps': [], 'data': {}, 'seed': new_seed()}
+
+def get_draft_initial(draft, prefix):
+    """Turns the raw POST data of a draft into ``initial`` data for the
+    formset with the given prefix."""
+    initial = {}
+    for name, values in draft.get('data', {}).items():
+        match = FIELD_RE.match(name)
+        if match and match.group('prefix') == prefix and values:
+            initial.setdefault(int(match.group('index')), {})[
+                match.group('field')] = values[0]
+    if not initial:
+        return None
+    return [initial.get(i, {}) for i in range(max(initial) + 1)]
+
+
+class WizardStorage(object):
+    """Base class for wizard state storage. Subclasses provide ``get``,
+    ``set`` and ``delete`` for a key."""
+    prefix = 'quiz:wizard'
+
+    def __init__(self, request):
+        self.request = request
+
+    def start(self, quiz_id=None):
+        """Starts an attempt, returning ``(attempt, state)``. The state's
+        ``seed`` picks the attempt's questions if the quiz samples them.
+
+        The taker's unfinished attempt at the same quiz, if there is one, is
+        carried on with rather than another being stored beside it, so that
+        reloading the quiz neither piles up state nor draws new questions."""
+        current = self.get_current_key(quiz_id)
+        attempt = self.get(current)
+        state = attempt and self.load(attempt)
+        if state:
+            return attempt, state
+        if attempt:
+            self.remove(attempt)
+        attempt, state = uuid.uuid4().hex, new_state()
+        self.save(attempt, state)
+        self.set(current, attempt)
+        return attempt, state
+
+    def resume(self, quiz_id):
+        """Returns ``(attempt, state, draft)`` for an attempt at the quiz
+        which the taker left unfinished, if the storage can find one."""
+        return None
+
+    def get_owner(self):
+        """Identifies the quiz taker, so that an attempt can't be continued by
+        anybody else."""
+        if self.request.user.is_authenticated():
+            return 'user:%s' % self.request.user.pk
+        return 'email:%s' % self.request.session.get('email', '')
+
+    def get_key(self, attempt):
+        return '%s:%s' % (self.prefix, attempt)
+
+    def get_current_key(self, quiz_id):
+        """The key under which the id of the taker's attempt at a quiz is
+        kept."""
+        owner = sha_constructor(self.get_owner().encode('utf-8')).hexdigest()
+        return '%s:current:%s:%s' % (self.prefix, owner, quiz_id)
+
+    def sign(self, attempt, value):
+        message = '%s|%s|%s' % (attempt, self.get_owner(), value)
+        return hmac.new(settings.SECRET_KEY + self.prefix,
+                        message.encode('utf-8'), sha_constructor).hexdigest()
+
+    def load(self, attempt):
+        """Returns the state stored for ``attempt``, or ``None`` if there is
+        none or its signature doesn't match."""
+        stored = self.get(self.get_key(attempt))
+        if not stored:
+            return None
+        value, signature = stored
+        if not _constant_time_compare(signature, self.sign(attempt, value)):
+            return None
+        return simplejson.loads(value)
+
+    def save(self, attempt, state):
+        value = simplejson.dumps(state, sort_keys=True)
+        self.set(self.get_key(attempt), (value, self.sign(attempt, value)))
+
+    def remove(self, attempt):
+        self.delete(self.get_key(attempt))
+
+    def finish(self, attempt, result=None):
+        """Called when the quiz is done, with the ``QuizResult`` if there is
+        one yet."""
+        self.remove(attempt)
+
+
+class SessionWizardStorage(WizardStorage):
+    """Keeps wizard state in the taker's session. Abandoned attempts go when
+    the session does."""
+
+    def get(self, key):
+        return self.request.session.get(key)
+
+    def set(self, key, value):
+        self.request.session[key] = value
+
+    def delete(self, key):
+        self.request.session.pop(key, None)
+
+
+class CacheWizardStorage(WizardStorage):
+    """Keeps wizard state in the cache for ``QUIZ_WIZARD_CACHE_TIMEOUT``
+    seconds, which keeps sessions small."""
+
+    def get(self, key):
+        return cache.get(key)
+
+    def set(self, key, value):
+        cache.set(key, value, CACHE_TIMEOUT)
+
+    def delete(self, key):
+        cache.delete(key)
+
+
+STORAGES = {
+    'session': SessionWizardStorage,
+    'cache': CacheWizardStorage,
+    'attempt': 'quiz.attempts.AttemptWizardStorage',
+}
+
+def get_wizard_storage(request, name=None):
+    """Returns the wizard storage named by ``QUIZ_WIZARD_STORAGE`` for a
+    request, or ``None`` if the wizard keeps its state in hidden fields (the
+    default)."""
+    if name is None:
+        name = getattr(settings, 'QUIZ_WIZARD_STORAGE', None)
+    if not name:
+        return None
+    name = STORAGES.get(name, name)
+    if not isinstance(name, basestring):
+        return name(request)
+    module, attr = name.rsplit('.', 1)
+    try:
+        return getattr(import_module(module), attr)(request)
+    except (ImportError, AttributeError) as e:
+        raise ImproperlyConfigured(
+            'Error loading quiz wizard storage %s: "%s"' % (name, e))